@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""Benchmark the orchestration overhead of pydra-ants with stub ANTs executables.
+
+The stubs in `stubs/` take the place of antsRegistration, antsApplyTransforms,
+N4BiasFieldCorrection, CreateJacobianDeterminantImage and DenoiseImage on the PATH.
+They write correctly named outputs, print realistic logs and sleep for
+`PYDRA_ANTS_STUB_SLEEP` seconds, zero by default, so that only the time spent in Python
+is measured:
+
+- construction of the tasks;
+- hashing of their inputs;
+- rendering of their command lines;
+- running them, less the time spent in the stub processes, cached results being
+  ignored;
+- collecting their outputs, timed by collecting them again after the run.
+
+The first three phases are timed on all tasks, the last two on the first `--num-runs`
+tasks only, since every run starts a process. The online version check of pydra is
+disabled unless `NO_ET` is already set. Times are reported per task, in
+milliseconds, for each number of tasks, and optionally written to a JSON file to
+compare commits:
+
+    python benchmarks/overhead.py --num-tasks 10 1000 10000 --output overhead.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+STUBS_DIR = Path(__file__).parent / "stubs"
+
+PHASES = ("construct", "hash", "render", "run", "collect")
+
+
+def make_phantoms(work_dir: Path, shape=(16, 16, 16)) -> dict:
+    """Write the small images given as inputs to the tasks."""
+    rng = np.random.default_rng(0)
+    paths = {}
+    for name in ("fixed", "moving", "warp"):
+        paths[name] = work_dir / f"{name}.nii.gz"
+        data = rng.random(shape + ((1, 3) if name == "warp" else ()))
+        nib.save(nib.Nifti1Image(data.astype(np.float32), np.eye(4)), paths[name])
+    paths["affine"] = work_dir / "affine.mat"
+    paths["affine"].write_bytes(b"")
+    return paths
+
+
+def task_factories(paths: dict, cache_dir: Path) -> list:
+    """Functions building each kind of task from a task index.
+
+    The index sets inputs of every task, so that tasks hash differently, except for
+    CreateJacobianDeterminantImage which only has four combinations of inputs.
+    """
+    from pydra.tasks.ants.v2_5 import (
+        ApplyTransforms,
+        CreateJacobianDeterminantImage,
+        N4BiasFieldCorrection,
+        registration_syn_quick,
+    )
+
+    return [
+        lambda index: registration_syn_quick(
+            dimensionality=3,
+            fixed_image=paths["fixed"],
+            moving_image=paths["moving"],
+            random_seed=index,
+            verbose=True,
+            name=f"registration_{index}",
+            cache_dir=cache_dir,
+        ),
+        lambda index: ApplyTransforms(
+            dimensionality=3,
+            moving_image=paths["moving"],
+            fixed_image=paths["fixed"],
+            input_transforms=[paths["warp"], paths["affine"]],
+            default_value=index,
+            name=f"apply_transforms_{index}",
+            cache_dir=cache_dir,
+        ),
+        lambda index: N4BiasFieldCorrection(
+            dimensionality=3,
+            input_image=paths["moving"],
+            save_bias_field=True,
+            shrink_factor=1 + index % 4,
+            threshold=index * 1e-9,
+            name=f"n4_{index}",
+            cache_dir=cache_dir,
+        ),
+        lambda index: CreateJacobianDeterminantImage(
+            dimensionality=3,
+            warp_field=paths["warp"],
+            calculate_log_jacobian=bool(index % 2),
+            calculate_geometric_jacobian=bool(index // 2 % 2),
+            name=f"jacobian_{index}",
+            cache_dir=cache_dir,
+        ),
+    ]
+
+
+def measure(num_tasks: int, num_runs: int, paths: dict, cache_dir: Path) -> dict:
+    """Seconds per task spent in each phase for a batch of `num_tasks` tasks."""
+    from pydra.tasks.ants.v2_5._resources import load_usage
+
+    factories = task_factories(paths, cache_dir)
+    kinds = itertools.cycle(factories)
+
+    start = time.perf_counter()
+    tasks = [next(kinds)(index) for index in range(num_tasks)]
+    construct = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for task in tasks:
+        task.checksum
+    hash_ = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for task in tasks:
+        task.cmdline
+    render = time.perf_counter() - start
+
+    run, collect, runs = 0.0, 0.0, tasks[:num_runs]
+    for task in runs:
+        start = time.perf_counter()
+        result = task(rerun=True)
+        elapsed = time.perf_counter() - start
+        if result.errored:
+            raise RuntimeError(f"{task.name} failed, see {task.output_dir}")
+        run += elapsed - load_usage(task.output_dir).wall_time
+        # Outputs are collected from within the output directory, as during the run
+        cwd = os.getcwd()
+        os.chdir(task.output_dir)
+        try:
+            start = time.perf_counter()
+            task._collect_outputs(task.output_dir)
+            collect += time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "construct": construct / num_tasks,
+        "hash": hash_ / num_tasks,
+        "render": render / num_tasks,
+        "run": run / max(len(runs), 1),
+        "collect": collect / max(len(runs), 1),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--num-tasks",
+        type=int,
+        nargs="+",
+        default=[10, 1000, 10000],
+        help="numbers of tasks of each benchmark (default: 10 1000 10000)",
+    )
+    parser.add_argument(
+        "--num-runs",
+        type=int,
+        default=20,
+        help="tasks actually run in each benchmark (default: 20)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="repetitions of each benchmark, the median being reported (default: 3)",
+    )
+    parser.add_argument("--output", type=Path, help="JSON file receiving the results")
+    args = parser.parse_args(argv)
+
+    os.environ["PATH"] = f"{STUBS_DIR.absolute()}{os.pathsep}{os.environ['PATH']}"
+    # Pydra checks for new releases online on every task construction until it succeeds
+    os.environ.setdefault("NO_ET", "1")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(tmp_dir)
+        # Keep runs out of the history of the user, while still measuring recording
+        os.environ["PYDRA_ANTS_HISTORY"] = str(work_dir / "history.sqlite")
+        paths = make_phantoms(work_dir)
+
+        results = []
+        print(f"{'tasks':>8}" + "".join(f"{phase:>12}" for phase in PHASES))
+        for num_tasks in args.num_tasks:
+            repeats = []
+            for repeat in range(args.repeat):
+                cache_dir = work_dir / f"cache_{num_tasks}_{repeat}"
+                cache_dir.mkdir()
+                repeats.append(measure(num_tasks, args.num_runs, paths, cache_dir))
+            times = {
+                phase: statistics.median(times[phase] for times in repeats)
+                for phase in PHASES
+            }
+            results.append({"num_tasks": num_tasks, "seconds_per_task": times})
+            print(
+                f"{num_tasks:>8}"
+                + "".join(f"{times[phase] * 1e3:>10.3f}ms" for phase in PHASES)
+            )
+
+    if args.output:
+        with open(args.output, "w") as fobj:
+            json.dump(
+                {
+                    "revision": git_revision(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "num_runs": args.num_runs,
+                    "repeat": args.repeat,
+                    "results": results,
+                },
+                fobj,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
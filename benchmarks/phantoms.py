@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""Benchmark ANTs runtime, memory and accuracy on synthetic phantoms.
+
+A fixed phantom, an ellipsoid with smooth inner structures, is deformed by a known
+smooth displacement field into a moving phantom, and multiplied by a known smooth
+bias field into a biased phantom. Both are generated analytically, with no
+resampling error, so that each benchmark is scored against the ground truth:
+
+- `registration`, `registration_syn` with each preset, scored by the distance in mm
+  between the estimated and true displacements inside the phantom, the estimated ones
+  found by resampling an image of voxel coordinates with the estimated transforms;
+- `apply_transforms`, `ApplyTransforms` with each interpolator applying the true
+  displacement to the moving phantom, scored by the RMS difference with the fixed
+  phantom relative to its intensity;
+- `n4`, `N4BiasFieldCorrection` of the biased phantom, scored by the RMS difference
+  between the estimated and true log bias fields inside the phantom.
+
+Registrations and resamplings run in double then float precision. The wall time and
+peak memory of every run are written with its score, the revision, the ANTs version
+and the host to a JSON file, which can be compared with a previous one:
+
+    python benchmarks/phantoms.py --output phantoms.json
+    python benchmarks/phantoms.py --baseline phantoms.json --output new.json
+
+ANTs must be installed and on the PATH.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import sys
+import tempfile
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+
+from overhead import git_revision
+
+INTERPOLATORS = ("Linear", "NearestNeighbor", "BSpline", "LanczosWindowedSinc")
+
+PRECISIONS = ("double", "float")
+
+# Points in the LPS space of ITK are points in RAS with the first two axes flipped
+_RAS_TO_LPS = np.array([-1.0, -1.0, 1.0])
+
+
+def smooth_field(points: np.ndarray, extent: np.ndarray, seed: int) -> np.ndarray:
+    """Smooth random vector field at `points` (..., 3) in mm, within [-1, 1]."""
+    rng = np.random.default_rng(seed)
+    terms = [
+        (
+            rng.uniform(0.5, 1.5, size=3) / extent,
+            rng.uniform(0, 2 * np.pi, size=3),
+            rng.normal(size=3),
+        )
+        for _ in range(4)
+    ]
+    field = np.zeros(points.shape)
+    for frequencies, phases, amplitudes in terms:
+        field += (
+            amplitudes
+            * np.sin(2 * np.pi * points @ frequencies + phases[0])[..., None]
+            * np.cos(2 * np.pi * points * frequencies[::-1] + phases)
+        )
+    # Scaled by a bound rather than the maximum over points, so that the field is the
+    # same function wherever it is evaluated
+    return field / np.abs([amplitudes for _, _, amplitudes in terms]).sum(axis=0)
+
+
+def phantom(points: np.ndarray, extent: np.ndarray) -> np.ndarray:
+    """Intensity of the phantom at `points` (..., 3) in mm, 100 inside the ellipsoid."""
+    centre = extent / 2
+    radius = np.linalg.norm((points - centre) / (0.4 * extent), axis=-1)
+    intensity = 100 / (1 + np.exp((radius - 1) * 20))
+    rng = np.random.default_rng(0)
+    for _ in range(8):
+        blob_centre = centre + rng.uniform(-0.25, 0.25, size=3) * extent
+        blob_size = rng.uniform(0.05, 0.1) * extent.mean()
+        distance = np.linalg.norm(points - blob_centre, axis=-1)
+        intensity += rng.uniform(-40, 40) * np.exp(-((distance / blob_size) ** 2))
+    return intensity
+
+
+def make_phantoms(
+    work_dir: Path,
+    shape,
+    spacing,
+    deformation: float,
+    bias: float,
+    seed: int,
+) -> dict:
+    """Write the phantoms and their ground truth, returning their paths and arrays.
+
+    The true transform maps a point x of the fixed phantom to x + u(x) in the moving
+    phantom, as the forward transforms of antsRegistration do, so the moving phantom
+    at y is the fixed phantom at the inverse of the transform, found by fixed point
+    iteration since the displacement is small and smooth.
+    """
+    spacing = np.asarray(spacing, dtype=float)
+    extent = np.asarray(shape) * spacing
+    affine = np.diag(np.append(spacing, 1))
+    points = np.stack(np.indices(shape), axis=-1) * spacing
+
+    displacement = deformation * smooth_field(points, extent, seed)
+    inverse = points
+    for _ in range(20):
+        inverse = points - deformation * smooth_field(inverse, extent, seed)
+
+    fixed = phantom(points, extent)
+    bias_field = np.exp(bias * smooth_field(points, extent, seed + 1)[..., 0])
+    arrays = {
+        "fixed": fixed,
+        "moving": phantom(inverse, extent),
+        "biased": fixed * bias_field,
+        "mask": fixed > 50,
+        "displacement": displacement,
+        "bias_field": bias_field,
+        "points": points,
+    }
+    paths = {}
+    for name in ("fixed", "moving", "biased"):
+        paths[name] = work_dir / f"{name}.nii.gz"
+        image = nib.Nifti1Image(arrays[name].astype(np.float32), affine)
+        nib.save(image, paths[name])
+    # Time series of the coordinates in mm of each voxel, resampled exactly by linear
+    # interpolation to find where the estimated transforms map the fixed voxels
+    paths["coordinates"] = work_dir / "coordinates.nii.gz"
+    nib.save(nib.Nifti1Image(points.astype(np.float32), affine), paths["coordinates"])
+    # Displacement fields of ITK are 5D NIfTI vector images in LPS space
+    paths["displacement"] = work_dir / "displacement.nii.gz"
+    image = nib.Nifti1Image(
+        (displacement * _RAS_TO_LPS)[:, :, :, None, :].astype(np.float32), affine
+    )
+    image.header.set_intent("vector")
+    nib.save(image, paths["displacement"])
+    return {"paths": paths, "arrays": arrays}
+
+
+def ants_version() -> str:
+    """Version reported by the ANTs installation found by pydra-ants."""
+    from pydra.tasks.ants.installation import discover
+
+    return discover().version or "unknown"
+
+
+def _record(benchmark: str, name: str, precision, result, **scores) -> dict:
+    output = result.output
+    return {
+        "benchmark": benchmark,
+        "name": name,
+        "precision": precision,
+        "wall_time": output.wall_time,
+        "peak_rss": output.peak_rss,
+        "parallelism": output.parallelism,
+        **{key: float(value) for key, value in scores.items()},
+    }
+
+
+def run_registrations(phantoms: dict, presets, precisions, cache_dir: Path):
+    from pydra.tasks.ants.v2_5 import ApplyTransforms, registration_syn
+
+    paths, arrays = phantoms["paths"], phantoms["arrays"]
+    mask = arrays["mask"]
+    for preset in presets:
+        for precision in precisions:
+            task = registration_syn(
+                dimensionality=3,
+                fixed_image=paths["fixed"],
+                moving_image=paths["moving"],
+                preset=preset,
+                use_float_precision=precision == "float",
+                random_seed=1,
+                cache_dir=cache_dir,
+            )
+            result = task()
+            # Map the coordinates of the fixed voxels through the estimated transforms
+            mapped = ApplyTransforms(
+                dimensionality=3,
+                image_type=3,
+                moving_image=paths["coordinates"],
+                fixed_image=paths["fixed"],
+                input_transforms=[
+                    result.output.warp_field,
+                    result.output.affine_transform,
+                ],
+                cache_dir=cache_dir,
+            )()
+            estimate = nib.load(mapped.output.output_image).get_fdata()
+            error = np.linalg.norm(
+                estimate - arrays["points"] - arrays["displacement"], axis=-1
+            )[mask]
+            yield _record(
+                "registration",
+                preset,
+                precision,
+                result,
+                error_mean_mm=error.mean(),
+                error_p95_mm=np.percentile(error, 95),
+            )
+
+
+def run_resamplings(phantoms: dict, interpolators, precisions, cache_dir: Path):
+    from pydra.tasks.ants.v2_5 import ApplyTransforms
+
+    paths, arrays = phantoms["paths"], phantoms["arrays"]
+    mask = arrays["mask"]
+    for interpolator in interpolators:
+        for precision in precisions:
+            result = ApplyTransforms(
+                dimensionality=3,
+                moving_image=paths["moving"],
+                fixed_image=paths["fixed"],
+                input_transforms=[paths["displacement"]],
+                interpolator=interpolator,
+                use_float_precision=precision == "float",
+                cache_dir=cache_dir,
+            )()
+            resampled = nib.load(result.output.output_image).get_fdata()
+            difference = (resampled - arrays["fixed"])[mask]
+            yield _record(
+                "apply_transforms",
+                interpolator,
+                precision,
+                result,
+                relative_rmse=np.sqrt((difference**2).mean()) / 100,
+            )
+
+
+def run_bias_correction(phantoms: dict, cache_dir: Path):
+    from pydra.tasks.ants.v2_5 import N4BiasFieldCorrection
+
+    paths, arrays = phantoms["paths"], phantoms["arrays"]
+    mask = arrays["mask"]
+    result = N4BiasFieldCorrection(
+        dimensionality=3,
+        input_image=paths["biased"],
+        save_bias_field=True,
+        cache_dir=cache_dir,
+    )()
+    estimate = np.log(
+        np.maximum(nib.load(result.output.output_bias_field).get_fdata()[mask], 1e-6)
+    )
+    truth = np.log(arrays["bias_field"][mask])
+    # The bias is recovered up to a global scale
+    difference = (estimate - estimate.mean()) - (truth - truth.mean())
+    yield _record(
+        "n4",
+        "N4BiasFieldCorrection",
+        None,
+        result,
+        log_bias_rmse=np.sqrt((difference**2).mean()),
+    )
+
+
+def compare(records, baseline_path: Path):
+    """Print the change of each measure relative to the matching baseline record."""
+    with open(baseline_path) as fobj:
+        baseline = {
+            (record["benchmark"], record["name"], record["precision"]): record
+            for record in json.load(fobj)["results"]
+        }
+    print(f"{'benchmark':<18}{'name':<24}{'precision':<11}{'measure':<16}change")
+    for record in records:
+        key = (record["benchmark"], record["name"], record["precision"])
+        if key not in baseline:
+            continue
+        for measure, value in record.items():
+            previous = baseline[key].get(measure)
+            if not isinstance(value, float) or not previous:
+                continue
+            print(
+                f"{key[0]:<18}{key[1]:<24}{str(key[2]):<11}{measure:<16}"
+                f"{(value / previous - 1) * 100:+.1f}%"
+            )
+
+
+def main(argv=None):
+    from pydra.tasks.ants.v2_5 import list_presets
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--shape",
+        type=int,
+        nargs=3,
+        default=[96, 96, 96],
+        help="number of voxels of the phantoms along each axis (default: 96 96 96)",
+    )
+    parser.add_argument(
+        "--spacing",
+        type=float,
+        nargs=3,
+        default=[2.0, 2.0, 2.0],
+        help="voxel size in mm (default: 2 2 2)",
+    )
+    parser.add_argument(
+        "--deformation",
+        type=float,
+        default=4.0,
+        help="bound of the displacement along each axis in mm (default: 4)",
+    )
+    parser.add_argument(
+        "--bias",
+        type=float,
+        default=0.3,
+        help="bound of the log bias of the biased phantom (default: 0.3)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="seed of the fields")
+    parser.add_argument(
+        "--presets",
+        nargs="*",
+        default=sorted({preset.name for preset in list_presets()}),
+        help="registration presets (default: all registered presets)",
+    )
+    parser.add_argument(
+        "--interpolators",
+        nargs="*",
+        default=list(INTERPOLATORS),
+        help=f"ApplyTransforms interpolators (default: {' '.join(INTERPOLATORS)})",
+    )
+    parser.add_argument(
+        "--precisions",
+        nargs="+",
+        choices=PRECISIONS,
+        default=list(PRECISIONS),
+        help="precisions of registrations and resamplings (default: double float)",
+    )
+    parser.add_argument("--no-n4", action="store_true", help="skip bias correction")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        help="threads of ANTs commands (default: ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS)",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("phantoms.json"),
+        help="JSON file receiving the results (default: phantoms.json)",
+    )
+    parser.add_argument("--baseline", type=Path, help="previous results to compare")
+    parser.add_argument(
+        "--keep", type=Path, help="directory keeping the phantoms and task outputs"
+    )
+    args = parser.parse_args(argv)
+
+    if shutil.which("antsRegistration") is None:
+        parser.error("antsRegistration is not on the PATH")
+    if args.threads:
+        os.environ["ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"] = str(args.threads)
+    os.environ.setdefault("NO_ET", "1")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.keep or Path(tmp_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        cache_dir = work_dir / "cache"
+        phantoms = make_phantoms(
+            work_dir,
+            tuple(args.shape),
+            args.spacing,
+            args.deformation,
+            args.bias,
+            args.seed,
+        )
+        runs = [
+            run_registrations(phantoms, args.presets, args.precisions, cache_dir),
+            run_resamplings(phantoms, args.interpolators, args.precisions, cache_dir),
+        ]
+        if not args.no_n4:
+            runs.append(run_bias_correction(phantoms, cache_dir))
+        records = []
+        for run in runs:
+            for record in run:
+                print(json.dumps(record))
+                records.append(record)
+
+    with open(args.output, "w") as fobj:
+        json.dump(
+            {
+                "revision": git_revision(),
+                "ants_version": ants_version(),
+                "host": socket.gethostname(),
+                "platform": platform.platform(),
+                "threads": os.environ.get("ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"),
+                "phantom": {
+                    "shape": args.shape,
+                    "spacing": args.spacing,
+                    "deformation": args.deformation,
+                    "bias": args.bias,
+                    "seed": args.seed,
+                },
+                "results": records,
+            },
+            fobj,
+            indent=2,
+        )
+    if args.baseline:
+        compare(records, args.baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""Helpers shared by the stub ANTs executables."""
+
+import os
+import shutil
+import sys
+import time
+
+SLEEP = float(os.environ.get("PYDRA_ANTS_STUB_SLEEP", "0"))
+"""Seconds each stub spends pretending to compute, spread over its log lines."""
+
+VERSION = "2.5.0.stub"
+"""Version reported by every stub, matching the latest task sub-package."""
+
+if sys.argv[1:] == ["--version"]:
+    print(f"ANTs Version: {VERSION}")
+    print("Compiled: stub")
+    sys.exit(0)
+
+
+def option(args, flag, default=None):
+    """Value following a flag on the command line."""
+    return args[args.index(flag) + 1] if flag in args else default
+
+
+def bracketed(value):
+    """Comma-separated values of an `[a,b,c]` argument."""
+    return value.strip("[]").split(",")
+
+
+def copy(source, destination):
+    """Write an output as a copy of an input, so that it is a valid image."""
+    shutil.copyfile(source, destination)
+
+
+def emit(lines):
+    """Print a log line by line, sleeping for `SLEEP` seconds in total."""
+    lines = list(lines)
+    for line in lines:
+        print(line)
+        sys.stdout.flush()
+        if SLEEP:
+            time.sleep(SLEEP / len(lines))
+    if not lines and SLEEP:
+        time.sleep(SLEEP)
@@ -12,27 +12,36 @@ from pathlib import Path
 pkg_path = Path(__file__).parent.parent
 
 try:
-    from ._version import __version__
+    from ._version import __version__ as _package_version
 except ImportError:
     raise RuntimeError(
         "pydra-ants has not been properly installed, please run "
         f"`pip install -e {str(pkg_path)}` to install a development version"
     )
-if "nipype" not in __version__:
-    try:
-        from .auto._version import nipype_version, nipype2pydra_version
-    except ImportError:
-        warn(
-            "Nipype interfaces haven't been automatically converted from their specs in "
-            f"`nipype-auto-conv`. Please run `{str(pkg_path / 'nipype-auto-conv' / 'generate')}` "
-            "to generated the converted Nipype interfaces in pydra.tasks.ants.auto"
-        )
-    else:
-        n_ver = nipype_version.replace(".", "_")
-        n2p_ver = nipype2pydra_version.replace(".", "_")
-        __version__ += (
-            "_" if "+" in __version__ else "+"
-        ) + f"nipype{n_ver}_nipype2pydra{n2p_ver}"
+
+
+def __getattr__(name):
+    # Probing the converted Nipype interfaces is deferred until the version is needed
+    if name != "__version__":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    version = _package_version
+    if "nipype" not in version:
+        try:
+            from .auto._version import nipype_version, nipype2pydra_version
+        except ImportError:
+            warn(
+                "Nipype interfaces haven't been automatically converted from their specs in "
+                f"`nipype-auto-conv`. Please run `{str(pkg_path / 'nipype-auto-conv' / 'generate')}` "
+                "to generated the converted Nipype interfaces in pydra.tasks.ants.auto"
+            )
+        else:
+            n_ver = nipype_version.replace(".", "_")
+            n2p_ver = nipype2pydra_version.replace(".", "_")
+            version += ("_" if "+" in version else "+") + (
+                f"nipype{n_ver}_nipype2pydra{n2p_ver}"
+            )
+    globals()["__version__"] = version
+    return version
 
 
 __all__ = ["__version__"]
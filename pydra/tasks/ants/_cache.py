@@ -0,0 +1,15 @@
+"""Location of the caches shared by all task sub-packages."""
+
+import os
+from pathlib import Path
+
+
+def default_cache_dir() -> Path:
+    """Directory where downsampled images and the installation are cached by default.
+
+    It is `$PYDRA_ANTS_CACHE_DIR` if set, or `pydra-ants` under `$XDG_CACHE_HOME`
+    (`~/.cache` when unset).
+    """
+    if "PYDRA_ANTS_CACHE_DIR" in os.environ:
+        return Path(os.environ["PYDRA_ANTS_CACHE_DIR"])
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "pydra-ants"
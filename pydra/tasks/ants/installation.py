@@ -0,0 +1,232 @@
+"""Discovery of the ANTs installation used to run the tasks.
+
+Resolving the executables and probing their version takes a `which` lookup per
+executable and an `antsRegistration --version` process, which adds up over thousands of
+worker start-ups. The result is therefore cached in memory and in a JSON file per host
+under `default_cache_dir`, until `ANTSPATH`, `PATH` or the executables change.
+
+>>> import os, stat, tempfile
+>>> from pathlib import Path
+>>> tmp_dir = Path(tempfile.mkdtemp())
+>>> ants_bin = tmp_dir / "bin"
+>>> ants_bin.mkdir()
+>>> script = ants_bin / "antsRegistration"
+>>> _ = script.write_text(
+...     "#!/bin/sh\\necho 'ANTs Version: 2.5.1.post2-g6d2c7a1'\\n"
+...     "echo 'Compiled: Jan  9 2024 10:00:00'\\n"
+... )
+>>> script.chmod(script.stat().st_mode | stat.S_IEXEC)
+>>> environ = dict(os.environ)
+>>> os.environ.update(ANTSPATH=str(ants_bin), PYDRA_ANTS_CACHE_DIR=str(tmp_dir))
+>>> ants = discover()
+>>> ants.version, ants.version_info, ants.build
+('2.5.1.post2-g6d2c7a1', (2, 5, 1), {'Compiled': 'Jan  9 2024 10:00:00'})
+>>> ants.executables["antsRegistration"] == str(script)
+True
+>>> ants.package, ants.tasks.__name__
+('v2_5', 'pydra.tasks.ants.v2_5')
+>>> sorted(path.name for path in tmp_dir.glob("installation-*.json"))  # doctest: +ELLIPSIS
+['installation-....json']
+>>> discover() is ants
+True
+>>> os.environ.clear()
+>>> os.environ.update(environ)
+"""
+
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+from functools import lru_cache
+from importlib import import_module
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from attrs import asdict, define, field
+
+from ._cache import default_cache_dir
+
+__all__ = ["EXECUTABLES", "Installation", "discover", "task_packages"]
+
+EXECUTABLES = (
+    "antsRegistration",
+    "antsApplyTransforms",
+    "CreateJacobianDeterminantImage",
+    "DenoiseImage",
+    "ImageMath",
+    "N4BiasFieldCorrection",
+)
+"""ANTs executables wrapped by the tasks."""
+
+
+def task_packages() -> List[str]:
+    """Names of the `pydra.tasks.ants.vX_Y` sub-packages, oldest first."""
+    names = [
+        path.name
+        for path in Path(__file__).parent.glob("v*_*")
+        if re.fullmatch(r"v\d+_\d+", path.name) and (path / "__init__.py").exists()
+    ]
+    return sorted(names, key=lambda name: tuple(map(int, name[1:].split("_"))))
+
+
+@define(frozen=True)
+class Installation:
+    """ANTs executables found on a host, with the version they report."""
+
+    executables: Dict[str, str] = field(factory=dict)
+    """Absolute paths of the executables found, by name."""
+
+    version: Optional[str] = None
+    """Version reported by `antsRegistration --version`, if it could be run."""
+
+    build: Dict[str, str] = field(factory=dict)
+    """Other fields of the version report, such as the compilation date."""
+
+    @property
+    def version_info(self) -> Optional[Tuple[int, ...]]:
+        """Numeric components of the version, e.g. `(2, 5, 1)`."""
+        match = self.version and re.match(r"v?(\d+(?:\.\d+)*)", self.version)
+        return tuple(map(int, match.group(1).split("."))) if match else None
+
+    @property
+    def package(self) -> str:
+        """Name of the sub-package whose tasks match the installed version.
+
+        This is the latest sub-package not newer than the installation, the oldest one
+        if the installation predates them all, and the latest one if the version is
+        unknown.
+        """
+        packages = task_packages()
+        if self.version_info is None:
+            return packages[-1]
+        older = [
+            name
+            for name in packages
+            if tuple(map(int, name[1:].split("_"))) <= self.version_info[:2]
+        ]
+        return older[-1] if older else packages[0]
+
+    @property
+    def tasks(self) -> ModuleType:
+        """The `pydra.tasks.ants.vX_Y` sub-package named by `package`."""
+        return import_module(f"pydra.tasks.ants.{self.package}")
+
+    def resolve(self, executable: str) -> str:
+        """Absolute path of an executable if found, else the name unchanged."""
+        return self.executables.get(executable, executable)
+
+
+def _search_path() -> str:
+    """Directories searched for executables, `ANTSPATH` first."""
+    return os.pathsep.join(
+        directory
+        for directory in (os.environ.get("ANTSPATH"), os.environ.get("PATH"))
+        if directory
+    )
+
+
+def _stamps(executables: Mapping[str, str]) -> Dict[str, int]:
+    """Modification times of executables, which change when ANTs is reinstalled."""
+    stamps = {}
+    for name, path in executables.items():
+        try:
+            stamps[name] = os.stat(path).st_mtime_ns
+        except OSError:
+            stamps[name] = -1
+    return stamps
+
+
+def _probe(search_path: str) -> Installation:
+    executables = {}
+    for name in EXECUTABLES:
+        path = shutil.which(name, path=search_path)
+        if path is not None:
+            executables[name] = os.path.abspath(path)
+    version, build = None, {}
+    if "antsRegistration" in executables:
+        try:
+            report = subprocess.run(
+                [executables["antsRegistration"], "--version"],
+                capture_output=True,
+                text=True,
+                timeout=60,
+            ).stdout
+        except (OSError, subprocess.SubprocessError):
+            report = ""
+        for line in report.splitlines():
+            key, sep, value = line.partition(":")
+            if not sep:
+                continue
+            if key.strip() == "ANTs Version":
+                version = value.strip()
+            else:
+                build[key.strip()] = value.strip()
+    return Installation(executables=executables, version=version, build=build)
+
+
+def _cache_file() -> Path:
+    return default_cache_dir() / f"installation-{socket.gethostname()}.json"
+
+
+@lru_cache(maxsize=8)
+def _discover(search_path: str) -> Installation:
+    path = _cache_file()
+    try:
+        with open(path) as fobj:
+            cached = json.load(fobj)
+        installation = Installation(**cached["installation"])
+        if cached["search_path"] == search_path and cached["stamps"] == _stamps(
+            installation.executables
+        ):
+            return installation
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    installation = _probe(search_path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Replaced atomically, since workers starting together may all probe at once
+        fd, tmp_file = tempfile.mkstemp(suffix=".tmp", dir=path.parent)
+        with os.fdopen(fd, "w") as fobj:
+            json.dump(
+                {
+                    "search_path": search_path,
+                    "stamps": _stamps(installation.executables),
+                    "installation": asdict(installation),
+                },
+                fobj,
+            )
+        os.replace(tmp_file, path)
+    except OSError:
+        pass
+    return installation
+
+
+def discover(refresh: bool = False) -> Installation:
+    """The ANTs installation of this host.
+
+    Executables are looked up in `ANTSPATH`, then in `PATH`. The result is cached per
+    process and in `installation-<hostname>.json` under `default_cache_dir`, and is
+    discovered again when either variable changes, when an executable found is
+    modified or removed, or with `refresh`.
+
+    Parameters
+    ----------
+    refresh : bool, default=False
+        Ignore the cached installation.
+
+    Returns
+    -------
+    Installation
+        The executables found and their version.
+    """
+    if refresh:
+        _discover.cache_clear()
+        try:
+            _cache_file().unlink()
+        except OSError:
+            pass
+    return _discover(_search_path())
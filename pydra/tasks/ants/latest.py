@@ -1,3 +1,30 @@
-PACKAGE_VERSION = "v2_5"
+"""Tasks of the sub-package matching the ANTs installation of this host.
 
-from .v2_5 import *  # noqa
+The sub-package, named by `PACKAGE_VERSION`, is selected by `installation.discover`
+on first access, once per interpreter, so that importing this module stays cheap.
+"""
+
+from . import installation
+
+
+def _tasks():
+    if "_latest" not in globals():
+        tasks = installation.discover().tasks
+        globals().update(
+            _latest=tasks,
+            PACKAGE_VERSION=tasks.__name__.rpartition(".")[2],
+            __all__=tasks.__all__,
+        )
+    return globals()["_latest"]
+
+
+def __getattr__(name):
+    if name in ("PACKAGE_VERSION", "__all__"):
+        _tasks()
+        return globals()[name]
+    return getattr(_tasks(), name)
+
+
+def __dir__():
+    _tasks()
+    return sorted(set(globals()) | set(globals()["__all__"]))
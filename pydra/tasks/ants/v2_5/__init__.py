@@ -3,9 +3,73 @@ ANTs
 ====
 
 >>> from pydra.tasks import ants
+
+Tasks are imported from their module on first access, so that importing the package
+is fast for short-lived processes and loads no task module.
 """
 
-from .apply_transforms import ApplyTransforms
-from .bias_correction import N4BiasFieldCorrection
-from .create_jacobian_determinant_image import CreateJacobianDeterminantImage
-from .registration import Registration, registration_syn, registration_syn_quick
+from importlib import import_module
+
+_EXPORTS = {
+    "affine_initialization": ["affine_initializer", "rotation_grid"],
+    "alignment": ["AlignmentCheck", "check_alignment", "identity_registration"],
+    "apply_transforms": ["ApplyTransforms", "apply_transforms_chunked"],
+    "averaging": ["average_images", "combine_averages"],
+    "bias_correction": ["N4BiasFieldCorrection", "n4_bias_field_correction"],
+    "cost_model": ["CostModel"],
+    "create_jacobian_determinant_image": ["CreateJacobianDeterminantImage"],
+    "denoise_image": ["DenoiseImage", "denoise_image_tiled"],
+    "history": ["ImageGeometry", "Run", "RunHistory", "default_history_path"],
+    "image_math": ["ImageMath"],
+    "label_statistics": [
+        "label_geometry",
+        "label_geometry_batch",
+        "label_geometry_table",
+    ],
+    "predictor": ["Prediction", "RuntimePredictor"],
+    "presets": [
+        "Preset",
+        "get_preset",
+        "list_presets",
+        "load_presets",
+        "register_preset",
+        "save_presets",
+        "select_preset",
+    ],
+    "prometheus": ["PrometheusExporter"],
+    "pyramid": ["default_cache_dir", "image_digest", "image_pyramid", "pyramid_level"],
+    "registration": [
+        "Registration",
+        "RegistrationLog",
+        "count_samples",
+        "parse_registration_log",
+        "registration_syn",
+        "registration_syn_quick",
+        "sampling_rate",
+    ],
+    "similarity": [
+        "measure_similarity",
+        "measure_similarity_batch",
+        "measure_similarity_table",
+    ],
+    "tracing": ["ChromeTrace"],
+    "tuning": ["autotune", "candidate_presets", "recommend_preset"],
+}
+
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = ["expression"] + sorted(_MODULES)
+
+
+def __getattr__(name):
+    if name == "expression":
+        return import_module(f"{__name__}.expression")
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f"{__name__}.{_MODULES[name]}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
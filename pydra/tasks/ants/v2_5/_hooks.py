@@ -0,0 +1,36 @@
+"""Helpers composing pydra task hooks."""
+
+import pydra
+from pydra.engine.specs import donothing
+
+HOOKS = ("pre_run", "pre_run_task", "post_run_task", "post_run")
+
+
+class _Chain:
+    """Picklable hook calling several hooks in turn."""
+
+    def __init__(self, *hooks):
+        self.hooks = hooks
+
+    def __call__(self, *args):
+        for hook in self.hooks:
+            hook(*args)
+
+
+def add_hooks(task, recorder):
+    """Append the hook methods of `recorder` to the hooks of a task and its nodes.
+
+    Hooks already set, e.g. by another recorder, keep being called first. Hooks missing
+    from `recorder` are left unchanged.
+    """
+    for name in HOOKS:
+        current, hook = getattr(task.hooks, name), getattr(recorder, name, None)
+        if hook is None:
+            continue
+        setattr(
+            task.hooks, name, hook if current is donothing else _Chain(current, hook)
+        )
+    if isinstance(task, pydra.Workflow):
+        for node in task.graph.nodes:
+            add_hooks(node, recorder)
+    return task
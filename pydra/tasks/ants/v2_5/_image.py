@@ -0,0 +1,292 @@
+"""Helpers for in-process handling of NIfTI images."""
+
+from os import PathLike
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Tuple
+
+import nibabel as nib
+import numpy as np
+from nibabel.openers import ImageOpener
+
+_NIFTI_EXTENSIONS = (".nii.gz", ".nii")
+
+
+def split_extension(path: PathLike) -> Tuple[str, str]:
+    """Split a NIfTI file name into its stem and extension.
+
+    >>> split_extension("/data/sub-01_T1w.nii.gz")
+    ('sub-01_T1w', '.nii.gz')
+    >>> split_extension("template.nii")
+    ('template', '.nii')
+    """
+    name = Path(path).name
+    for ext in _NIFTI_EXTENSIONS:
+        if name.endswith(ext):
+            return name[: -len(ext)], ext
+    return Path(name).stem, Path(name).suffix
+
+
+def output_path(in_file: PathLike, suffix: str, ext: Optional[str] = None) -> Path:
+    """Return a path in the current directory derived from an input file name.
+
+    >>> output_path("/data/input.nii.gz", "_cropped").name
+    'input_cropped.nii.gz'
+    """
+    stem, in_ext = split_extension(in_file)
+    return Path.cwd() / f"{stem}{suffix}{ext or in_ext}"
+
+
+def bounding_box(
+    mask: np.ndarray, padding: int = 0
+) -> Optional[Tuple[Tuple[int, int], ...]]:
+    """Return the padded bounding box of the non-zero voxels of an array.
+
+    The box is given as half-open ``(start, stop)`` voxel ranges, one per axis, and is
+    clipped to the array extent. ``None`` is returned for an empty mask.
+
+    >>> mask = np.zeros((10, 10, 10))
+    >>> mask[3:5, 4:7, 2] = 1
+    >>> bounding_box(mask, padding=2)
+    ((1, 7), (2, 9), (0, 5))
+    """
+    box = []
+    for axis in range(mask.ndim):
+        others = tuple(a for a in range(mask.ndim) if a != axis)
+        (indices,) = np.nonzero(np.any(mask, axis=others))
+        if indices.size == 0:
+            return None
+        box.append(
+            (
+                max(int(indices[0]) - padding, 0),
+                min(int(indices[-1]) + 1 + padding, mask.shape[axis]),
+            )
+        )
+    return tuple(box)
+
+
+def box_slices(box: Sequence[Sequence[int]]) -> Tuple[slice, ...]:
+    """Convert a bounding box into a tuple of slices."""
+    return tuple(slice(start, stop) for start, stop in box)
+
+
+def crop_image(
+    in_file: PathLike, box: Sequence[Sequence[int]], out_file: PathLike
+) -> Path:
+    """Crop an image to a bounding box, updating the affine accordingly."""
+    image = nib.load(in_file)
+    slices = box_slices(box) + (slice(None),) * (len(image.shape) - len(box))
+    nib.save(image.slicer[slices], out_file)
+    return Path(out_file)
+
+
+def paste_image(
+    in_file: PathLike,
+    reference_image: PathLike,
+    box: Sequence[Sequence[int]],
+    out_file: PathLike,
+    fill: Optional[np.ndarray] = None,
+    fill_value: float = 0.0,
+    mask: Optional[np.ndarray] = None,
+) -> Path:
+    """Write a cropped image back into the grid of its reference image.
+
+    Voxels outside the bounding box, or outside `mask` if provided, take their value
+    from `fill` if provided, otherwise `fill_value`.
+    """
+    reference = nib.load(reference_image)
+    data = nib.load(in_file).get_fdata(dtype=np.float32)
+    slices = box_slices(box)
+    shape = reference.shape[: len(box)] + data.shape[len(box) :]
+    if fill is None:
+        out = np.full(shape, fill_value, dtype=np.float32)
+    else:
+        out = np.array(fill, dtype=np.float32).reshape(shape)
+    if mask is None:
+        out[slices] = data
+    else:
+        inside = np.asarray(mask[slices], dtype=bool)
+        inside = inside.reshape(inside.shape + (1,) * (data.ndim - inside.ndim))
+        out[slices] = np.where(inside, data, out[slices])
+    header = reference.header.copy()
+    header.set_data_dtype(np.float32)
+    nib.save(nib.Nifti1Image(out, reference.affine, header), out_file)
+    return Path(out_file)
+
+
+def tile_grid(shape: Sequence[int], tile_shape: Sequence[int], halo: int) -> list:
+    """Partition a grid into tiles extended by a halo on each side.
+
+    Each tile is described by one ``[core_start, core_stop, start, stop]`` range per
+    tiled axis, where the core ranges partition the grid and the extended ranges are
+    clipped to its extent.
+
+    >>> tile_grid((10, 4), (6, 4), halo=2)
+    [[[0, 6, 0, 8], [0, 4, 0, 4]], [[6, 10, 4, 10], [0, 4, 0, 4]]]
+    """
+    ranges = [
+        [
+            [
+                start,
+                min(start + step, size),
+                max(start - halo, 0),
+                min(start + step + halo, size),
+            ]
+            for start in range(0, size, step)
+        ]
+        for size, step in zip(shape, tile_shape)
+    ]
+    tiles = [[]]
+    for axis_ranges in ranges:
+        tiles = [tile + [r] for tile in tiles for r in axis_ranges]
+    return tiles
+
+
+def blend_weights(
+    tile: Sequence[Sequence[int]], shape: Sequence[int], blend_width: int
+) -> np.ndarray:
+    """Return seam blending weights for an extended tile.
+
+    Weights are one within the tile core and cross-fade linearly over `blend_width`
+    voxels centred on every core boundary shared with a neighbouring tile, so that the
+    weights of overlapping tiles sum to one.
+
+    >>> blend_weights([[0, 4, 0, 6]], (8,), blend_width=4)
+    array([1.   , 1.   , 0.875, 0.625, 0.375, 0.125], dtype=float32)
+    """
+    weights = np.ones(
+        tuple(stop - start for _, _, start, stop in tile), dtype=np.float32
+    )
+    for axis, (core_start, core_stop, start, stop) in enumerate(tile):
+        position = np.arange(start, stop) + 0.5
+        ramp = np.ones(stop - start, dtype=np.float32)
+        if core_start > 0:
+            ramp = np.minimum(ramp, 0.5 + (position - core_start) / max(blend_width, 1))
+        if core_stop < shape[axis]:
+            ramp = np.minimum(ramp, 0.5 + (core_stop - position) / max(blend_width, 1))
+        ramp = np.clip(ramp, 0, 1)
+        weights *= ramp.reshape((-1,) + (1,) * (len(tile) - axis - 1))
+    return weights
+
+
+def slab_ranges(shape: Sequence[int], max_voxels: int) -> list:
+    """Split the last axis of a grid into slabs holding at most `max_voxels` voxels.
+
+    >>> slab_ranges((10, 10, 7), max_voxels=300)
+    [(0, 3), (3, 6), (6, 7)]
+    """
+    size = max(max_voxels // max(int(np.prod(shape[:-1])), 1), 1)
+    return [
+        (start, min(start + size, shape[-1])) for start in range(0, shape[-1], size)
+    ]
+
+
+def write_slabs(
+    out_file: PathLike,
+    shape: Sequence[int],
+    affine: np.ndarray,
+    dtype: np.dtype,
+    slabs: Iterable[np.ndarray],
+    header: Optional[nib.Nifti1Header] = None,
+) -> Path:
+    """Stream consecutive slabs along the last axis into a single-file NIfTI image.
+
+    Only one slab is held in memory at a time. NIfTI stores voxels in Fortran order, so
+    slabs along the last axis are contiguous on disk and can be written one after the
+    other, compressed or not.
+    """
+    header = nib.Nifti1Header() if header is None else header.copy()
+    header.set_data_shape(shape)
+    header.set_data_dtype(dtype)
+    # Coordinate systems of a given header are kept, the affine defaults to scanner
+    header.set_qform(affine, code=int(header["qform_code"]) or "scanner")
+    header.set_sform(affine, code=int(header["sform_code"]) or "scanner")
+    header.set_slope_inter(1.0, 0.0)
+    header.set_data_offset(352 + header.extensions.get_sizeondisk())
+    with ImageOpener(out_file, "wb") as fobj:
+        # The header block includes the extension flag and extensions, if any
+        header.write_to(fobj)
+        for slab in slabs:
+            fobj.write(np.asarray(slab, dtype=dtype).tobytes(order="F"))
+    return Path(out_file)
+
+
+def downsample(data: np.ndarray, factor: int) -> np.ndarray:
+    """Downsample an array by averaging non-overlapping blocks of `factor` voxels.
+
+    Trailing voxels that do not fill a complete block are discarded.
+
+    >>> downsample(np.arange(16.0).reshape(4, 4), 2)
+    array([[ 2.5,  4.5],
+           [10.5, 12.5]])
+    """
+    if factor <= 1:
+        return data
+    shape = tuple(max(n // factor, 1) for n in data.shape)
+    sizes = tuple(min(factor, n) for n in data.shape)
+    trimmed = data[tuple(slice(0, s * b) for s, b in zip(shape, sizes))]
+    return trimmed.reshape([d for pair in zip(shape, sizes) for d in pair]).mean(
+        axis=tuple(range(1, 2 * data.ndim, 2))
+    )
+
+
+def downsample_image(
+    image: nib.Nifti1Image, factor: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Downsample the data of a 3D image by block averaging.
+
+    Returns the downsampled data and the affine of the coarse grid, whose voxel centres
+    lie at the centres of the averaged blocks.
+    """
+    data = downsample(image.get_fdata(dtype=np.float32), factor)
+    if factor <= 1:
+        return data, image.affine
+    scale = np.diag([factor] * 3 + [1.0])
+    scale[:3, 3] = (factor - 1) / 2
+    return data, image.affine @ scale
+
+
+def resample(
+    data: np.ndarray,
+    affine: np.ndarray,
+    shape: Sequence[int],
+    target_affine: np.ndarray,
+    transform: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Resample a 3D array onto another grid with trilinear interpolation.
+
+    `transform` optionally maps world coordinates of the target grid to world
+    coordinates of the source grid. Points falling outside the source grid are zero.
+
+    >>> data = np.arange(27.0).reshape(3, 3, 3)
+    >>> resample(data, np.eye(4), (2, 1, 1), np.diag([0.5, 1, 1, 1])).ravel()
+    array([0. , 4.5])
+    """
+    mapping = np.linalg.inv(affine) @ (
+        target_affine if transform is None else transform @ target_affine
+    )
+    grid = np.indices(shape, dtype=np.float64).reshape(3, -1)
+    coords = mapping[:3, :3] @ grid + mapping[:3, 3:]
+    lower = np.floor(coords).astype(np.int64)
+    fraction = coords - lower
+    out = np.zeros(grid.shape[1], dtype=np.float64)
+    for corner in np.ndindex(2, 2, 2):
+        index = lower + np.array(corner).reshape(3, 1)
+        weight = np.prod(
+            np.where(np.array(corner).reshape(3, 1), fraction, 1 - fraction), axis=0
+        )
+        inside = np.all(
+            (index >= 0) & (index < np.array(data.shape).reshape(3, 1)), axis=0
+        )
+        out[inside] += weight[inside] * data[tuple(index[:, inside])]
+    return out.reshape(shape)
+
+
+def center_of_mass(data: np.ndarray, affine: np.ndarray) -> np.ndarray:
+    """Return the intensity-weighted centre of an image in world coordinates."""
+    weights = np.clip(data, 0, None)
+    total = weights.sum()
+    if total == 0:
+        weights, total = np.ones_like(data), data.size
+    grid = np.indices(data.shape, dtype=np.float64).reshape(data.ndim, -1)
+    voxel = grid @ weights.ravel() / total
+    return nib.affines.apply_affine(affine, voxel)
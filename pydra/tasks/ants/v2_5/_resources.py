@@ -0,0 +1,331 @@
+"""Helpers measuring the resources used by external processes."""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from os import PathLike
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import attrs
+from attrs import NOTHING, asdict, define, field
+from fileformats.core import FileSet
+from pydra.engine.core import is_lazy
+from pydra.engine.environments import Native
+from pydra.engine.helpers import create_checksum
+from pydra.engine.specs import ShellOutSpec, SpecInfo
+from pydra.engine.task import ShellCommandTask
+from pydra.utils.hash import hash_function
+
+from .. import installation
+from . import history
+
+USAGE_FILE = "_resource_usage.json"
+"""Name of the file recording resource usage in the output directory of a task."""
+
+PROCESS_FILE = "_process.json"
+"""Name of the file holding the id and start time of a running process."""
+
+STDOUT_FILE = "_stdout.log"
+"""Name of the file receiving the output of a running process."""
+
+_KEY_OUTPUT_DIR = "_cache_key"
+"""Output directory in which outputs are templated when rendering the cache key."""
+
+
+@define(frozen=True)
+class ResourceUsage:
+    """Resources used by a process and its waited-for children."""
+
+    wall_time: float
+    """Elapsed time in seconds."""
+
+    user_time: float
+    """CPU time in user mode in seconds."""
+
+    system_time: float
+    """CPU time in kernel mode in seconds."""
+
+    peak_rss: float
+    """Peak resident set size in MiB."""
+
+    read_bytes: int = 0
+    """Bytes read by system calls, including those served from the page cache."""
+
+    write_bytes: int = 0
+    """Bytes written by system calls."""
+
+    start_time: Optional[float] = None
+    """Time at which the process started, in seconds since the epoch."""
+
+    @property
+    def parallelism(self) -> float:
+        """Average number of busy cores, i.e. the CPU time over the wall time."""
+        return (self.user_time + self.system_time) / max(self.wall_time, 1e-9)
+
+
+def _read_proc_io(pid: int) -> Optional[Tuple[int, int]]:
+    """Bytes read and written by a process according to `/proc/<pid>/io`."""
+    try:
+        with open(f"/proc/{pid}/io") as fobj:
+            counters = dict(line.split(": ") for line in fobj.read().splitlines())
+    except OSError:
+        return None
+    return int(counters["rchar"]), int(counters["wchar"])
+
+
+def run_measured(
+    args: Sequence[str],
+    cwd: Optional[PathLike] = None,
+    env: Optional[dict] = None,
+    log_dir: Optional[PathLike] = None,
+) -> Tuple[int, str, str, ResourceUsage]:
+    """Run a command and return its exit code, output, error and resource usage.
+
+    Bytes read and written are taken from `/proc/<pid>/io` once the process has exited
+    but before it is reaped, or estimated from block counts where `/proc` is missing.
+    With `log_dir`, the process id and start time are written to `PROCESS_FILE` and the
+    output to `STDOUT_FILE` in that directory while the process runs, so that it can be
+    monitored, and both files are removed once it exits.
+
+    >>> code, stdout, _, usage = run_measured(["echo", "hello"])
+    >>> code, stdout, usage.peak_rss > 0, usage.write_bytes
+    (0, 'hello\\n', True, 6)
+    """
+    with ExitStack() as stack:
+        if log_dir is None:
+            out = stack.enter_context(tempfile.TemporaryFile("w+"))
+        else:
+            process_file = Path(log_dir) / PROCESS_FILE
+            stdout_file = Path(log_dir) / STDOUT_FILE
+            out = stack.enter_context(open(stdout_file, "w+"))
+            stack.callback(stdout_file.unlink)
+        err = stack.enter_context(tempfile.TemporaryFile("w+"))
+        start_time, start = time.time(), time.monotonic()
+        process = subprocess.Popen(args, cwd=cwd, env=env, stdout=out, stderr=err)
+        if log_dir is not None:
+            with open(process_file, "w") as fobj:
+                json.dump({"pid": process.pid, "start_time": start_time}, fobj)
+            stack.callback(process_file.unlink)
+        io_counters = None
+        if hasattr(os, "waitid"):
+            # Wait for the exit without reaping, while its /proc entry is still there
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+            io_counters = _read_proc_io(process.pid)
+        # Reap the process ourselves instead of Popen.wait to get its resource usage
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall_time = time.monotonic() - start
+        process.returncode = (
+            os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        )
+        out.seek(0)
+        err.seek(0)
+        stdout, stderr = out.read(), err.read()
+    if io_counters is None:
+        io_counters = rusage.ru_inblock * 512, rusage.ru_oublock * 512
+    return (
+        process.returncode,
+        stdout,
+        stderr,
+        ResourceUsage(
+            wall_time=wall_time,
+            user_time=rusage.ru_utime,
+            system_time=rusage.ru_stime,
+            # Kilobytes on Linux, bytes on macOS
+            peak_rss=rusage.ru_maxrss / (2**20 if sys.platform == "darwin" else 1024),
+            read_bytes=io_counters[0],
+            write_bytes=io_counters[1],
+            start_time=start_time,
+        ),
+    )
+
+
+class Measured(Native):
+    """Native environment recording the resources used by each task.
+
+    The usage is written to `USAGE_FILE` in the output directory of the task, where
+    output callables can read it back with `load_usage`. The running process can be
+    monitored through `PROCESS_FILE` and `STDOUT_FILE` in the same directory. Runs are
+    also recorded in the `RunHistory` at `default_history_path`, if set. The executable
+    is run from the installation found by `installation.discover`, which honours
+    `ANTSPATH`.
+    """
+
+    def execute(self, task):
+        args = task.command_args()
+        # Resolved here rather than in the inputs, so that task hashes stay portable
+        args[0] = installation.discover().resolve(args[0])
+        returncode, stdout, stderr, usage = run_measured(args, log_dir=Path.cwd())
+        if task.strip:
+            stdout, stderr = stdout.strip(), stderr.strip()
+        with open(USAGE_FILE, "w") as fobj:
+            json.dump(asdict(usage), fobj)
+        history.record_run(task, usage, returncode)
+        if returncode:
+            msg = f"Error running '{task.name}' task with {task.command_args()}:"
+            if stderr:
+                msg += "\n\nstderr:\n" + stderr
+            if stdout:
+                msg += "\n\nstdout:\n" + stdout
+            raise RuntimeError(msg)
+        return {"return_code": returncode, "stdout": stdout, "stderr": stderr}
+
+
+def load_usage(output_dir: PathLike) -> Optional[ResourceUsage]:
+    """Resource usage recorded by `Measured` in an output directory, if any."""
+    path = Path(output_dir) / USAGE_FILE
+    if not path.exists():
+        return None
+    with open(path) as fobj:
+        return ResourceUsage(**json.load(fobj))
+
+
+def _usage_output(name: str, help_string: str):
+    return field(
+        metadata={
+            "help_string": help_string,
+            "callable": lambda output_dir: getattr(load_usage(output_dir), name, None),
+        }
+    )
+
+
+@define(kw_only=True)
+class ResourceOutSpec(ShellOutSpec):
+    """Outputs reporting the resources used by a task run with `Measured`."""
+
+    wall_time: float = _usage_output("wall_time", "elapsed time in seconds")
+
+    user_time: float = _usage_output("user_time", "CPU time in user mode in seconds")
+
+    system_time: float = _usage_output(
+        "system_time", "CPU time in kernel mode in seconds"
+    )
+
+    peak_rss: float = _usage_output("peak_rss", "peak resident memory in MiB")
+
+    read_bytes: int = _usage_output("read_bytes", "bytes read by system calls")
+
+    write_bytes: int = _usage_output("write_bytes", "bytes written by system calls")
+
+    parallelism: float = _usage_output(
+        "parallelism", "average number of busy cores, i.e. CPU over wall time"
+    )
+
+
+class MeasuredShellCommandTask(ShellCommandTask):
+    """Shell command task run with `Measured` unless given another environment.
+
+    Output specifications of subclasses should derive from `ResourceOutSpec`.
+
+    The checksum naming the cached result is computed from the rendered command line
+    rather than from the input values, so that tasks running the same command share a
+    cache entry however their inputs were given. As in pydra, templated output names
+    do not change it. Inputs listed in `non_semantic_inputs`, such as `verbose`, are
+    rendered with their default value so that they do not change it either. The version
+    of the ANTs installation found by `installation.discover` is part of the checksum,
+    so that results are not reused across ANTs upgrades. Tasks with a state keep the
+    pydra checksum, while each of their states is named by its own key.
+
+    >>> from pydra.tasks.ants.v2_5 import ApplyTransforms
+    >>> task = ApplyTransforms(moving_image="moving.nii", fixed_image="fixed.nii")
+    >>> task.checksum == ApplyTransforms(
+    ...     moving_image="moving.nii", fixed_image="fixed.nii", verbose=True
+    ... ).checksum
+    True
+    >>> task.checksum == ApplyTransforms(
+    ...     moving_image="moving.nii", fixed_image="fixed.nii", interpolator="BSpline"
+    ... ).checksum
+    False
+    """
+
+    output_spec = SpecInfo(name="Output", bases=(ResourceOutSpec,))
+
+    non_semantic_inputs: Tuple[str, ...] = ()
+    """Inputs that do not change the results, left out of the checksum."""
+
+    def __init__(self, *args, output_spec=None, environment=None, **kwargs):
+        if output_spec is None:
+            # Pydra appends templated outputs to the spec in place, copy the shared one
+            output_spec = SpecInfo(
+                name=self.output_spec.name,
+                fields=list(self.output_spec.fields),
+                bases=self.output_spec.bases,
+            )
+        self._rendering_key = False
+        self._cache_key = None
+        super().__init__(
+            *args,
+            output_spec=output_spec,
+            environment=environment or Measured(),
+            **kwargs,
+        )
+
+    @property
+    def checksum(self):
+        if self._rendering_key:
+            return _KEY_OUTPUT_DIR
+        if self.state is not None or is_lazy(self.inputs):
+            return super().checksum
+        input_hash, field_hashes = self.inputs._compute_hashes()
+        # Read back by pydra to detect inputs modified by the run
+        self.inputs._hashes = field_hashes
+        if self._cache_key is None or self._cache_key[0] != input_hash:
+            # File contents are hashed by pydra for inputs given as file sets
+            files = {
+                name: field_hashes[name]
+                for name in field_hashes
+                if isinstance(getattr(self.inputs, name), FileSet)
+            }
+            self._cache_key = input_hash, create_checksum(
+                type(self).__name__,
+                hash_function(
+                    [self._key_args(), files, installation.discover().version]
+                ),
+            )
+        self._checksum = self._cache_key[1]
+        return self._checksum
+
+    def checksum_states(self, state_index=None):
+        if state_index is None:
+            return super().checksum_states()
+        # Named like the job running the state, see pydra.engine.helpers.load_task
+        inputs, state = self.inputs, self.state
+        checksum, cache_key = self._checksum, self._cache_key
+        self.inputs = attrs.evolve(inputs, **self.get_input_el(state_index))
+        self.state = None
+        try:
+            return self.checksum
+        finally:
+            self.inputs, self.state = inputs, state
+            self._checksum, self._cache_key = checksum, cache_key
+
+    def _key_args(self) -> List[str]:
+        """Command line with non-semantic inputs and output names set to defaults."""
+        inputs = self.inputs
+        fields = attrs.fields_dict(type(inputs))
+        defaults = {
+            name: (
+                fields[name].default.factory()
+                if isinstance(fields[name].default, attrs.Factory)
+                else fields[name].default
+            )
+            for name in self.non_semantic_inputs
+        }
+        defaults.update(
+            (name, NOTHING)
+            for name, fld in fields.items()
+            if fld.metadata.get("output_file_template")
+        )
+        self.inputs = attrs.evolve(inputs, **defaults)
+        self._rendering_key = True
+        try:
+            args = self.command_args()
+        finally:
+            self.inputs = inputs
+            self._rendering_key = False
+        output_dir = str(self.cache_dir / _KEY_OUTPUT_DIR)
+        return [arg.replace(output_dir, "") for arg in args]
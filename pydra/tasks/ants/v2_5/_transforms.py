@@ -0,0 +1,98 @@
+"""Helpers for reading and writing ITK transform files."""
+
+import struct
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import nibabel as nib
+import numpy as np
+
+# ITK stores physical coordinates in LPS, whereas NIfTI affines map to RAS
+_LPS = np.diag([-1.0, -1.0, 1.0])
+
+
+def _write_mat4_variable(fobj, name: str, values: np.ndarray):
+    values = np.asarray(values, dtype="<f8").reshape(-1, 1)
+    encoded = name.encode() + b"\x00"
+    # MATLAB v4 header: type (little-endian doubles), rows, columns, imaginary, name length
+    fobj.write(struct.pack("<5i", 0, values.shape[0], 1, 0, len(encoded)))
+    fobj.write(encoded)
+    fobj.write(values.tobytes(order="F"))
+
+
+def _read_mat4_variables(path: PathLike) -> Dict[str, np.ndarray]:
+    variables = {}
+    with open(path, "rb") as fobj:
+        while header := fobj.read(20):
+            _, rows, cols, _, length = struct.unpack("<5i", header)
+            name = fobj.read(length)[:-1].decode()
+            variables[name] = np.frombuffer(fobj.read(8 * rows * cols), dtype="<f8")
+    return variables
+
+
+def write_affine(
+    path: PathLike,
+    matrix: np.ndarray,
+    translation: Sequence[float],
+    center: Optional[Sequence[float]] = None,
+) -> Path:
+    """Write an affine transform in the ITK MATLAB format produced by ANTs.
+
+    The transform maps points of the fixed image space to the moving image space, in
+    the LPS physical coordinates used by ITK: ``x' = matrix @ (x - center) + center +
+    translation``.
+
+    >>> import tempfile
+    >>> path = Path(tempfile.mkdtemp()) / "identity.mat"
+    >>> _ = write_affine(path, np.eye(3), [0, 0, 0])
+    >>> read_affine(path)
+    array([[1., 0., 0., 0.],
+           [0., 1., 0., 0.],
+           [0., 0., 1., 0.],
+           [0., 0., 0., 1.]])
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    ndim = matrix.shape[0]
+    center = np.zeros(ndim) if center is None else np.asarray(center)
+    with open(path, "wb") as fobj:
+        _write_mat4_variable(
+            fobj,
+            f"AffineTransform_double_{ndim}_{ndim}",
+            np.concatenate([matrix.ravel(), np.asarray(translation, dtype=np.float64)]),
+        )
+        _write_mat4_variable(fobj, "fixed", center)
+    return Path(path)
+
+
+def read_affine(path: PathLike) -> np.ndarray:
+    """Read an ITK MATLAB affine transform as a homogeneous matrix in LPS coordinates."""
+    variables = _read_mat4_variables(path)
+    name = next(n for n in variables if n.startswith("AffineTransform"))
+    parameters, center = variables[name], variables["fixed"]
+    ndim = center.size
+    matrix = parameters[: ndim * ndim].reshape(ndim, ndim)
+    translation = parameters[ndim * ndim :]
+    homogeneous = np.eye(ndim + 1)
+    homogeneous[:ndim, :ndim] = matrix
+    homogeneous[:ndim, ndim] = translation + center - matrix @ center
+    return homogeneous
+
+
+def write_ras_affine(path: PathLike, transform: np.ndarray) -> Path:
+    """Write a 3D homogeneous transform given in RAS world coordinates."""
+    lps = np.eye(4)
+    lps[:3, :3] = _LPS @ transform[:3, :3] @ _LPS
+    lps[:3, 3] = _LPS @ transform[:3, 3]
+    return write_affine(path, lps[:3, :3], lps[:3, 3])
+
+
+def write_identity_warp(path: PathLike, reference_image: PathLike) -> Path:
+    """Write a zero displacement field on the grid of a reference image."""
+    reference = nib.load(reference_image)
+    ndim = min(len(reference.shape), 3)
+    shape = reference.shape[:ndim] + (1,) * (3 - ndim) + (1, ndim)
+    field = nib.Nifti1Image(np.zeros(shape, dtype=np.float32), reference.affine)
+    field.header.set_intent("vector")
+    nib.save(field, path)
+    return Path(path)
@@ -0,0 +1,285 @@
+from os import PathLike
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import nibabel as nib
+import numpy as np
+import pydra
+from pydra.engine.specs import File
+
+from . import _image, _transforms
+from .similarity import similarity_metrics
+
+__all__ = ["affine_initializer", "rotation_grid"]
+
+
+def rotation_grid(search_factor: float, radian_fraction: float) -> List[List[float]]:
+    """Euler angles of the starting rotations searched by `antsAffineInitializer`.
+
+    Each axis is sampled every `search_factor` degrees within plus or minus
+    `radian_fraction` times pi radians. When the range covers the full circle, pi is
+    left out since it is the same rotation as minus pi.
+
+    >>> len(rotation_grid(15, 0.1)), len(rotation_grid(20, 1.0))
+    (27, 5832)
+    """
+    limit = radian_fraction * np.pi
+    step = np.deg2rad(search_factor)
+    if step <= 0:
+        angles = np.zeros(1)
+    elif limit >= np.pi - 1e-6:
+        angles = np.arange(-np.pi, np.pi - 1e-6, step)
+    else:
+        angles = np.arange(-limit, limit + 1e-6, step)
+        angles = angles - angles.mean()  # center the samples on the identity
+    return [[x, y, z] for x in angles for y in angles for z in angles]
+
+
+def _rotation(angles: Sequence[float]) -> np.ndarray:
+    cx, cy, cz = np.cos(angles)
+    sx, sy, sz = np.sin(angles)
+    rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    return rz @ ry @ rx
+
+
+class _Problem:
+    """Coarse fixed and moving images, and the cost of a rigid start between them.
+
+    Parameters are three Euler angles of a rotation about the fixed centre of mass and
+    a translation added to the alignment of the centres of mass.
+    """
+
+    def __init__(self, fixed_image, moving_image, shrink_factor, metric, num_bins):
+        self.fixed, self.fixed_affine = _image.downsample_image(
+            nib.load(fixed_image), shrink_factor
+        )
+        self.moving, self.moving_affine = _image.downsample_image(
+            nib.load(moving_image), shrink_factor
+        )
+        self.fixed_center = _image.center_of_mass(self.fixed, self.fixed_affine)
+        self.moving_center = _image.center_of_mass(self.moving, self.moving_affine)
+        self.mask = self.fixed > 0
+        self.metric = similarity_metrics[metric]
+        self.num_bins = num_bins
+
+    def transform(self, parameters: Sequence[float]) -> np.ndarray:
+        rotation = _rotation(parameters[:3])
+        transform = np.eye(4)
+        transform[:3, :3] = rotation
+        transform[:3, 3] = (
+            self.moving_center
+            + np.asarray(parameters[3:])
+            - rotation @ self.fixed_center
+        )
+        return transform
+
+    def cost(self, parameters: Sequence[float]) -> float:
+        moving = _image.resample(
+            self.moving,
+            self.moving_affine,
+            self.fixed.shape,
+            self.fixed_affine,
+            transform=self.transform(parameters),
+        )
+        return self.metric(self.fixed, moving, self.mask, num_bins=self.num_bins)
+
+    def refine(self, parameters, angle_step, translation_step, iterations):
+        """Coordinate descent over the six rigid parameters, halving steps on failure."""
+        parameters = np.asarray(parameters, dtype=np.float64)
+        best = self.cost(parameters)
+        steps = np.array([angle_step] * 3 + [translation_step] * 3)
+        for _ in range(iterations):
+            improved = False
+            for index in range(parameters.size):
+                for sign in (1, -1):
+                    candidate = parameters.copy()
+                    candidate[index] += sign * steps[index]
+                    value = self.cost(candidate)
+                    if value < best:
+                        parameters, best, improved = candidate, value, True
+                        break
+            if not improved:
+                steps /= 2
+        return best, parameters
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"candidates": list}})
+def _search_rotations(
+    fixed_image: File,
+    moving_image: File,
+    rotations: list,
+    shrink_factor: int,
+    metric: str,
+    num_bins: int,
+    num_best: int,
+) -> list:
+    problem = _Problem(fixed_image, moving_image, shrink_factor, metric, num_bins)
+    candidates = [
+        [problem.cost(angles + [0.0, 0.0, 0.0])] + angles + [0.0, 0.0, 0.0]
+        for angles in rotations
+    ]
+    return sorted(candidates)[:num_best]
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"output_transform": File, "metric_value": float}})
+def _refine_candidates(
+    fixed_image: File,
+    moving_image: File,
+    candidates: list,
+    shrink_factor: int,
+    metric: str,
+    num_bins: int,
+    num_best: int,
+    search_factor: float,
+    local_search: int,
+    output_transform: str,
+) -> Tuple[Path, float]:
+    problem = _Problem(fixed_image, moving_image, shrink_factor, metric, num_bins)
+    candidates = sorted(c for chunk in candidates for c in chunk)[:num_best]
+    translation_step = float(
+        np.min(np.abs(nib.affines.voxel_sizes(problem.fixed_affine)))
+    )
+    best, parameters = min(
+        (
+            problem.refine(
+                candidate[1:],
+                np.deg2rad(search_factor) / 2,
+                translation_step,
+                local_search,
+            )
+            for candidate in candidates
+        ),
+        key=lambda result: result[0],
+    )
+    output_transform = _transforms.write_ras_affine(
+        Path.cwd() / output_transform, problem.transform(parameters)
+    )
+    return output_transform, best
+
+
+def affine_initializer(
+    *,
+    fixed_image: PathLike,
+    moving_image: PathLike,
+    search_factor: float = 15.0,
+    radian_fraction: float = 0.1,
+    local_search: int = 10,
+    num_workers: int = 8,
+    num_best: int = 4,
+    shrink_factor: int = 4,
+    metric: str = "Mattes",
+    num_bins: int = 32,
+    output_transform: str = "initialization.mat",
+    name: str = "affine_initializer",
+) -> pydra.Workflow:
+    """Returns a workflow searching an initial rigid alignment over many rotations.
+
+    As with `antsAffineInitializer`, starting rotations are sampled every
+    `search_factor` degrees within plus or minus `radian_fraction` times pi radians
+    around each axis, with the centres of mass of the images aligned. The rotation grid
+    is partitioned across `num_workers` tasks, each evaluating its starts with `metric`
+    on images downsampled by `shrink_factor`. The `num_best` best starts overall are
+    then refined with `local_search` iterations of a local search over rotations and
+    translations, and the best transform is written in the ITK format.
+
+    Parameters
+    ----------
+    fixed_image : path_like
+        Fixed image.
+    moving_image : path_like
+        Moving image.
+    search_factor : float, default=15.0
+        Step between rotation angles, in degrees.
+    radian_fraction : float, default=0.1
+        Fraction of pi radians searched around each axis, between 0 and 1.
+    local_search : int, default=10
+        Number of local search iterations for each refined start.
+    num_workers : int, default=8
+        Number of tasks the rotation grid is partitioned across.
+    num_best : int, default=4
+        Number of starts kept for refinement.
+    shrink_factor : int, default=4
+        Downsampling factor of the grid on which starts are evaluated.
+    metric : {"Mattes", "GC", "MeanSquares", "CC"}, default="Mattes"
+        Similarity metric, see `measure_similarity`.
+    num_bins : int, default=32
+        Number of histogram bins for the `Mattes` metric.
+    output_transform : str, default="initialization.mat"
+        Name of the output transform.
+    name : str, default="affine_initializer"
+        Name of the returned workflow.
+
+    Returns
+    -------
+    Workflow
+        A workflow with `output_transform` and `metric_value` outputs. The transform
+        can be passed in the `initial_moving_transforms` of `Registration`.
+
+    Examples
+    --------
+    >>> wf = affine_initializer(
+    ...     fixed_image="template.nii.gz",
+    ...     moving_image="structural.nii.gz",
+    ...     search_factor=20,
+    ...     radian_fraction=1.0,
+    ...     num_workers=16,
+    ... )
+    >>> wf.output_names
+    ['output_transform', 'metric_value']
+    """
+    if metric not in similarity_metrics:
+        raise ValueError(f"unknown similarity metric: {metric}")
+    rotations = rotation_grid(search_factor, radian_fraction)
+    partitions = [rotations[i::num_workers] for i in range(num_workers)]
+    partitions = [p for p in partitions if p]
+
+    wf = pydra.Workflow(
+        name=name,
+        input_spec=["fixed_image", "moving_image", "partitions"],
+        fixed_image=fixed_image,
+        moving_image=moving_image,
+        partitions=partitions,
+    )
+
+    wf.add(
+        _search_rotations(
+            name="search",
+            fixed_image=wf.lzin.fixed_image,
+            moving_image=wf.lzin.moving_image,
+            shrink_factor=shrink_factor,
+            metric=metric,
+            num_bins=num_bins,
+            num_best=num_best,
+        )
+        .split("rotations", rotations=wf.lzin.partitions)
+        .combine("rotations")
+    )
+
+    wf.add(
+        _refine_candidates(
+            name="refine",
+            fixed_image=wf.lzin.fixed_image,
+            moving_image=wf.lzin.moving_image,
+            candidates=wf.search.lzout.candidates,
+            shrink_factor=shrink_factor,
+            metric=metric,
+            num_bins=num_bins,
+            num_best=num_best,
+            search_factor=search_factor,
+            local_search=local_search,
+            output_transform=output_transform,
+        )
+    )
+
+    wf.set_output(
+        [
+            ("output_transform", wf.refine.lzout.output_transform),
+            ("metric_value", wf.refine.lzout.metric_value),
+        ]
+    )
+
+    return wf
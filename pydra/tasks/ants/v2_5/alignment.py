@@ -0,0 +1,161 @@
+import shutil
+from os import PathLike
+from pathlib import Path
+from typing import Optional
+
+import nibabel as nib
+import numpy as np
+import pydra
+from attrs import define
+from pydra.engine.specs import File
+
+from . import _image, _transforms
+from .similarity import similarity_metrics
+
+__all__ = ["AlignmentCheck", "check_alignment", "identity_registration"]
+
+
+@define(frozen=True)
+class AlignmentCheck:
+    """Summary of how well two images are aligned before registration."""
+
+    same_grid: bool
+    """Whether both images share the same shape and affine."""
+
+    identical: bool
+    """Whether both images share the same grid and voxel values."""
+
+    center_of_mass_offset: float
+    """Distance between the intensity centres of mass, in millimetres."""
+
+    similarity: float
+    """Global correlation metric on a coarse grid, from -1 (best) to 0."""
+
+    def is_aligned(self, tolerance: float = 1.0, threshold: float = -0.9) -> bool:
+        """Whether the images are within `tolerance` mm and below the `threshold`.
+
+        >>> AlignmentCheck(False, False, 0.4, -0.97).is_aligned()
+        True
+        >>> AlignmentCheck(False, False, 3.2, -0.97).is_aligned()
+        False
+        """
+        return self.center_of_mass_offset <= tolerance and self.similarity <= threshold
+
+
+def check_alignment(
+    fixed_image: PathLike, moving_image: PathLike, shrink_factor: int = 4
+) -> AlignmentCheck:
+    """Cheaply check whether two images are already aligned.
+
+    The headers are compared first. Both images are then downsampled by block averaging
+    by `shrink_factor`, the moving image is resampled on the coarse fixed grid, and
+    their centres of mass and global correlation are compared.
+
+    Parameters
+    ----------
+    fixed_image : path_like
+        Fixed image.
+    moving_image : path_like
+        Moving image.
+    shrink_factor : int, default=4
+        Downsampling factor of the grid on which images are compared.
+
+    Returns
+    -------
+    AlignmentCheck
+        The result of the comparison.
+    """
+    fixed, moving = nib.load(fixed_image), nib.load(moving_image)
+    same_grid = fixed.shape == moving.shape and np.allclose(fixed.affine, moving.affine)
+    identical = same_grid and np.array_equal(
+        np.asanyarray(fixed.dataobj), np.asanyarray(moving.dataobj)
+    )
+    fixed_data, fixed_affine = _image.downsample_image(fixed, shrink_factor)
+    moving_data, moving_affine = _image.downsample_image(moving, shrink_factor)
+    offset = np.linalg.norm(
+        _image.center_of_mass(fixed_data, fixed_affine)
+        - _image.center_of_mass(moving_data, moving_affine)
+    )
+    resampled = _image.resample(
+        moving_data, moving_affine, fixed_data.shape, fixed_affine
+    )
+    similarity = similarity_metrics["GC"](
+        fixed_data, resampled, np.ones(fixed_data.shape, dtype=bool)
+    )
+    return AlignmentCheck(
+        same_grid=same_grid,
+        identical=identical,
+        center_of_mass_offset=float(offset),
+        similarity=similarity,
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate(
+    {
+        "return": {
+            "affine_transform": File,
+            "warp_field": Optional[File],
+            "inverse_warp_field": Optional[File],
+            "warped_image": File,
+            "inverse_warped_image": File,
+            "sampling_rates": list,
+            "elapsed_time": Optional[float],
+            "stage_elapsed_times": list,
+            "level_elapsed_times": list,
+            "num_iterations": list,
+            "metric_values": list,
+            "wall_time": Optional[float],
+            "user_time": Optional[float],
+            "system_time": Optional[float],
+            "peak_rss": Optional[float],
+            "read_bytes": Optional[int],
+            "write_bytes": Optional[int],
+            "parallelism": Optional[float],
+        }
+    }
+)
+def identity_registration(
+    fixed_image: File,
+    moving_image: File,
+    output_transform_prefix: str = "output",
+    write_warp_fields: bool = False,
+) -> tuple:
+    """Task producing the outputs of `Registration` for identical images.
+
+    The affine transform is the identity, the warp fields, if requested, are zero
+    displacement fields, the warped images are copies of the inputs, and neither metrics
+    nor resource usage are reported.
+    """
+    prefix = Path.cwd() / output_transform_prefix
+    affine_transform = _transforms.write_affine(
+        f"{prefix}0GenericAffine.mat", np.eye(3), [0.0, 0.0, 0.0]
+    )
+    warp_field = inverse_warp_field = None
+    if write_warp_fields:
+        warp_field = _transforms.write_identity_warp(
+            f"{prefix}1Warp.nii.gz", fixed_image
+        )
+        inverse_warp_field = _transforms.write_identity_warp(
+            f"{prefix}1InverseWarp.nii.gz", fixed_image
+        )
+    _, ext = _image.split_extension(moving_image)
+    warped_image = Path(shutil.copyfile(moving_image, f"{prefix}Warped{ext}"))
+    _, ext = _image.split_extension(fixed_image)
+    inverse_warped_image = Path(
+        shutil.copyfile(fixed_image, f"{prefix}InverseWarped{ext}")
+    )
+    return (
+        affine_transform,
+        warp_field,
+        inverse_warp_field,
+        warped_image,
+        inverse_warped_image,
+        [],
+        None,
+        [],
+        [],
+        [],
+        [],
+        *[None] * 7,
+    )
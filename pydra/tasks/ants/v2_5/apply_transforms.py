@@ -1,11 +1,17 @@
-__all__ = ["ApplyTransforms"]
+__all__ = ["ApplyTransforms", "apply_transforms_chunked"]
 
 from os import PathLike
-from typing import Sequence
+from pathlib import Path
+from typing import Optional, Sequence, Union
 
+import nibabel as nib
+import numpy as np
+import pydra
 from attrs import define, field
-from pydra.engine.specs import ShellSpec, SpecInfo
-from pydra.engine.task import ShellCommandTask
+from pydra.engine.specs import File, ShellSpec, SpecInfo
+
+from . import _image
+from ._resources import MeasuredShellCommandTask
 
 
 def _format_output(
@@ -44,7 +50,7 @@ def _format_interpolation(
     )
 
 
-class ApplyTransforms(ShellCommandTask):
+class ApplyTransforms(MeasuredShellCommandTask):
     """Task definition for antsApplyTransforms.
 
     Examples
@@ -128,7 +134,7 @@ class ApplyTransforms(ShellCommandTask):
             metadata={
                 "help_string": "output warp field",
                 "output_file_template": "{moving_image}_warpfield",
-                "requires": {"save_warp_field"},
+                "requires": ["save_warp_field"],
             }
         )
 
@@ -141,7 +147,7 @@ class ApplyTransforms(ShellCommandTask):
                 "help_string": "output transform",
                 "output_file_template": "{moving_image}_affine.mat",
                 "keep_extension": False,
-                "requires": {"save_transform"},
+                "requires": ["save_transform"],
             }
         )
 
@@ -250,3 +256,173 @@ class ApplyTransforms(ShellCommandTask):
     input_spec = SpecInfo(name="Input", bases=(InputSpec,))
 
     executable = "antsApplyTransforms"
+
+    non_semantic_inputs = ("verbose",)
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"ranges": list}})
+def _time_chunks(moving_image: File, chunk_size: int) -> list:
+    num_volumes = nib.load(moving_image).shape[3]
+    return [
+        [start, min(start + chunk_size, num_volumes)]
+        for start in range(0, num_volumes, chunk_size)
+    ]
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"chunk": File}})
+def _extract_chunk(moving_image: File, volumes: list) -> Path:
+    image = nib.load(moving_image)
+    start, stop = volumes
+    return _image.crop_image(
+        moving_image,
+        [[0, size] for size in image.shape[:3]] + [[start, stop]],
+        _image.output_path(moving_image, f"_vol{start:05d}", ".nii"),
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"output_image": File}})
+def _merge_chunks(moving_image: File, chunks: list) -> Path:
+    original = nib.load(moving_image)
+    first = nib.load(chunks[0])
+    shape = first.shape[:3] + original.shape[3:]
+    merged = np.lib.format.open_memmap(
+        "merged.npy", mode="w+", dtype=first.get_data_dtype(), shape=shape
+    )
+    start = 0
+    for chunk in chunks:
+        # A single-volume chunk may be written back as a 3D image
+        data = np.asanyarray(nib.load(chunk).dataobj).reshape(shape[:3] + (-1,))
+        merged[:, :, :, start : start + data.shape[3]] = data
+        start += data.shape[3]
+    # Spatial header fields come from the warped chunks, temporal ones from the input
+    header = first.header.copy()
+    header.set_zooms(first.header.get_zooms()[:3] + original.header.get_zooms()[3:])
+    xyz_units, _ = first.header.get_xyzt_units()
+    _, t_units = original.header.get_xyzt_units()
+    header.set_xyzt_units(xyz=xyz_units, t=t_units)
+    for key in ("toffset", "slice_duration", "slice_start", "slice_end", "slice_code"):
+        header[key] = original.header[key]
+    output_image = _image.output_path(moving_image, "_warped")
+    nib.save(nib.Nifti1Image(merged, first.affine, header), output_image)
+    del merged
+    Path("merged.npy").unlink()
+    return output_image
+
+
+def apply_transforms_chunked(
+    *,
+    moving_image: PathLike,
+    fixed_image: PathLike,
+    input_transforms: Sequence[PathLike] = (),
+    chunk_size: Optional[int] = None,
+    name: str = "apply_transforms",
+    **kwargs,
+) -> Union[ApplyTransforms, pydra.Workflow]:
+    """Returns a task applying transforms to an image, optionally split over time.
+
+    With `chunk_size` provided, the moving image is treated as a time series and split
+    into chunks of consecutive volumes. The same transforms are applied to every chunk
+    in a separate `ApplyTransforms` task so that chunks run in parallel, and the warped
+    chunks are then concatenated in order. The output keeps the repetition time and
+    temporal header fields of the moving image.
+
+    Parameters
+    ----------
+    moving_image : path_like
+        Image to transform, a 4D time series when splitting.
+    fixed_image : path_like
+        Reference image defining the output grid.
+    input_transforms : sequence of path_like, default=()
+        Transforms to apply.
+    chunk_size : int, optional
+        Number of volumes per chunk.
+    name : str, default="apply_transforms"
+        Name of the returned task.
+    **kwargs : dict, optional
+        Extra arguments passed to the `ApplyTransforms` constructor. When splitting,
+        `dimensionality` and `image_type` are set to 3 and may only be given as 3.
+
+    Returns
+    -------
+    ApplyTransforms or Workflow
+        The configured task, or a workflow with an `output_image` output when
+        splitting is enabled.
+
+    Examples
+    --------
+    >>> task = apply_transforms_chunked(
+    ...     moving_image="moving.nii",
+    ...     fixed_image="fixed.nii",
+    ...     input_transforms=["affine.mat"],
+    ... )
+    >>> task.cmdline  # doctest: +ELLIPSIS
+    'antsApplyTransforms -e scalar -i moving.nii -r fixed.nii ... -t affine.mat ...'
+
+    >>> wf = apply_transforms_chunked(
+    ...     moving_image="bold.nii.gz",
+    ...     fixed_image="fixed.nii",
+    ...     input_transforms=["affine.mat"],
+    ...     chunk_size=100,
+    ... )
+    >>> wf.output_names
+    ['output_image']
+    """
+    if chunk_size is None:
+        return ApplyTransforms(
+            name=name,
+            moving_image=moving_image,
+            fixed_image=fixed_image,
+            input_transforms=list(input_transforms),
+            **kwargs,
+        )
+
+    for key in ("dimensionality", "image_type"):
+        if kwargs.pop(key, 3) != 3:
+            raise ValueError(f"splitting over time requires {key}=3")
+
+    wf = pydra.Workflow(
+        name=name,
+        input_spec=["moving_image", "fixed_image", "input_transforms"],
+        moving_image=moving_image,
+        fixed_image=fixed_image,
+        input_transforms=list(input_transforms),
+    )
+
+    wf.add(
+        _time_chunks(
+            name="chunks", moving_image=wf.lzin.moving_image, chunk_size=chunk_size
+        )
+    )
+
+    wf.add(
+        _extract_chunk(name="extract", moving_image=wf.lzin.moving_image).split(
+            "volumes", volumes=wf.chunks.lzout.ranges
+        )
+    )
+
+    wf.add(
+        ApplyTransforms(
+            name="apply",
+            dimensionality=3,
+            image_type=3,
+            moving_image=wf.extract.lzout.chunk,
+            fixed_image=wf.lzin.fixed_image,
+            input_transforms=wf.lzin.input_transforms,
+            **kwargs,
+        ).combine("extract.volumes")
+    )
+
+    wf.add(
+        _merge_chunks(
+            name="merge",
+            moving_image=wf.lzin.moving_image,
+            chunks=wf.apply.lzout.output_image,
+        )
+    )
+
+    wf.set_output([("output_image", wf.merge.lzout.output_image)])
+
+    return wf
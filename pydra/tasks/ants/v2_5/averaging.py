@@ -0,0 +1,234 @@
+from os import PathLike
+from pathlib import Path
+from typing import Optional, Sequence
+
+import nibabel as nib
+import numpy as np
+import pydra
+from pydra.engine.specs import File
+
+from . import _image
+
+__all__ = ["average_images", "combine_averages"]
+
+
+def _save_state(path, count, mean, m2, affine, header) -> Path:
+    arrays = {
+        "count": count,
+        "mean": mean,
+        "affine": affine,
+        "header": np.frombuffer(header.binaryblock, dtype=np.uint8),
+    }
+    if m2 is not None:
+        arrays["m2"] = m2
+    with open(path, "wb") as fobj:
+        np.savez(fobj, **arrays)
+    return Path(path)
+
+
+def _load_state(path):
+    state = np.load(path)
+    return (
+        int(state["count"]),
+        state["mean"],
+        state["m2"] if "m2" in state else None,
+        state["affine"],
+        nib.Nifti1Header(binaryblock=state["header"].tobytes()),
+    )
+
+
+def combine_averages(
+    states: Sequence[PathLike], out_file: PathLike, compute_variance: bool = False
+) -> Path:
+    """Combine running averages into a single one.
+
+    Each state holds the number of averaged images, their voxelwise mean and, if
+    `compute_variance` is enabled, the sum of squared deviations from the mean. States
+    are merged one at a time with the pairwise update of Chan et al., so that at most
+    two states are held in memory. The affine and header of the first state are kept.
+    """
+    if not states:
+        raise ValueError("no states to combine")
+    count, mean, m2, affine, header = _load_state(states[0])
+    for state in states[1:]:
+        other_count, other_mean, other_m2, _, _ = _load_state(state)
+        total = count + other_count
+        delta = other_mean - mean
+        mean = mean + delta * (other_count / total)
+        if compute_variance:
+            m2 = m2 + other_m2 + delta**2 * (count * other_count / total)
+        count = total
+    return _save_state(
+        out_file, count, mean, m2 if compute_variance else None, affine, header
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"state": File}})
+def _accumulate(images: list, compute_variance: bool) -> Path:
+    reference = nib.load(images[0])
+    mean = np.zeros(reference.shape, dtype=np.float64)
+    m2 = np.zeros(reference.shape, dtype=np.float64) if compute_variance else None
+    for count, path in enumerate(images, start=1):
+        data = nib.load(path).get_fdata(dtype=np.float64)
+        if data.shape != mean.shape:
+            raise ValueError(f"shape of {path} {data.shape} differs from {mean.shape}")
+        delta = data - mean
+        mean += delta / count
+        if compute_variance:
+            m2 += delta * (data - mean)
+    return _save_state(
+        _image.output_path(images[0], "_state", ".npz"),
+        len(images),
+        mean,
+        m2,
+        reference.affine,
+        nib.Nifti1Header.from_header(reference.header),
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"groups": list}})
+def _group(states: list, fan_in: int) -> list:
+    return [states[i : i + fan_in] for i in range(0, len(states), fan_in)]
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"state": File}})
+def _combine(
+    states: list, initial_state: Optional[File], compute_variance: bool
+) -> Path:
+    if initial_state:
+        states = [initial_state] + list(states)
+    return combine_averages(
+        states,
+        _image.output_path(states[0], "_combined", ".npz"),
+        compute_variance=compute_variance,
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate(
+    {"return": {"output_image": File, "variance_image": Optional[File]}}
+)
+def _finalize(state: File, compute_variance: bool):
+    count, mean, m2, affine, header = _load_state(state)
+    header.set_data_dtype(np.float32)
+    header.set_slope_inter(1.0, 0.0)
+    output_image = Path.cwd() / "average.nii.gz"
+    nib.save(nib.Nifti1Image(mean.astype(np.float32), affine, header), output_image)
+    if not compute_variance:
+        return output_image, None
+    variance_image = Path.cwd() / "variance.nii.gz"
+    variance = m2 / max(count - 1, 1)
+    nib.save(
+        nib.Nifti1Image(variance.astype(np.float32), affine, header), variance_image
+    )
+    return output_image, variance_image
+
+
+def average_images(
+    *,
+    images: Sequence[PathLike],
+    chunk_size: int = 50,
+    fan_in: int = 8,
+    compute_variance: bool = False,
+    initial_state: Optional[PathLike] = None,
+    name: str = "average_images",
+) -> pydra.Workflow:
+    """Returns a workflow averaging a large number of images.
+
+    The images are split into chunks of `chunk_size` images, each streamed by a
+    separate task into a running mean (and optionally a running sum of squared
+    deviations) accumulated in float64. Partial results are then reduced in a tree of
+    `fan_in` partials per task, so that no task holds more than two images and two
+    accumulators in memory.
+
+    The final state is returned as `state` and can be passed as `initial_state` to
+    update the average with new images without revisiting the old ones. The outputs
+    keep the header of the first image, such as its coordinate systems and units.
+
+    Parameters
+    ----------
+    images : sequence of path_like
+        Images to average, all defined on the same grid.
+    chunk_size : int, default=50
+        Number of images accumulated per task.
+    fan_in : int, default=8
+        Number of partial results combined per task in the reduction tree.
+    compute_variance : bool, default=False
+        Also compute the voxelwise sample variance.
+    initial_state : path_like, optional
+        State of a previous average to update with `images`. It must have been computed
+        with the same `compute_variance` setting.
+    name : str, default="average_images"
+        Name of the returned workflow.
+
+    Returns
+    -------
+    Workflow
+        A workflow with `output_image`, `variance_image` and `state` outputs.
+
+    Examples
+    --------
+    >>> wf = average_images(
+    ...     images=[f"sub-{i:04d}_warped.nii.gz" for i in range(3000)],
+    ...     compute_variance=True,
+    ... )
+    >>> wf.output_names
+    ['output_image', 'variance_image', 'state']
+    """
+    if not images:
+        raise ValueError("no images to average")
+    chunks = [
+        list(images[i : i + chunk_size]) for i in range(0, len(images), chunk_size)
+    ]
+
+    wf = pydra.Workflow(name=name, input_spec=["chunks"], chunks=chunks)
+
+    wf.add(
+        _accumulate(name="accumulate", compute_variance=compute_variance)
+        .split("images", images=wf.lzin.chunks)
+        .combine("images")
+    )
+
+    # The last `fan_in` partial results are combined by the root of the tree
+    states, num_states, level = wf.accumulate.lzout.state, len(chunks), 0
+    while num_states > fan_in:
+        level += 1
+        group = _group(name=f"group{level}", states=states, fan_in=fan_in)
+        combine = _combine(
+            name=f"combine{level}",
+            initial_state=None,
+            compute_variance=compute_variance,
+        )
+        wf.add(group)
+        wf.add(combine.split("states", states=group.lzout.groups).combine("states"))
+        states, num_states = combine.lzout.state, -(-num_states // fan_in)
+
+    wf.add(
+        _combine(
+            name="reduce",
+            states=states,
+            initial_state=initial_state,
+            compute_variance=compute_variance,
+        )
+    )
+
+    wf.add(
+        _finalize(
+            name="finalize",
+            state=wf.reduce.lzout.state,
+            compute_variance=compute_variance,
+        )
+    )
+
+    wf.set_output(
+        [
+            ("output_image", wf.finalize.lzout.output_image),
+            ("variance_image", wf.finalize.lzout.variance_image),
+            ("state", wf.reduce.lzout.state),
+        ]
+    )
+
+    return wf
@@ -1,14 +1,20 @@
 from os import PathLike
-from typing import Sequence
+from pathlib import Path
+from typing import Optional, Sequence, Tuple, Union
 
-from attrs import define, field
-from pydra.engine.specs import ShellSpec, SpecInfo
-from pydra.engine.task import ShellCommandTask
+import nibabel as nib
+import numpy as np
+import pydra
+from attrs import NOTHING, define, field
+from pydra.engine.specs import File, ShellSpec, SpecInfo
 
-__all__ = ["N4BiasFieldCorrection"]
+from . import _image
+from ._resources import MeasuredShellCommandTask
 
+__all__ = ["N4BiasFieldCorrection", "n4_bias_field_correction"]
 
-class N4BiasFieldCorrection(ShellCommandTask):
+
+class N4BiasFieldCorrection(MeasuredShellCommandTask):
     """Task definition for N4BiasFieldCorrection.
 
     Examples
@@ -140,3 +146,196 @@ class N4BiasFieldCorrection(ShellCommandTask):
     input_spec = SpecInfo(name="Input", bases=(InputSpec,))
 
     executable = "N4BiasFieldCorrection"
+
+
+@pydra.mark.task
+@pydra.mark.annotate(
+    {
+        "return": {
+            "input_image": File,
+            "mask_image": File,
+            "weight_image": Optional[File],
+            "bounding_box": list,
+        }
+    }
+)
+def _crop_to_mask(
+    input_image: File, mask_image: File, weight_image: Optional[File], padding: int
+) -> Tuple[Path, Path, Optional[Path], list]:
+    mask = np.asanyarray(nib.load(mask_image).dataobj)
+    box = _image.bounding_box(mask, padding=padding)
+    if box is None:
+        raise ValueError(f"mask image {mask_image} is empty")
+    return (
+        _image.crop_image(
+            input_image, box, _image.output_path(input_image, "_cropped")
+        ),
+        _image.crop_image(mask_image, box, _image.output_path(mask_image, "_cropped")),
+        (
+            _image.crop_image(
+                weight_image, box, _image.output_path(weight_image, "_cropped")
+            )
+            if weight_image
+            else None
+        ),
+        [list(b) for b in box],
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"output_image": File, "output_bias_field": File}})
+def _paste_from_mask(
+    input_image: File,
+    mask_image: File,
+    bounding_box: list,
+    output_image: File,
+    output_bias_field: File,
+    fill_mode: str,
+) -> Tuple[Path, Path]:
+    mask = np.asanyarray(nib.load(mask_image).dataobj) > 0
+    return (
+        _image.paste_image(
+            output_image,
+            input_image,
+            bounding_box,
+            _image.output_path(input_image, "_corrected"),
+            fill=(
+                nib.load(input_image).get_fdata(dtype=np.float32)
+                if fill_mode == "input"
+                else None
+            ),
+            mask=mask,
+        ),
+        _image.paste_image(
+            output_bias_field,
+            input_image,
+            bounding_box,
+            _image.output_path(input_image, "_biasfield"),
+            fill_value=1.0,
+            mask=mask,
+        ),
+    )
+
+
+def n4_bias_field_correction(
+    *,
+    input_image: PathLike,
+    mask_image: Optional[PathLike] = None,
+    weight_image: Optional[PathLike] = None,
+    crop_to_mask: bool = False,
+    crop_padding: int = 10,
+    fill_mode: str = "input",
+    name: str = "n4_bias_field_correction",
+    **kwargs,
+) -> Union[N4BiasFieldCorrection, pydra.Workflow]:
+    """Returns a task for N4 bias field correction, optionally restricted to a mask.
+
+    With `crop_to_mask` enabled, the input, mask and weight images are cropped to the
+    padded bounding box of the mask before running N4, and the corrected image and bias
+    field are then pasted back into the original grid. For masked whole-head scans this
+    removes most of the background voxels from every fitting level.
+
+    Parameters
+    ----------
+    input_image : path_like
+        Image to correct.
+    mask_image : path_like, optional
+        Mask restricting the voxels used to fit the bias field. Required for cropping.
+    weight_image : path_like, optional
+        Weight image used to fit the bias field.
+    crop_to_mask : bool, default=False
+        Run N4 on the padded bounding box of the mask only.
+    crop_padding : int, default=10
+        Number of voxels added around the mask bounding box.
+    fill_mode : {"input", "zero"}, default="input"
+        Value of the corrected image outside the mask when cropping:
+        * input: the original intensities are kept.
+        * zero: the voxels are set to zero.
+        The bias field is set to one outside the mask in both cases.
+    name : str, default="n4_bias_field_correction"
+        Name of the returned task.
+    **kwargs : dict, optional
+        Extra arguments passed to the `N4BiasFieldCorrection` constructor.
+
+    Returns
+    -------
+    N4BiasFieldCorrection or Workflow
+        The configured task, or a workflow with `output_image` and `output_bias_field`
+        outputs when cropping is enabled.
+
+    Examples
+    --------
+    >>> task = n4_bias_field_correction(input_image="input.nii", mask_image="mask.nii")
+    >>> task.cmdline    # doctest: +ELLIPSIS
+    'N4BiasFieldCorrection -i input.nii -x mask.nii -r 1 -s 4 ...'
+
+    >>> wf = n4_bias_field_correction(
+    ...     input_image="input.nii", mask_image="mask.nii", crop_to_mask=True
+    ... )
+    >>> wf.output_names
+    ['output_image', 'output_bias_field']
+    """
+    if not crop_to_mask:
+        return N4BiasFieldCorrection(
+            name=name,
+            input_image=input_image,
+            mask_image=mask_image or NOTHING,
+            weight_image=weight_image or NOTHING,
+            **kwargs,
+        )
+
+    if not mask_image:
+        raise ValueError("cropping to the mask requires a mask image")
+
+    if fill_mode not in {"input", "zero"}:
+        raise ValueError(f"unknown fill mode: {fill_mode}")
+
+    wf = pydra.Workflow(
+        name=name,
+        input_spec=["input_image", "mask_image", "weight_image"],
+        input_image=input_image,
+        mask_image=mask_image,
+        weight_image=weight_image,
+    )
+
+    wf.add(
+        _crop_to_mask(
+            name="crop",
+            input_image=wf.lzin.input_image,
+            mask_image=wf.lzin.mask_image,
+            weight_image=wf.lzin.weight_image,
+            padding=crop_padding,
+        )
+    )
+
+    wf.add(
+        N4BiasFieldCorrection(
+            name="n4",
+            input_image=wf.crop.lzout.input_image,
+            mask_image=wf.crop.lzout.mask_image,
+            weight_image=wf.crop.lzout.weight_image if weight_image else NOTHING,
+            save_bias_field=True,
+            **kwargs,
+        )
+    )
+
+    wf.add(
+        _paste_from_mask(
+            name="paste",
+            input_image=wf.lzin.input_image,
+            mask_image=wf.lzin.mask_image,
+            bounding_box=wf.crop.lzout.bounding_box,
+            output_image=wf.n4.lzout.output_image,
+            output_bias_field=wf.n4.lzout.output_bias_field,
+            fill_mode=fill_mode,
+        )
+    )
+
+    wf.set_output(
+        [
+            ("output_image", wf.paste.lzout.output_image),
+            ("output_bias_field", wf.paste.lzout.output_bias_field),
+        ]
+    )
+
+    return wf
@@ -0,0 +1,107 @@
+from typing import Dict, Mapping, Optional
+
+from attrs import define, field
+
+__all__ = ["CostModel"]
+
+_STAGES = ("rigid", "affine", "syn")
+
+
+def _default_metric_costs() -> Dict[str, float]:
+    return {"MI": 6e-6, "Mattes": 6e-6, "GC": 3e-6, "MeanSquares": 2e-6, "CC": 4e-5}
+
+
+@define(frozen=True)
+class CostModel:
+    """Per-voxel cost model of the runtime of antsRegistration.
+
+    The work of each level is the number of metric samples times the number of
+    iterations times the cost of the metric, plus the dense update of the displacement
+    fields for SyN stages, plus smoothing and shrinking the full resolution images. The
+    wall time follows Amdahl's law for the given number of threads.
+
+    Default costs are rough figures for a recent x86-64 core and should be calibrated
+    from measured runs on the target hardware.
+
+    Examples
+    --------
+    >>> params = {
+    ...     "enable_rigid_stage": True,
+    ...     "rigid_metric": "MI",
+    ...     "rigid_sampling_strategy": "Regular",
+    ...     "rigid_sampling_rate": 0.25,
+    ...     "rigid_num_iterations": (1000, 500, 250, 100),
+    ...     "rigid_shrink_factors": (8, 4, 2, 1),
+    ...     "enable_affine_stage": False,
+    ...     "enable_syn_stage": False,
+    ... }
+    >>> model = CostModel()
+    >>> round(model.estimate(params, num_voxels=256**3, num_threads=1))
+    3557
+    >>> round(model.estimate(params, num_voxels=256**3, num_threads=8))
+    760
+    """
+
+    metric_costs: Mapping[str, float] = field(factory=_default_metric_costs)
+    """Core seconds per metric sample and iteration, for each metric."""
+
+    syn_voxel_cost: float = 2e-5
+    """Core seconds per voxel and iteration to update SyN displacement fields."""
+
+    level_voxel_cost: float = 5e-8
+    """Core seconds per full resolution voxel to smooth and shrink images per level."""
+
+    parallel_fraction: float = 0.9
+    """Fraction of the work that scales with the number of threads."""
+
+    overhead: float = 5.0
+    """Seconds spent reading inputs and writing outputs."""
+
+    def stage_work(
+        self,
+        params: Mapping,
+        stage: str,
+        num_voxels: int,
+        num_samples: Optional[int] = None,
+    ) -> float:
+        """Core seconds of one stage, with `num_samples` voxels inside the mask."""
+        if not params.get(f"enable_{stage}_stage"):
+            return 0.0
+        dimensionality = params.get("dimensionality", 3)
+        sampled = params.get(f"{stage}_sampling_strategy", "None") in {
+            "Regular",
+            "Random",
+        }
+        rate = params.get(f"{stage}_sampling_rate", 1.0) if sampled else 1.0
+        samples = num_voxels if num_samples is None else num_samples
+        metric_cost = self.metric_costs[params[f"{stage}_metric"]]
+        work = 0.0
+        for iterations, shrink_factor in zip(
+            params[f"{stage}_num_iterations"], params[f"{stage}_shrink_factors"]
+        ):
+            scale = shrink_factor**dimensionality
+            work += iterations * samples / scale * rate * metric_cost
+            if stage == "syn":
+                work += iterations * num_voxels / scale * self.syn_voxel_cost
+            work += num_voxels * self.level_voxel_cost
+        return work
+
+    def estimate(
+        self,
+        params: Mapping,
+        num_voxels: int,
+        num_threads: int = 1,
+        num_samples: Optional[int] = None,
+    ) -> float:
+        """Estimated wall time in seconds of a registration with these parameters.
+
+        `params` holds `Registration` inputs, `num_voxels` is the size of the fixed image
+        and `num_samples` the number of voxels inside the fixed mask, if any.
+        """
+        work = sum(
+            self.stage_work(params, stage, num_voxels, num_samples) for stage in _STAGES
+        )
+        speedup = 1 / (
+            (1 - self.parallel_fraction) + self.parallel_fraction / num_threads
+        )
+        return self.overhead + work / speedup
@@ -2,12 +2,13 @@ from os import PathLike
 
 from attrs import define, field
 from pydra.engine.specs import ShellSpec, SpecInfo
-from pydra.engine.task import ShellCommandTask
+
+from ._resources import MeasuredShellCommandTask
 
 __all__ = ["CreateJacobianDeterminantImage"]
 
 
-class CreateJacobianDeterminantImage(ShellCommandTask):
+class CreateJacobianDeterminantImage(MeasuredShellCommandTask):
     """Task definition for CreateJacobianDeterminantImage.
 
     Examples
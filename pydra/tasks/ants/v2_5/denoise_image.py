@@ -0,0 +1,312 @@
+from os import PathLike
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import nibabel as nib
+import numpy as np
+import pydra
+from attrs import NOTHING, define, field
+from pydra.engine.specs import File, ShellSpec, SpecInfo
+
+from . import _image
+from ._resources import MeasuredShellCommandTask
+
+__all__ = ["DenoiseImage", "denoise_image_tiled"]
+
+
+class DenoiseImage(MeasuredShellCommandTask):
+    """Task definition for DenoiseImage.
+
+    Examples
+    --------
+    >>> task = DenoiseImage(dimensionality=3, input_image="input.nii")
+    >>> task.cmdline    # doctest: +ELLIPSIS
+    'DenoiseImage -d 3 -i input.nii -n Gaussian -s 1 -p 1 -r 2 -o .../input_denoised.nii -v 0'
+
+    >>> task = DenoiseImage(
+    ...     dimensionality=3,
+    ...     input_image="input.nii",
+    ...     noise_model="Rician",
+    ...     save_noise=True,
+    ... )
+    >>> task.cmdline    # doctest: +ELLIPSIS
+    'DenoiseImage ... -n Rician ... -o [.../input_denoised.nii,.../input_noise.nii] -v 0'
+    """
+
+    @define(kw_only=True)
+    class InputSpec(ShellSpec):
+        dimensionality: int = field(
+            metadata={
+                "help_string": "image dimensionality",
+                "argstr": "-d",
+                "allowed_values": {2, 3, 4},
+            }
+        )
+
+        input_image: PathLike = field(
+            metadata={"help_string": "input image", "mandatory": True, "argstr": "-i"}
+        )
+
+        noise_model: str = field(
+            default="Gaussian",
+            metadata={
+                "help_string": "noise model",
+                "argstr": "-n",
+                "allowed_values": {"Gaussian", "Rician"},
+            },
+        )
+
+        mask_image: PathLike = field(
+            metadata={"help_string": "mask image", "argstr": "-x"}
+        )
+
+        shrink_factor: int = field(
+            default=1, metadata={"help_string": "shrink factor", "argstr": "-s"}
+        )
+
+        patch_radius: int = field(
+            default=1, metadata={"help_string": "patch radius", "argstr": "-p"}
+        )
+
+        search_radius: int = field(
+            default=2, metadata={"help_string": "search radius", "argstr": "-r"}
+        )
+
+        output_: str = field(
+            metadata={
+                "help_string": "output parameters",
+                "readonly": True,
+                "formatter": lambda output_image, save_noise, output_noise_image: (
+                    f"-o [{output_image},{output_noise_image}]"
+                    if save_noise
+                    else f"-o {output_image}"
+                ),
+            }
+        )
+
+        output_image: str = field(
+            metadata={
+                "help_string": "output image",
+                "output_file_template": "{input_image}_denoised",
+            }
+        )
+
+        save_noise: bool = field(metadata={"help_string": "save estimated noise image"})
+
+        output_noise_image: str = field(
+            metadata={
+                "help_string": "output noise image",
+                "output_file_template": "{input_image}_noise",
+                "requires": ["save_noise"],
+            }
+        )
+
+        verbose: bool = field(
+            default=False,
+            metadata={
+                "help_string": "enable verbose output",
+                "formatter": lambda verbose: f"-v {verbose:d}",
+            },
+        )
+
+    input_spec = SpecInfo(name="Input", bases=(InputSpec,))
+
+    executable = "DenoiseImage"
+
+    non_semantic_inputs = ("verbose",)
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"tiles": list}})
+def _tile_image(input_image: File, tile_shape: list, halo: int) -> list:
+    shape = nib.load(input_image).shape
+    return _image.tile_grid(shape, tile_shape, halo)
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"input_image": File, "mask_image": Optional[File]}})
+def _extract_tile(input_image: File, mask_image: Optional[File], tile: list):
+    box = [[start, stop] for _, _, start, stop in tile]
+    suffix = "_tile" + "_".join(str(start) for start, _ in box)
+    return (
+        _image.crop_image(
+            input_image, box, _image.output_path(input_image, suffix, ".nii")
+        ),
+        (
+            _image.crop_image(
+                mask_image, box, _image.output_path(mask_image, suffix, ".nii")
+            )
+            if mask_image
+            else None
+        ),
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"output_image": File}})
+def _stitch_tiles(
+    input_image: File, tiles: list, tile_images: list, blend_width: int
+) -> Path:
+    reference = nib.load(input_image)
+    shape = reference.shape
+    # Accumulate in memory-mapped arrays so that the full volume is never held in RAM
+    weighted_sum = np.lib.format.open_memmap(
+        "weighted_sum.npy", mode="w+", dtype=np.float32, shape=shape
+    )
+    weight_sum = np.lib.format.open_memmap(
+        "weight_sum.npy", mode="w+", dtype=np.float32, shape=shape[: len(tiles[0])]
+    )
+    for tile, tile_image in zip(tiles, tile_images):
+        slices = _image.box_slices([[start, stop] for _, _, start, stop in tile])
+        weights = _image.blend_weights(tile, shape, blend_width)
+        data = nib.load(tile_image).get_fdata(dtype=np.float32)
+        weighted_sum[slices] += data * weights.reshape(
+            weights.shape + (1,) * (data.ndim - weights.ndim)
+        )
+        weight_sum[slices] += weights
+    # Normalised plane by plane, so that temporaries stay bounded by a single plane
+    for index in range(shape[0]):
+        weights = weight_sum[index]
+        weights[weights == 0] = 1
+        weighted_sum[index] /= weights.reshape(
+            weights.shape + (1,) * (weighted_sum.ndim - weight_sum.ndim)
+        )
+    header = reference.header.copy()
+    header.set_data_dtype(np.float32)
+    output_image = _image.output_path(input_image, "_denoised")
+    nib.save(nib.Nifti1Image(weighted_sum, reference.affine, header), output_image)
+    del weighted_sum, weight_sum
+    Path("weighted_sum.npy").unlink()
+    Path("weight_sum.npy").unlink()
+    return output_image
+
+
+def denoise_image_tiled(
+    *,
+    dimensionality: int,
+    input_image: PathLike,
+    mask_image: Optional[PathLike] = None,
+    patch_radius: int = 1,
+    search_radius: int = 2,
+    shrink_factor: int = 1,
+    tile_shape: Optional[Sequence[int]] = None,
+    blend_width: int = 8,
+    name: str = "denoise_image",
+    **kwargs,
+) -> Union[DenoiseImage, pydra.Workflow]:
+    """Returns a task for non-local means denoising, optionally split into tiles.
+
+    With `tile_shape` provided, the image is split into blocks extended by a halo
+    covering the patch and search neighbourhoods, each block is denoised by a separate
+    `DenoiseImage` task so that blocks run in parallel, and the denoised blocks are
+    stitched back with linear cross-fading across the seams. Each task only loads a
+    single block, and the stitched image is accumulated in memory-mapped arrays.
+
+    Parameters
+    ----------
+    dimensionality : {2, 3, 4}
+        Image dimensionality.
+    input_image : path_like
+        Image to denoise.
+    mask_image : path_like, optional
+        Mask restricting the denoised voxels.
+    patch_radius : int, default=1
+        Patch radius in voxels.
+    search_radius : int, default=2
+        Search radius in voxels.
+    shrink_factor : int, default=1
+        Shrink factor applied to the image before denoising.
+    tile_shape : sequence of int, optional
+        Shape of the tiles in voxels, excluding the halo, one value per tiled axis.
+        Trailing axes not covered by `tile_shape` are not tiled.
+    blend_width : int, default=8
+        Width in voxels of the cross-fade applied across seams between tiles.
+    name : str, default="denoise_image"
+        Name of the returned task.
+    **kwargs : dict, optional
+        Extra arguments passed to the `DenoiseImage` constructor.
+
+    Returns
+    -------
+    DenoiseImage or Workflow
+        The configured task, or a workflow with an `output_image` output when tiling
+        is enabled.
+
+    Examples
+    --------
+    >>> task = denoise_image_tiled(dimensionality=3, input_image="input.nii")
+    >>> task.cmdline    # doctest: +ELLIPSIS
+    'DenoiseImage -d 3 -i input.nii -n Gaussian -s 1 -p 1 -r 2 ...'
+
+    >>> wf = denoise_image_tiled(
+    ...     dimensionality=3, input_image="input.nii", tile_shape=(256, 256, 256)
+    ... )
+    >>> wf.output_names
+    ['output_image']
+    """
+    task_kwargs = dict(
+        dimensionality=dimensionality,
+        patch_radius=patch_radius,
+        search_radius=search_radius,
+        shrink_factor=shrink_factor,
+        **kwargs,
+    )
+
+    if tile_shape is None:
+        return DenoiseImage(
+            name=name,
+            input_image=input_image,
+            mask_image=mask_image or NOTHING,
+            **task_kwargs,
+        )
+
+    # Voxels closer to the tile border than the patch and search neighbourhoods are
+    # biased, so the halo covers those plus half of the cross-fade.
+    halo = (patch_radius + search_radius) * shrink_factor + (blend_width + 1) // 2
+
+    wf = pydra.Workflow(
+        name=name,
+        input_spec=["input_image", "mask_image"],
+        input_image=input_image,
+        mask_image=mask_image,
+    )
+
+    wf.add(
+        _tile_image(
+            name="tile",
+            input_image=wf.lzin.input_image,
+            tile_shape=list(tile_shape),
+            halo=halo,
+        )
+    )
+
+    wf.add(
+        _extract_tile(
+            name="extract",
+            input_image=wf.lzin.input_image,
+            mask_image=wf.lzin.mask_image,
+        ).split("tile", tile=wf.tile.lzout.tiles)
+    )
+
+    wf.add(
+        DenoiseImage(
+            name="denoise",
+            input_image=wf.extract.lzout.input_image,
+            mask_image=wf.extract.lzout.mask_image if mask_image else NOTHING,
+            **task_kwargs,
+        ).combine("extract.tile")
+    )
+
+    wf.add(
+        _stitch_tiles(
+            name="stitch",
+            input_image=wf.lzin.input_image,
+            tiles=wf.tile.lzout.tiles,
+            tile_images=wf.denoise.lzout.output_image,
+            blend_width=blend_width,
+        )
+    )
+
+    wf.set_output([("output_image", wf.stitch.lzout.output_image)])
+
+    return wf
@@ -0,0 +1,349 @@
+"""
+Lazy voxelwise image expressions
+================================
+
+Chains of voxelwise operations, such as `ThresholdImage`, `MultiplyImages`, `ImageMath`
+and `AverageImages`, are recorded as an expression graph instead of being run one after
+the other. The whole graph is then evaluated in a single chunked pass over memory-mapped
+inputs, and only the final image is written to disk.
+
+Operations without an in-process kernel are delegated to the `ImageMath` command line
+tool, with their operands evaluated to intermediate images first.
+
+>>> expr = (image("t1.nii.gz").threshold(100, 1000) * image("mask.nii.gz")).image_math("MD", 2)
+>>> expr
+ImageMath('MD', multiply(threshold(image('t1.nii.gz'), 100, 1000, 1, 0), image('mask.nii.gz')), 2)
+"""
+
+import operator
+import tempfile
+from os import PathLike
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import nibabel as nib
+import numpy as np
+import pydra
+from attrs import define, field
+from pydra.engine.specs import File
+
+from . import _image
+from .image_math import ImageMath
+
+__all__ = [
+    "Expression",
+    "average_images",
+    "evaluate_expression",
+    "image",
+    "multiply_images",
+    "threshold_image",
+]
+
+
+def _divide(a, b):
+    # ImageMath sets voxels with a zero denominator to zero
+    a, b = np.broadcast_arrays(a, b)
+    return np.divide(a, b, out=np.zeros(a.shape, dtype=np.float64), where=b != 0)
+
+
+def _threshold(x, lower, upper, inside, outside):
+    return np.where((x >= lower) & (x <= upper), inside, outside)
+
+
+def _replace(x, lower, upper, value):
+    return np.where((x >= lower) & (x <= upper), value, x)
+
+
+def _mean(*operands):
+    return sum(operands) / len(operands)
+
+
+_KERNELS = {
+    "add": operator.add,
+    "subtract": operator.sub,
+    "multiply": operator.mul,
+    "divide": _divide,
+    "power": np.power,
+    "negative": np.negative,
+    "abs": np.abs,
+    "exp": np.exp,
+    "log": np.log,
+    "threshold": _threshold,
+    "replace": _replace,
+    "mean": _mean,
+}
+
+# ImageMath operations with an in-process kernel
+_IMAGE_MATH_KERNELS = {
+    "m": "multiply",
+    "+": "add",
+    "-": "subtract",
+    "/": "divide",
+    "^": "power",
+    "abs": "abs",
+    "exp": "exp",
+    "log": "log",
+    "ReplaceVoxelValue": "replace",
+}
+
+
+def _as_expression(value) -> "Expression":
+    return value if isinstance(value, Expression) else constant(value)
+
+
+@define(frozen=True)
+class Expression:
+    """Node of a lazy voxelwise expression graph.
+
+    Expressions are built with `image` and the operators and methods below, and
+    evaluated with `evaluate`.
+    """
+
+    operation: str
+    operands: tuple = field(default=(), converter=tuple)
+    arguments: tuple = field(default=(), converter=tuple)
+
+    def __add__(self, other):
+        return Expression("add", (self, _as_expression(other)))
+
+    def __radd__(self, other):
+        return Expression("add", (_as_expression(other), self))
+
+    def __sub__(self, other):
+        return Expression("subtract", (self, _as_expression(other)))
+
+    def __rsub__(self, other):
+        return Expression("subtract", (_as_expression(other), self))
+
+    def __mul__(self, other):
+        return Expression("multiply", (self, _as_expression(other)))
+
+    def __rmul__(self, other):
+        return Expression("multiply", (_as_expression(other), self))
+
+    def __truediv__(self, other):
+        return Expression("divide", (self, _as_expression(other)))
+
+    def __rtruediv__(self, other):
+        return Expression("divide", (_as_expression(other), self))
+
+    def __pow__(self, other):
+        return Expression("power", (self, _as_expression(other)))
+
+    def __neg__(self):
+        return Expression("negative", (self,))
+
+    def __abs__(self):
+        return Expression("abs", (self,))
+
+    def __repr__(self):
+        if self.operation == "image":
+            return f"image({str(self.arguments[0])!r})"
+        if self.operation == "constant":
+            return repr(self.arguments[0])
+        if self.operation == "ImageMath":
+            operation, *arguments = self.arguments
+            return "ImageMath({})".format(
+                ", ".join(
+                    [repr(operation)]
+                    + [repr(o) for o in self.operands]
+                    + [repr(a) for a in arguments]
+                )
+            )
+        return "{}({})".format(
+            self.operation,
+            ", ".join(
+                [repr(o) for o in self.operands] + [repr(a) for a in self.arguments]
+            ),
+        )
+
+    def threshold(
+        self, lower: float, upper: float, inside: float = 1, outside: float = 0
+    ) -> "Expression":
+        """Binary threshold, as done by `ThresholdImage`."""
+        return Expression("threshold", (self,), (lower, upper, inside, outside))
+
+    def image_math(self, operation: str, *arguments) -> "Expression":
+        """Apply an `ImageMath` operation.
+
+        Image operands may be passed as expressions in `arguments`. Operations without
+        an in-process kernel are run with the `ImageMath` command line tool.
+        """
+        if operation in _IMAGE_MATH_KERNELS:
+            kernel = _IMAGE_MATH_KERNELS[operation]
+            if kernel == "replace":
+                return Expression(kernel, (self,), arguments)
+            return Expression(
+                kernel, (self,) + tuple(_as_expression(a) for a in arguments)
+            )
+        return Expression(
+            "ImageMath",
+            (self,) + tuple(a for a in arguments if isinstance(a, Expression)),
+            (operation,) + tuple(a for a in arguments if not isinstance(a, Expression)),
+        )
+
+    @property
+    def sources(self) -> list:
+        """Paths of the images the expression depends on."""
+        if self.operation == "image":
+            return [self.arguments[0]]
+        return list(
+            dict.fromkeys(path for o in self.operands for path in o.sources).keys()
+        )
+
+    def evaluate(
+        self,
+        output_image: PathLike,
+        dtype: str = "float32",
+        max_voxels: int = 2**24,
+        work_dir: Optional[PathLike] = None,
+    ) -> Path:
+        """Evaluate the expression and write the result to `output_image`.
+
+        Parameters
+        ----------
+        output_image : path_like
+            Output image, compressed if its name ends with `.gz`.
+        dtype : str, default="float32"
+            Data type of the output image.
+        max_voxels : int, default=2**24
+            Maximum number of voxels per input held in memory at once.
+        work_dir : path_like, optional
+            Directory for intermediate images of command line fallbacks. A temporary
+            directory is used by default.
+        """
+        with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+            expr = self._resolve(Path(tmp_dir), dtype, max_voxels)
+            return expr._evaluate_fused(output_image, dtype, max_voxels)
+
+    def _resolve(self, work_dir: Path, dtype: str, max_voxels: int) -> "Expression":
+        """Replace operations without a kernel with the output of `ImageMath`."""
+        if self.operation in {"image", "constant"}:
+            return self
+        operands = tuple(o._resolve(work_dir, dtype, max_voxels) for o in self.operands)
+        if self.operation != "ImageMath":
+            return Expression(self.operation, operands, self.arguments)
+        inputs = []
+        for index, operand in enumerate(operands):
+            if operand.operation != "image":
+                operand = image(
+                    operand._evaluate_fused(
+                        work_dir / f"operand{id(self)}_{index}.nii", dtype, max_voxels
+                    )
+                )
+            inputs.append(operand.arguments[0])
+        operation, *arguments = self.arguments
+        task = ImageMath(
+            dimensionality=min(len(nib.load(inputs[0]).shape), 4),
+            operation=operation,
+            input_image=inputs[0],
+            arguments=inputs[1:] + arguments,
+            cache_dir=work_dir,
+        )
+        return image(task().output.output_image)
+
+    def _evaluate_fused(
+        self, output_image: PathLike, dtype: str, max_voxels: int
+    ) -> Path:
+        images = {path: nib.load(path) for path in self.sources}
+        if not images:
+            raise ValueError("expression does not depend on any image")
+        reference = next(iter(images.values()))
+        for path, img in images.items():
+            if img.shape != reference.shape:
+                raise ValueError(
+                    f"shape of {path} {img.shape} differs from {reference.shape}"
+                )
+
+        def slabs():
+            for start, stop in _image.slab_ranges(reference.shape, max_voxels):
+                index = (slice(None),) * (len(reference.shape) - 1) + (
+                    slice(start, stop),
+                )
+                leaves = {
+                    path: np.asarray(img.dataobj[index], dtype=np.float64)
+                    for path, img in images.items()
+                }
+                yield np.broadcast_to(
+                    self._evaluate_chunk(leaves), leaves[next(iter(leaves))].shape
+                )
+
+        return _image.write_slabs(
+            output_image,
+            reference.shape,
+            reference.affine,
+            np.dtype(dtype),
+            slabs(),
+            header=reference.header,
+        )
+
+    def _evaluate_chunk(self, leaves: dict):
+        if self.operation == "image":
+            return leaves[self.arguments[0]]
+        if self.operation == "constant":
+            return self.arguments[0]
+        return _KERNELS[self.operation](
+            *(o._evaluate_chunk(leaves) for o in self.operands), *self.arguments
+        )
+
+
+def image(path: PathLike) -> Expression:
+    """Expression reading an image from disk."""
+    return Expression("image", (), (str(path),))
+
+
+def constant(value: float) -> Expression:
+    """Expression holding a constant value."""
+    return Expression("constant", (), (value,))
+
+
+def threshold_image(
+    expr: Union[Expression, PathLike],
+    lower: float,
+    upper: float,
+    inside: float = 1,
+    outside: float = 0,
+) -> Expression:
+    """Lazy equivalent of `ThresholdImage`.
+
+    >>> threshold_image("t1.nii.gz", 0.5, 1.0)
+    threshold(image('t1.nii.gz'), 0.5, 1.0, 1, 0)
+    """
+    if not isinstance(expr, Expression):
+        expr = image(expr)
+    return expr.threshold(lower, upper, inside, outside)
+
+
+def multiply_images(
+    first: Union[Expression, PathLike], second: Union[Expression, PathLike, float]
+) -> Expression:
+    """Lazy equivalent of `MultiplyImages`.
+
+    >>> multiply_images("t1.nii.gz", 2.0)
+    multiply(image('t1.nii.gz'), 2.0)
+    """
+    if not isinstance(first, Expression):
+        first = image(first)
+    if not isinstance(second, (Expression, int, float)):
+        second = image(second)
+    return first * second
+
+
+def average_images(images: Sequence[Union[Expression, PathLike]]) -> Expression:
+    """Lazy equivalent of `AverageImages` without intensity normalization.
+
+    >>> average_images(["a.nii", "b.nii"])
+    mean(image('a.nii'), image('b.nii'))
+    """
+    return Expression(
+        "mean", [i if isinstance(i, Expression) else image(i) for i in images]
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"output_image": File}})
+def evaluate_expression(
+    expression: Expression, output_image: str, dtype: str = "float32"
+) -> Path:
+    """Task evaluating an image expression into `output_image`."""
+    return expression.evaluate(Path.cwd() / output_image, dtype=dtype)
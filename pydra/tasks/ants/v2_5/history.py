@@ -0,0 +1,347 @@
+import json
+import os
+import socket
+import sqlite3
+from os import PathLike
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from warnings import warn
+
+import attrs
+import nibabel as nib
+from attrs import define
+
+from . import _image
+
+__all__ = ["ImageGeometry", "Run", "RunHistory", "default_history_path"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    executable TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    host TEXT NOT NULL,
+    num_threads INTEGER,
+    precision TEXT,
+    started REAL,
+    wall_time REAL,
+    user_time REAL,
+    system_time REAL,
+    peak_rss REAL,
+    read_bytes INTEGER,
+    write_bytes INTEGER,
+    exit_status INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_executable ON runs (executable, started);
+CREATE TABLE IF NOT EXISTS images (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    input TEXT NOT NULL,
+    path TEXT NOT NULL,
+    shape TEXT NOT NULL,
+    spacing TEXT NOT NULL,
+    num_voxels INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_run_id ON images (run_id);
+"""
+
+
+def default_history_path() -> Optional[Path]:
+    """Database recording task runs, or None if recording is disabled.
+
+    Recording is opt-in, the database being `$PYDRA_ANTS_HISTORY` if set and not empty.
+    SQLite relies on file locks that network file systems may not honour, so it should
+    be on a local file system of the node running the tasks.
+    """
+    path = os.environ.get("PYDRA_ANTS_HISTORY")
+    return Path(path) if path else None
+
+
+@define(frozen=True)
+class ImageGeometry:
+    """Grid of an input image of a run."""
+
+    input: str
+    """Name of the input."""
+
+    path: str
+    """Path of the image."""
+
+    shape: Tuple[int, ...]
+    """Number of voxels along each axis."""
+
+    spacing: Tuple[float, ...]
+    """Voxel size along each axis."""
+
+    @property
+    def num_voxels(self) -> int:
+        """Total number of voxels."""
+        num_voxels = 1
+        for size in self.shape:
+            num_voxels *= size
+        return num_voxels
+
+
+@define(frozen=True)
+class Run:
+    """Recorded execution of an ANTs command."""
+
+    id: int
+    """Identifier of the run in the database."""
+
+    task: str
+    """Name of the task class, e.g. `Registration`."""
+
+    executable: str
+    """Name of the command, e.g. `antsRegistration`."""
+
+    arguments: str
+    """Rendered command line."""
+
+    inputs: Mapping[str, Any]
+    """Values of the task inputs, with paths as strings."""
+
+    host: str
+    """Host name of the machine running the command."""
+
+    num_threads: Optional[int]
+    """Threads available to the command, from `ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS`
+    if set, or the CPU affinity of the process otherwise."""
+
+    precision: Optional[str]
+    """Either `float` or `double` for tasks with a precision input, None otherwise."""
+
+    started: Optional[float]
+    """Start time in seconds since the epoch."""
+
+    wall_time: float
+    """Elapsed time in seconds."""
+
+    user_time: float
+    """CPU time in user mode in seconds."""
+
+    system_time: float
+    """CPU time in kernel mode in seconds."""
+
+    peak_rss: float
+    """Peak resident memory in MiB."""
+
+    read_bytes: int
+    """Bytes read by system calls."""
+
+    write_bytes: int
+    """Bytes written by system calls."""
+
+    exit_status: int
+    """Exit code of the command, negated signal number if killed."""
+
+    images: Tuple[ImageGeometry, ...] = ()
+    """Geometry of the input images."""
+
+
+def num_threads() -> Optional[int]:
+    """Threads available to ANTs commands started by this process."""
+    if "ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS" in os.environ:
+        return int(os.environ["ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"])
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def task_inputs(task) -> Tuple[Dict[str, Any], List[ImageGeometry]]:
+    """Inputs set on a shell command task and the geometry of its input images."""
+    inputs = {
+        name: value
+        for name, value in attrs.asdict(task.inputs, recurse=False).items()
+        if value not in (None, attrs.NOTHING) and not name.startswith("_")
+    }
+    outputs = {
+        field.name
+        for field in attrs.fields(type(task.inputs))
+        if "output_file_template" in field.metadata
+    }
+    images = []
+    for name, value in inputs.items():
+        if name in outputs:
+            continue
+        for path in value if isinstance(value, (list, tuple)) else [value]:
+            if not isinstance(path, (str, os.PathLike)):
+                continue
+            if _image.split_extension(path)[1] not in _image._NIFTI_EXTENSIONS:
+                continue
+            try:
+                header = nib.load(path).header
+            except (OSError, nib.filebasedimages.ImageFileError):
+                continue
+            images.append(
+                ImageGeometry(
+                    input=name,
+                    path=str(path),
+                    shape=tuple(int(size) for size in header.get_data_shape()),
+                    spacing=tuple(float(size) for size in header.get_zooms()),
+                )
+            )
+    return inputs, images
+
+
+class RunHistory:
+    """SQLite database of ANTs command executions.
+
+    Every task run by the `Measured` environment is recorded in `default_history_path`
+    if set, from any process, so the database should live on a local file system.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> import numpy as np
+    >>> from pydra.tasks.ants.v2_5 import ImageMath
+    >>> from pydra.tasks.ants.v2_5._resources import ResourceUsage
+    >>> tmp_dir = Path(tempfile.mkdtemp())
+    >>> image = tmp_dir / "image.nii.gz"
+    >>> nib.save(nib.Nifti1Image(np.zeros((4, 5, 6)), np.diag([1, 1, 2, 1])), image)
+    >>> history = RunHistory(tmp_dir / "history.sqlite")
+    >>> task = ImageMath(dimensionality=3, operation="Normalize", input_image=image)
+    >>> history.record(task, ResourceUsage(12.0, 10.0, 1.0, 256.0), exit_status=0)
+    1
+    >>> [run] = history.query(executable="ImageMath")
+    >>> run.wall_time, run.images[0].shape, run.images[0].spacing
+    (12.0, (4, 5, 6), (1.0, 1.0, 2.0))
+    """
+
+    def __init__(self, path: Optional[PathLike] = None):
+        path = path or default_history_path()
+        if path is None:
+            raise ValueError("no database given and $PYDRA_ANTS_HISTORY is not set")
+        self.path = Path(path)
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Workers of a run write concurrently, wait for each other's transactions
+        connection = sqlite3.connect(self.path, timeout=60)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def record(self, task, usage, exit_status: int) -> int:
+        """Record a run of a shell command task with its resource usage."""
+        inputs, images = task_inputs(task)
+        precision = inputs.get("use_float_precision")
+        connection = self._connect()
+        with connection:
+            run_id = connection.execute(
+                "INSERT INTO runs (task, executable, arguments, inputs, host, "
+                "num_threads, precision, started, wall_time, user_time, system_time, "
+                "peak_rss, read_bytes, write_bytes, exit_status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    type(task).__name__,
+                    task.inputs.executable,
+                    task.cmdline,
+                    json.dumps(inputs, default=str),
+                    socket.gethostname(),
+                    num_threads(),
+                    None if precision is None else ("float" if precision else "double"),
+                    usage.start_time,
+                    usage.wall_time,
+                    usage.user_time,
+                    usage.system_time,
+                    usage.peak_rss,
+                    usage.read_bytes,
+                    usage.write_bytes,
+                    exit_status,
+                ),
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO images VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        image.input,
+                        image.path,
+                        json.dumps(image.shape),
+                        json.dumps(image.spacing),
+                        image.num_voxels,
+                    )
+                    for image in images
+                ],
+            )
+        connection.close()
+        return run_id
+
+    def query(
+        self,
+        executable: Optional[str] = None,
+        task: Optional[str] = None,
+        host: Optional[str] = None,
+        since: Optional[float] = None,
+        succeeded: Optional[bool] = None,
+        limit: Optional[int] = None,
+    ) -> List[Run]:
+        """Recorded runs matching all given criteria, most recent last.
+
+        Parameters
+        ----------
+        executable : str, optional
+            Name of the command, e.g. `antsRegistration`.
+        task : str, optional
+            Name of the task class, e.g. `Registration`.
+        host : str, optional
+            Host name of the runs.
+        since : float, optional
+            Earliest start time, in seconds since the epoch.
+        succeeded : bool, optional
+            Select successful runs if true, failed runs if false.
+        limit : int, optional
+            Return only the most recent runs.
+        """
+        clauses, parameters = [], []
+        for clause, value in [
+            ("executable = ?", executable),
+            ("task = ?", task),
+            ("host = ?", host),
+            ("started >= ?", since),
+        ]:
+            if value is not None:
+                clauses.append(clause)
+                parameters.append(value)
+        if succeeded is not None:
+            clauses.append("exit_status = 0" if succeeded else "exit_status != 0")
+        query = "SELECT * FROM runs"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY id DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        connection = self._connect()
+        connection.row_factory = sqlite3.Row
+        runs = []
+        for row in reversed(connection.execute(query, parameters).fetchall()):
+            images = tuple(
+                ImageGeometry(
+                    input=image["input"],
+                    path=image["path"],
+                    shape=tuple(json.loads(image["shape"])),
+                    spacing=tuple(json.loads(image["spacing"])),
+                )
+                for image in connection.execute(
+                    "SELECT * FROM images WHERE run_id = ?", (row["id"],)
+                )
+            )
+            runs.append(
+                Run(**dict(row, inputs=json.loads(row["inputs"])), images=images)
+            )
+        connection.close()
+        return runs
+
+
+def record_run(task, usage, exit_status: int):
+    """Record a run in the default history, warning instead of failing the task."""
+    path = default_history_path()
+    if path is None:
+        return
+    try:
+        RunHistory(path).record(task, usage, exit_status)
+    except Exception as error:
+        warn(f"could not record the run of {task.name} in {path}: {error}")
@@ -0,0 +1,69 @@
+from os import PathLike
+from typing import Sequence
+
+from attrs import define, field
+from pydra.engine.specs import ShellSpec, SpecInfo
+
+from ._resources import MeasuredShellCommandTask
+
+__all__ = ["ImageMath"]
+
+
+class ImageMath(MeasuredShellCommandTask):
+    """Task definition for ImageMath.
+
+    Examples
+    --------
+    >>> task = ImageMath(dimensionality=3, operation="Normalize", input_image="input.nii")
+    >>> task.cmdline  # doctest: +ELLIPSIS
+    'ImageMath 3 .../input_maths.nii Normalize input.nii'
+
+    >>> task = ImageMath(
+    ...     dimensionality=3,
+    ...     operation="MD",
+    ...     input_image="mask.nii.gz",
+    ...     arguments=[2],
+    ... )
+    >>> task.cmdline  # doctest: +ELLIPSIS
+    'ImageMath 3 .../mask_maths.nii.gz MD mask.nii.gz 2'
+    """
+
+    @define(kw_only=True)
+    class InputSpec(ShellSpec):
+        dimensionality: int = field(
+            metadata={
+                "help_string": "image dimensionality",
+                "mandatory": True,
+                "argstr": "",
+                "allowed_values": {2, 3, 4},
+            }
+        )
+
+        output_image: str = field(
+            metadata={
+                "help_string": "output image",
+                "argstr": "",
+                "output_file_template": "{input_image}_maths",
+            }
+        )
+
+        operation: str = field(
+            metadata={"help_string": "operation", "mandatory": True, "argstr": ""}
+        )
+
+        input_image: PathLike = field(
+            metadata={"help_string": "input image", "mandatory": True, "argstr": ""}
+        )
+
+        arguments: Sequence = field(
+            metadata={
+                "help_string": "additional operands of the operation",
+                "formatter": lambda arguments: (
+                    " ".join(str(a) for a in arguments) if arguments else ""
+                ),
+            }
+        )
+
+    input_spec = SpecInfo(name="Input", bases=(InputSpec,))
+
+    executable = "ImageMath"
@@ -0,0 +1,224 @@
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import nibabel as nib
+import numpy as np
+import pydra
+from pydra.engine.specs import File
+
+from . import _image
+
+__all__ = ["label_geometry", "label_geometry_table", "label_geometry_batch"]
+
+_AXES = "xyz"
+
+
+def _reduce_slab(labels: np.ndarray, offset: int):
+    """Per-label voxel counts, coordinate sums and extents for one slab."""
+    values, inverse = np.unique(labels.ravel(), return_inverse=True)
+    counts = np.bincount(inverse, minlength=values.size)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    sums, lower, upper = [], [], []
+    for axis, size in enumerate(labels.shape):
+        coords = np.arange(size) + (offset if axis == labels.ndim - 1 else 0)
+        coords = np.broadcast_to(
+            coords.reshape((-1,) + (1,) * (labels.ndim - axis - 1)), labels.shape
+        ).ravel()
+        sums.append(np.bincount(inverse, weights=coords, minlength=values.size))
+        sorted_coords = coords[order]
+        lower.append(np.minimum.reduceat(sorted_coords, starts))
+        upper.append(np.maximum.reduceat(sorted_coords, starts))
+    return values, counts, np.array(sums), np.array(lower), np.array(upper)
+
+
+def label_geometry(
+    label_image: PathLike, background: int = 0, max_voxels: int = 2**24
+) -> Dict[str, np.ndarray]:
+    """Compute the volume, centroid and bounding box of every label of an image.
+
+    The label image is read in slabs of at most `max_voxels` voxels, memory-mapped when
+    uncompressed, and statistics of all labels are obtained with vectorised
+    `bincount`-style reductions over each slab.
+
+    Parameters
+    ----------
+    label_image : path_like
+        Integer label image.
+    background : int, default=0
+        Label excluded from the statistics.
+    max_voxels : int, default=2**24
+        Maximum number of voxels read at once.
+
+    Returns
+    -------
+    dict of str to ndarray
+        Columns `label`, `voxel_count`, `volume` (in mm³), `centroid_{x,y,z}` (in
+        world coordinates), `bbox_lower_{x,y,z}` and `bbox_upper_{x,y,z}` (inclusive
+        voxel indices), with one row per label sorted by label value.
+    """
+    img = nib.load(label_image)
+    ndim = min(len(img.shape), 3)
+    shape = img.shape[:ndim]
+    labels = np.empty(0, dtype=np.int64)
+    counts = np.empty(0, dtype=np.int64)
+    sums = np.empty((ndim, 0))
+    lower = np.empty((ndim, 0), dtype=np.int64)
+    upper = np.empty((ndim, 0), dtype=np.int64)
+    for start, stop in _image.slab_ranges(shape, max_voxels):
+        index = (slice(None),) * (ndim - 1) + (slice(start, stop),)
+        slab = np.asarray(img.dataobj[index]).astype(np.int64)
+        values, slab_counts, slab_sums, slab_lower, slab_upper = _reduce_slab(
+            slab, start
+        )
+        merged = np.union1d(labels, values)
+        old, new = np.searchsorted(merged, labels), np.searchsorted(merged, values)
+        merged_counts = np.zeros(merged.size, dtype=np.int64)
+        merged_sums = np.zeros((ndim, merged.size))
+        merged_lower = np.full((ndim, merged.size), np.iinfo(np.int64).max)
+        merged_upper = np.full((ndim, merged.size), -1, dtype=np.int64)
+        merged_counts[old] += counts
+        merged_counts[new] += slab_counts
+        merged_sums[:, old] += sums
+        merged_sums[:, new] += slab_sums
+        merged_lower[:, old] = lower
+        merged_lower[:, new] = np.minimum(merged_lower[:, new], slab_lower)
+        merged_upper[:, old] = upper
+        merged_upper[:, new] = np.maximum(merged_upper[:, new], slab_upper)
+        labels, counts, sums = merged, merged_counts, merged_sums
+        lower, upper = merged_lower, merged_upper
+
+    keep = labels != background
+    labels, counts = labels[keep], counts[keep]
+    sums, lower, upper = sums[:, keep], lower[:, keep], upper[:, keep]
+    voxel_centroids = np.zeros((3, labels.size))
+    voxel_centroids[:ndim] = sums / np.maximum(counts, 1)
+    centroids = nib.affines.apply_affine(img.affine, voxel_centroids.T).T
+    voxel_volume = float(np.prod(img.header.get_zooms()[:ndim]))
+
+    table = {
+        "label": labels,
+        "voxel_count": counts,
+        "volume": counts * voxel_volume,
+    }
+    for axis in range(ndim):
+        table[f"centroid_{_AXES[axis]}"] = centroids[axis]
+    for axis in range(ndim):
+        table[f"bbox_lower_{_AXES[axis]}"] = lower[axis]
+    for axis in range(ndim):
+        table[f"bbox_upper_{_AXES[axis]}"] = upper[axis]
+    return table
+
+
+def _concatenate(label_images: Sequence[PathLike], tables: Sequence[dict]) -> dict:
+    columns = {
+        "image": np.concatenate(
+            [
+                np.full(len(t["label"]), str(path), dtype=object)
+                for path, t in zip(label_images, tables)
+            ]
+        )
+    }
+    for name in tables[0]:
+        columns[name] = np.concatenate([t[name] for t in tables])
+    return columns
+
+
+def label_geometry_table(
+    label_images: Sequence[PathLike],
+    background: int = 0,
+    max_workers: Optional[int] = None,
+) -> Dict[str, np.ndarray]:
+    """Compute label statistics of many images in parallel processes.
+
+    Returns the columns of `label_geometry` for all images concatenated, with an extra
+    `image` column holding the path of the label image of each row.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> labels = np.zeros((4, 4, 4), dtype=np.int16)
+    >>> labels[:2, :2, :2], labels[3, 3, 1:] = 1, 2
+    >>> path = Path(tempfile.mkdtemp()) / "labels.nii.gz"
+    >>> nib.save(nib.Nifti1Image(labels, np.diag([2, 2, 2, 1])), path)
+    >>> table = label_geometry_table([path], max_workers=1)
+    >>> table["label"], table["volume"], table["centroid_z"]
+    (array([1, 2]), array([64., 24.]), array([1., 4.]))
+    """
+    label_images = list(label_images)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        tables = list(
+            executor.map(label_geometry, label_images, [background] * len(label_images))
+        )
+    return _concatenate(label_images, tables)
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"table": dict}})
+def _label_geometry_chunk(label_images: list, background: int) -> dict:
+    return _concatenate(
+        label_images, [label_geometry(path, background) for path in label_images]
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"table": dict, "output_file": File}})
+def _merge_tables(tables: list, output_file: str):
+    table = {name: np.concatenate([t[name] for t in tables]) for name in tables[0]}
+    output_file = Path.cwd() / output_file
+    with open(output_file, "w", newline="") as fobj:
+        writer = csv.writer(fobj)
+        writer.writerow(table.keys())
+        writer.writerows(zip(*table.values()))
+    return table, output_file
+
+
+def label_geometry_batch(
+    *,
+    label_images: Sequence[PathLike],
+    batch_size: int = 100,
+    background: int = 0,
+    output_file: str = "label_geometry.csv",
+    name: str = "label_geometry_batch",
+) -> pydra.Workflow:
+    """Returns a workflow computing label statistics for batches of label images.
+
+    Each batch of `batch_size` images is processed by a separate task with
+    `label_geometry`, and the results are merged into a single columnar table,
+    returned as `table` and written to `output_file`.
+
+    Examples
+    --------
+    >>> wf = label_geometry_batch(
+    ...     label_images=[f"sub-{i:05d}_labels.nii.gz" for i in range(10000)]
+    ... )
+    >>> wf.output_names
+    ['table', 'output_file']
+    """
+    batches = [
+        list(label_images[i : i + batch_size])
+        for i in range(0, len(label_images), batch_size)
+    ]
+
+    wf = pydra.Workflow(name=name, input_spec=["batches"], batches=batches)
+
+    wf.add(
+        _label_geometry_chunk(name="compute", background=background)
+        .split("label_images", label_images=wf.lzin.batches)
+        .combine("label_images")
+    )
+
+    wf.add(
+        _merge_tables(
+            name="merge", tables=wf.compute.lzout.table, output_file=output_file
+        )
+    )
+
+    wf.set_output(
+        [("table", wf.merge.lzout.table), ("output_file", wf.merge.lzout.output_file)]
+    )
+
+    return wf
@@ -0,0 +1,245 @@
+import math
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from attrs import define
+
+from . import history
+from .cost_model import CostModel
+from .history import ImageGeometry, Run, RunHistory
+
+__all__ = ["Prediction", "RuntimePredictor"]
+
+_Z_95 = 1.96
+
+
+@define(frozen=True)
+class Prediction:
+    """Expected resource usage of a task, with 95% prediction intervals."""
+
+    wall_time: float
+    """Expected elapsed time in seconds."""
+
+    wall_time_range: Tuple[float, float]
+    """Interval holding the elapsed time of 95% of runs."""
+
+    peak_rss: float
+    """Expected peak resident memory in MiB."""
+
+    peak_rss_range: Tuple[float, float]
+    """Interval holding the peak resident memory of 95% of runs."""
+
+    num_runs: int
+    """Number of recorded runs the prediction is fitted on."""
+
+
+@define(frozen=True)
+class _LogLinearModel:
+    """Least squares fit of the logarithm of a quantity, linear in the features."""
+
+    coefficients: np.ndarray
+    covariance: np.ndarray
+    sigma: float
+
+    @classmethod
+    def fit(cls, features: np.ndarray, values: np.ndarray) -> "_LogLinearModel":
+        targets = np.log(np.maximum(values, 1e-3))
+        coefficients, *_ = np.linalg.lstsq(features, targets, rcond=None)
+        covariance = np.linalg.pinv(features.T @ features)
+        residuals = targets - features @ coefficients
+        rank = np.linalg.matrix_rank(features)
+        dof = max(len(targets) - rank, 1)
+        return cls(
+            coefficients, covariance, float(np.sqrt(residuals @ residuals / dof))
+        )
+
+    def predict(self, features: np.ndarray) -> Tuple[float, Tuple[float, float]]:
+        mean = float(features @ self.coefficients)
+        # Residual spread plus the uncertainty of the fit at these features
+        spread = self.sigma * math.sqrt(
+            1 + float(features @ self.covariance @ features)
+        )
+        return math.exp(mean), (
+            math.exp(mean - _Z_95 * spread),
+            math.exp(mean + _Z_95 * spread),
+        )
+
+
+def _num_voxels(images: Sequence[ImageGeometry], executable: str) -> int:
+    """Size of the image driving the cost, the fixed image of registrations."""
+    if executable == "antsRegistration":
+        fixed = [image for image in images if image.input == "fixed_image"]
+        images = fixed or images
+    return max((image.num_voxels for image in images), default=1)
+
+
+class RuntimePredictor:
+    """Predict the runtime and memory of ANTs tasks from their recorded runs.
+
+    One model is fitted per executable on the successful runs of the `RunHistory`. The
+    logarithm of the wall time is linear in the logarithm of the work and of the number
+    of threads, the work being the number of voxels of the largest input image, or the
+    single-threaded `CostModel` estimate for `antsRegistration`, which accounts for its
+    stage schedules. The logarithm of the peak memory is linear in the logarithm of the
+    number of voxels and in the precision. Prediction intervals follow from the
+    residuals of the fit, widened away from the recorded runs.
+
+    Parameters
+    ----------
+    runs : sequence of Run, optional
+        Recorded runs, by default the successful runs of the default `RunHistory`.
+    min_runs : int, default=5
+        Fewest runs of an executable to fit its model.
+    cost_model : CostModel, optional
+        Model of the work of registrations, by default `CostModel()`.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> from pathlib import Path
+    >>> import nibabel as nib
+    >>> from pydra.tasks.ants.v2_5 import N4BiasFieldCorrection
+    >>> runs = [
+    ...     Run(
+    ...         id=index, task="N4BiasFieldCorrection",
+    ...         executable="N4BiasFieldCorrection", arguments="", inputs={}, host="",
+    ...         num_threads=threads, precision=None, started=None,
+    ...         wall_time=2e-5 * size**3 / threads**0.8, user_time=0.0,
+    ...         system_time=0.0, peak_rss=50 + 1e-5 * size**3, read_bytes=0,
+    ...         write_bytes=0, exit_status=0,
+    ...         images=(ImageGeometry("input_image", "", (size,) * 3, (1.0,) * 3),),
+    ...     )
+    ...     for index, (size, threads) in enumerate(
+    ...         [(64, 1), (64, 4), (128, 2), (128, 8), (192, 1), (192, 4), (256, 2)]
+    ...     )
+    ... ]
+    >>> predictor = RuntimePredictor(runs)
+    >>> predictor.executables
+    ['N4BiasFieldCorrection']
+    >>> image = Path(tempfile.mkdtemp()) / "image.nii.gz"
+    >>> nib.save(nib.Nifti1Image(np.zeros((160, 160, 160)), np.eye(4)), image)
+    >>> task = N4BiasFieldCorrection(dimensionality=3, input_image=image)
+    >>> prediction = predictor.predict(task, num_threads=4)
+    >>> round(prediction.wall_time), prediction.num_runs
+    (27, 7)
+    >>> low, high = prediction.peak_rss_range
+    >>> low < prediction.peak_rss < high
+    True
+    """
+
+    def __init__(
+        self,
+        runs: Optional[Sequence[Run]] = None,
+        min_runs: int = 5,
+        cost_model: Optional[CostModel] = None,
+    ):
+        if runs is None:
+            runs = RunHistory().query(succeeded=True)
+        self.min_runs = min_runs
+        self.cost_model = cost_model or CostModel()
+        by_executable: Dict[str, list] = {}
+        for run in runs:
+            if run.exit_status == 0:
+                by_executable.setdefault(run.executable, []).append(run)
+        self._models = {
+            executable: self._fit(executable_runs)
+            for executable, executable_runs in by_executable.items()
+            if len(executable_runs) >= min_runs
+        }
+
+    @property
+    def executables(self):
+        """Executables with a fitted model, in alphabetical order."""
+        return sorted(self._models)
+
+    def _work(
+        self,
+        executable: str,
+        inputs: Mapping,
+        images: Sequence[ImageGeometry],
+    ) -> float:
+        num_voxels = _num_voxels(images, executable)
+        if executable == "antsRegistration":
+            try:
+                work = self.cost_model.estimate(inputs, num_voxels) - (
+                    self.cost_model.overhead
+                )
+            except (KeyError, TypeError):
+                work = 0.0
+            if work > 0:
+                return work
+        return float(num_voxels)
+
+    def _features(
+        self,
+        executable: str,
+        inputs: Mapping,
+        images: Sequence[ImageGeometry],
+        num_threads: Optional[int],
+        precision: Optional[str],
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        work = self._work(executable, inputs, images)
+        num_voxels = _num_voxels(images, executable)
+        return (
+            np.array([1.0, math.log(work), math.log(num_threads or 1)]),
+            np.array([1.0, math.log(num_voxels), 1.0 if precision == "float" else 0.0]),
+        )
+
+    def _fit(self, runs: Sequence[Run]) -> tuple:
+        wall_features, memory_features = zip(
+            *(
+                self._features(
+                    run.executable,
+                    run.inputs,
+                    run.images,
+                    run.num_threads,
+                    run.precision,
+                )
+                for run in runs
+            )
+        )
+        return (
+            _LogLinearModel.fit(
+                np.array(wall_features), np.array([run.wall_time for run in runs])
+            ),
+            _LogLinearModel.fit(
+                np.array(memory_features), np.array([run.peak_rss for run in runs])
+            ),
+            len(runs),
+        )
+
+    def predict(self, task, num_threads: Optional[int] = None) -> Prediction:
+        """Expected wall time and peak memory of a shell command task.
+
+        Parameters
+        ----------
+        task : ShellCommandTask
+            Task with its input images set to existing files.
+        num_threads : int, optional
+            Threads available to the command, by default those of this process.
+        """
+        executable = task.inputs.executable
+        if executable not in self._models:
+            raise ValueError(
+                f"fewer than {self.min_runs} recorded runs of {executable} to predict "
+                f"the resources of {task.name}"
+            )
+        wall_model, memory_model, num_runs = self._models[executable]
+        inputs, images = history.task_inputs(task)
+        precision = inputs.get("use_float_precision")
+        wall_features, memory_features = self._features(
+            executable,
+            inputs,
+            images,
+            num_threads or history.num_threads(),
+            None if precision is None else ("float" if precision else "double"),
+        )
+        wall_time, wall_time_range = wall_model.predict(wall_features)
+        peak_rss, peak_rss_range = memory_model.predict(memory_features)
+        return Prediction(
+            wall_time=wall_time,
+            wall_time_range=wall_time_range,
+            peak_rss=peak_rss,
+            peak_rss_range=peak_rss_range,
+            num_runs=num_runs,
+        )
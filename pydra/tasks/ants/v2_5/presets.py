@@ -0,0 +1,262 @@
+import json
+import os
+from os import PathLike
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from attrs import asdict, define, field
+
+__all__ = [
+    "Preset",
+    "get_preset",
+    "list_presets",
+    "load_presets",
+    "register_preset",
+    "save_presets",
+    "select_preset",
+]
+
+
+def _freeze(parameters: Mapping[str, Any]) -> Dict[str, Any]:
+    return {
+        key: tuple(value) if isinstance(value, (list, tuple)) else value
+        for key, value in parameters.items()
+    }
+
+
+@define(frozen=True)
+class Preset:
+    """Named and versioned schedule of `Registration` parameters.
+
+    Benchmarks are optional and refer to the conditions described by `reference`.
+    Built-in presets carry none, site presets should record those measured on their own
+    data.
+    """
+
+    name: str
+    """Name of the preset."""
+
+    parameters: Mapping[str, Any] = field(converter=_freeze)
+    """Inputs of `Registration` set by the preset, e.g. `syn_num_iterations`."""
+
+    version: int = 1
+    """Version of the preset, incremented whenever its parameters change."""
+
+    description: str = ""
+    """Short description of the preset."""
+
+    runtime: Optional[float] = None
+    """Recorded wall time in seconds."""
+
+    peak_memory: Optional[float] = None
+    """Recorded peak resident memory in MiB."""
+
+    quality: Optional[float] = None
+    """Recorded quality score, where higher is better, e.g. a mean Dice overlap."""
+
+    reference: str = ""
+    """Conditions of the benchmarks, e.g. the cohort, image size and core count."""
+
+    @property
+    def key(self) -> str:
+        """Unique key of the preset, formatted as `name@version`."""
+        return f"{self.name}@{self.version}"
+
+
+def _schedule(iterations, shrink_factors, smoothing_sigmas, stages):
+    return {
+        f"{stage}_{name}": value
+        for stage in stages
+        for name, value in [
+            ("num_iterations", iterations),
+            ("shrink_factors", shrink_factors),
+            ("smoothing_sigmas", smoothing_sigmas),
+        ]
+    }
+
+
+def _linear(iterations, shrink_factors, smoothing_sigmas):
+    parameters = _schedule(
+        iterations, shrink_factors, smoothing_sigmas, ("rigid", "affine")
+    )
+    for stage in ("rigid", "affine"):
+        parameters.update(
+            {
+                f"{stage}_metric": "MI",
+                f"{stage}_radius": 1,
+                f"{stage}_num_bins": 32,
+                f"{stage}_sampling_strategy": "Regular",
+                f"{stage}_sampling_rate": 0.25,
+            }
+        )
+    return parameters
+
+
+def _syn(iterations, shrink_factors, smoothing_sigmas):
+    return dict(
+        _schedule(iterations, shrink_factors, smoothing_sigmas, ("syn",)),
+        syn_metric="MI",
+    )
+
+
+# Schedules of the antsRegistrationSyN.sh and antsRegistrationSyNQuick.sh scripts
+_BUILTIN_PRESETS = [
+    Preset(
+        name="syn",
+        description="antsRegistrationSyN.sh",
+        parameters={
+            **_linear((1000, 500, 250, 100), (8, 4, 2, 1), (3, 2, 1, 0)),
+            **_syn((100, 70, 50, 20), (8, 4, 2, 1), (3, 2, 1, 0)),
+        },
+    ),
+    Preset(
+        name="syn_quick",
+        description="antsRegistrationSyNQuick.sh",
+        parameters={
+            **_linear((1000, 500, 250, 0), (8, 4, 2, 1), (3, 2, 1, 0)),
+            **_syn((100, 70, 50, 0), (8, 4, 2, 1), (3, 2, 1, 0)),
+        },
+    ),
+    Preset(
+        name="large",
+        description="antsRegistrationSyN.sh for images over 256 voxels wide",
+        parameters={
+            **_linear((1000, 500, 250, 100), (12, 8, 4, 2), (4, 3, 2, 1)),
+            **_syn((100, 100, 70, 50, 20), (10, 6, 4, 2, 1), (5, 3, 2, 1, 0)),
+        },
+    ),
+    Preset(
+        name="large_quick",
+        description="antsRegistrationSyNQuick.sh for images over 256 voxels wide",
+        parameters={
+            **_linear((1000, 500, 250, 0), (12, 8, 4, 2), (4, 3, 2, 1)),
+            **_syn((100, 100, 70, 50, 0), (10, 6, 4, 2, 1), (5, 3, 2, 1, 0)),
+        },
+    ),
+    Preset(
+        name="bspline",
+        description="antsRegistrationSyN.sh with a B-spline SyN stage",
+        parameters={
+            **_linear((1000, 500, 250, 100), (8, 4, 2, 1), (3, 2, 1, 0)),
+            **_syn((100, 70, 50, 20), (8, 4, 2, 1), (3, 2, 1, 0)),
+            "syn_transform_type": "BSplineSyn",
+        },
+    ),
+]
+
+_registry: Dict[Tuple[str, int], Preset] = {}
+_loaded_environment = False
+
+
+def register_preset(preset: Preset, overwrite: bool = False) -> Preset:
+    """Add a preset to the registry, failing if its version is already registered."""
+    key = (preset.name, preset.version)
+    if key in _registry and not overwrite and _registry[key] != preset:
+        raise ValueError(f"preset {preset.key} is already registered")
+    _registry[key] = preset
+    return preset
+
+
+def load_presets(path: PathLike, overwrite: bool = False) -> List[Preset]:
+    """Register the presets of a JSON file holding a list of `Preset` fields."""
+    with open(path) as fobj:
+        return [
+            register_preset(Preset(**preset), overwrite=overwrite)
+            for preset in json.load(fobj)
+        ]
+
+
+def save_presets(presets: List[Preset], path: PathLike):
+    """Write presets to a JSON file readable by `load_presets`."""
+    with open(path, "w") as fobj:
+        json.dump([asdict(preset) for preset in presets], fobj, indent=2)
+
+
+for _preset in _BUILTIN_PRESETS:
+    register_preset(_preset)
+
+
+def _ensure_loaded():
+    """Register the presets listed in `$PYDRA_ANTS_PRESETS` once they all loaded."""
+    global _loaded_environment
+    if _loaded_environment:
+        return
+    for path in filter(
+        None, os.environ.get("PYDRA_ANTS_PRESETS", "").split(os.pathsep)
+    ):
+        load_presets(path, overwrite=True)
+    _loaded_environment = True
+
+
+def list_presets() -> List[Preset]:
+    """Return all registered presets, sorted by name and version.
+
+    >>> [preset.key for preset in list_presets()][:3]
+    ['bspline@1', 'large@1', 'large_quick@1']
+    """
+    _ensure_loaded()
+    return [_registry[key] for key in sorted(_registry)]
+
+
+def get_preset(name: str) -> Preset:
+    """Return a preset by name, at its latest version unless given as `name@version`.
+
+    >>> get_preset("syn_quick").parameters["syn_num_iterations"]
+    (100, 70, 50, 0)
+    """
+    _ensure_loaded()
+    name, _, version = name.partition("@")
+    versions = [v for n, v in _registry if n == name]
+    if not versions or (version and int(version) not in versions):
+        raise ValueError(
+            f"unknown preset {name}{'@' + version if version else ''}, available: "
+            f"{sorted({n for n, _ in _registry})}"
+        )
+    return _registry[name, int(version) if version else max(versions)]
+
+
+def select_preset(
+    min_quality: Optional[float] = None,
+    max_runtime: Optional[float] = None,
+    max_memory: Optional[float] = None,
+    presets: Optional[List[Preset]] = None,
+) -> Preset:
+    """Return the fastest preset meeting the quality, runtime and memory targets.
+
+    Only the latest version of each preset is considered, provided it has a recorded
+    runtime and recorded benchmarks for the other constrained quantities. The built-in
+    presets carry none, so site presets with benchmarks must be registered first.
+
+    >>> fast = Preset("site_fast", {"syn_num_iterations": [50, 0]}, runtime=600, quality=0.7)
+    >>> slow = Preset("site_slow", {"syn_num_iterations": [80, 20]}, runtime=1500, quality=0.8)
+    >>> select_preset(min_quality=0.75, presets=[fast, slow]).key
+    'site_slow@1'
+    >>> select_preset(max_runtime=1e9)
+    Traceback (most recent call last):
+    ...
+    ValueError: no registered preset has the benchmarks needed to check the targets
+    """
+    candidates = {}
+    for preset in presets or list_presets():
+        if preset.version >= candidates.get(preset.name, preset).version:
+            candidates[preset.name] = preset
+    benchmarked = [
+        preset
+        for preset in candidates.values()
+        if preset.runtime is not None
+        and (min_quality is None or preset.quality is not None)
+        and (max_memory is None or preset.peak_memory is not None)
+    ]
+    if not benchmarked:
+        raise ValueError(
+            "no registered preset has the benchmarks needed to check the targets"
+        )
+    eligible = [
+        preset
+        for preset in benchmarked
+        if (max_runtime is None or preset.runtime <= max_runtime)
+        and (min_quality is None or preset.quality >= min_quality)
+        and (max_memory is None or preset.peak_memory <= max_memory)
+    ]
+    if not eligible:
+        raise ValueError("no registered preset with benchmarks meets the targets")
+    return min(eligible, key=lambda preset: preset.runtime)
@@ -0,0 +1,321 @@
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from os import PathLike
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import _hooks, _resources
+from .registration import parse_registration_log
+
+__all__ = ["PrometheusExporter"]
+
+_DURATION_BUCKETS = (1, 10, 60, 300, 900, 1800, 3600, 7200, 14400, 28800)
+
+_METRICS = [
+    ("threads_in_use", "gauge", "Threads of running processes."),
+    ("tasks_running", "gauge", "Running tasks by type."),
+    ("tasks_finished_total", "counter", "Finished tasks by type and status."),
+    ("task_duration_seconds", "histogram", "Runtime of finished tasks."),
+    (
+        "task_start_offset_seconds",
+        "histogram",
+        "Time from the start of the exporter to the start of tasks.",
+    ),
+    ("task_elapsed_seconds", "gauge", "Time since running tasks started."),
+    ("task_threads", "gauge", "Threads of the process of running tasks."),
+    ("task_rss_bytes", "gauge", "Resident memory of the process of running tasks."),
+    ("registration_stage", "gauge", "Current stage of running registrations."),
+    ("registration_level", "gauge", "Current level of running registrations."),
+    ("registration_iteration", "gauge", "Current iteration of running registrations."),
+    (
+        "registration_progress_timestamp_seconds",
+        "gauge",
+        "Last time the log of running registrations grew.",
+    ),
+]
+
+
+def _labels(**labels) -> str:
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in labels.values()
+    )
+    return ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped))
+
+
+def _write_json(path: Path, data: dict):
+    """Replace a JSON file atomically, so that readers never see a partial file."""
+    fd, tmp_file = tempfile.mkstemp(suffix=".tmp", dir=path.parent)
+    with os.fdopen(fd, "w") as fobj:
+        json.dump(data, fobj)
+    os.replace(tmp_file, path)
+
+
+def _proc_status(pid: int) -> Dict[str, str]:
+    """Fields of `/proc/<pid>/status`, empty if the process is gone."""
+    try:
+        with open(f"/proc/{pid}/status") as fobj:
+            return dict(
+                line.split(":", 1) for line in fobj.read().splitlines() if ":" in line
+            )
+    except OSError:
+        return {}
+
+
+class _Histogram:
+    """Cumulative histogram in the Prometheus exposition format."""
+
+    def __init__(self):
+        self.counts = [0] * (len(_DURATION_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(_DURATION_BUCKETS, value)] += 1
+        self.sum += value
+
+    def lines(self, name: str, **labels) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(_DURATION_BUCKETS + ("+Inf",), self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{{{_labels(**labels, le=bound)}}} {cumulative}")
+        lines.append(f"{name}_sum{{{_labels(**labels)}}} {self.sum:g}")
+        lines.append(f"{name}_count{{{_labels(**labels)}}} {cumulative}")
+        return lines
+
+
+class PrometheusExporter:
+    """Export metrics of ANTs tasks for the node_exporter textfile collector.
+
+    Instrumented tasks started while the exporter is started record their state in
+    `state_dir` when they start and finish, in whichever process runs them. The exporter
+    periodically gathers these records into the metrics file, replaced atomically as
+    required by the collector:
+
+    - `pydra_ants_tasks_finished_total`, finished tasks by type and status;
+    - `pydra_ants_tasks_running`, running tasks by type;
+    - `pydra_ants_task_start_offset_seconds`, histogram of the time between the start
+      of the exporter and the start of each task, which shows how tasks spread over a
+      run but not how long each waited for a worker, unknown to the hooks;
+    - `pydra_ants_task_duration_seconds`, histogram of the runtime of finished tasks;
+    - `pydra_ants_threads_in_use`, threads of all running processes;
+    - `pydra_ants_task_rss_bytes`, `pydra_ants_task_threads` and
+      `pydra_ants_task_elapsed_seconds` for each running task;
+    - `pydra_ants_registration_stage`, `pydra_ants_registration_level` and
+      `pydra_ants_registration_iteration`, the progress of running registrations, and
+      `pydra_ants_registration_progress_timestamp_seconds`, the last time their log
+      grew, to alert on stuck registrations.
+
+    Parameters
+    ----------
+    path : path_like
+        Metrics file, ending in `.prom`, in the directory of the textfile collector.
+    interval : float, default=15
+        Seconds between two writes of the metrics file.
+    state_dir : path_like, optional
+        Directory shared with the workers running the tasks, by default next to `path`.
+
+    Examples
+    --------
+    >>> from pydra.tasks.ants.v2_5 import registration_syn
+    >>> exporter = PrometheusExporter(Path(tempfile.mkdtemp()) / "pydra_ants.prom")
+    >>> task = exporter.instrument(
+    ...     registration_syn(
+    ...         dimensionality=3,
+    ...         fixed_image="template.nii.gz",
+    ...         moving_image="structural.nii.gz",
+    ...     )
+    ... )
+    >>> with exporter:
+    ...     pass  # Run the task here
+    >>> print(exporter.path.read_text().splitlines()[2])
+    pydra_ants_threads_in_use 0
+    """
+
+    def __init__(
+        self,
+        path: PathLike,
+        interval: float = 15.0,
+        state_dir: Optional[PathLike] = None,
+    ):
+        self.path = Path(path).absolute()
+        self.interval = interval
+        self.state_dir = (
+            Path(state_dir).absolute()
+            if state_dir
+            else self.path.with_name(self.path.name + ".d")
+        )
+        self.started = None
+        self._reset()
+
+    def _reset(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._finished: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._durations: Dict[str, _Histogram] = defaultdict(_Histogram)
+        self._start_offsets: Dict[str, _Histogram] = defaultdict(_Histogram)
+
+    def __getstate__(self):
+        # Workers only need to know where to record task states
+        return {
+            key: getattr(self, key)
+            for key in ("path", "interval", "state_dir", "started")
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def instrument(self, task):
+        """Add hooks to a task, and to all nodes if it is a workflow."""
+        return _hooks.add_hooks(task, self)
+
+    def pre_run_task(self, task):
+        if self.started is None:
+            return
+        now = time.time()
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        _write_json(
+            self.state_dir / f"{task.uid}.json",
+            {
+                "task": type(task).__name__,
+                "node": task.name,
+                "output_dir": str(task.output_dir),
+                "started": now,
+                "start_offset": now - self.started,
+            },
+        )
+
+    def post_run_task(self, task, result):
+        path = self.state_dir / f"{task.uid}.json"
+        try:
+            with open(path) as fobj:
+                state = json.load(fobj)
+        except OSError:
+            # Started before the exporter
+            return
+        state.update(finished=time.time(), errored=result.errored)
+        _write_json(path, state)
+
+    def start(self):
+        """Start writing the metrics file periodically in a background thread."""
+        self.started = time.time()
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and write the metrics file a last time."""
+        self.started = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def _running_samples(self, state: dict, samples: Dict[str, List[str]]) -> int:
+        """Add the samples of a running task and return its number of threads."""
+        output_dir = Path(state["output_dir"])
+        labels = _labels(
+            task=state["task"], node=state["node"], checksum=output_dir.name
+        )
+        samples["task_elapsed_seconds"].append(
+            f"{{{labels}}} {time.time() - state['started']:.3f}"
+        )
+        try:
+            with open(output_dir / _resources.PROCESS_FILE) as fobj:
+                status = _proc_status(json.load(fobj)["pid"])
+        except (OSError, ValueError):
+            status = {}
+        threads = int(status.get("Threads", 0))
+        if status:
+            rss = int(status.get("VmRSS", "0 kB").split()[0]) * 1024
+            samples["task_threads"].append(f"{{{labels}}} {threads}")
+            samples["task_rss_bytes"].append(f"{{{labels}}} {rss}")
+        stdout_file = output_dir / _resources.STDOUT_FILE
+        if state["task"] == "Registration" and stdout_file.exists():
+            log = parse_registration_log(stdout_file.read_text(errors="replace"))
+            if log.num_iterations:
+                levels = log.num_iterations[-1]
+                samples["registration_stage"].append(
+                    f"{{{labels}}} {len(log.num_iterations)}"
+                )
+                samples["registration_level"].append(f"{{{labels}}} {len(levels)}")
+                samples["registration_iteration"].append(
+                    f"{{{labels}}} {levels[-1] if levels else 0}"
+                )
+            samples["registration_progress_timestamp_seconds"].append(
+                f"{{{labels}}} {stdout_file.stat().st_mtime:.3f}"
+            )
+        return threads
+
+    def collect(self) -> str:
+        """Fold finished task records into the totals and return the metrics text."""
+        running, samples, threads_in_use = defaultdict(int), defaultdict(list), 0
+        for path in sorted(self.state_dir.glob("*.json")):
+            try:
+                with open(path) as fobj:
+                    state = json.load(fobj)
+            except (OSError, ValueError):
+                continue
+            if "finished" not in state:
+                running[state["task"]] += 1
+                threads_in_use += self._running_samples(state, samples)
+                continue
+            status = "error" if state["errored"] else "success"
+            self._finished[state["task"], status] += 1
+            self._durations[state["task"]].observe(state["finished"] - state["started"])
+            self._start_offsets[state["task"]].observe(state["start_offset"])
+            path.unlink()
+
+        samples["threads_in_use"] = [f" {threads_in_use}"]
+        samples["tasks_running"] = [
+            f"{{{_labels(task=task)}}} {count}"
+            for task, count in sorted(running.items())
+        ]
+        samples["tasks_finished_total"] = [
+            f"{{{_labels(task=task, status=status)}}} {count}"
+            for (task, status), count in sorted(self._finished.items())
+        ]
+        histograms = {
+            "task_duration_seconds": self._durations,
+            "task_start_offset_seconds": self._start_offsets,
+        }
+        lines = []
+        for name, kind, help_string in _METRICS:
+            lines += [
+                f"# HELP pydra_ants_{name} {help_string}",
+                f"# TYPE pydra_ants_{name} {kind}",
+            ]
+            for task, histogram in sorted(histograms.get(name, {}).items()):
+                lines += histogram.lines(f"pydra_ants_{name}", task=task)
+            lines += [f"pydra_ants_{name}{sample}" for sample in samples[name]]
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> Path:
+        """Write the metrics file atomically and return its path."""
+        with self._lock:
+            text = self.collect()
+            fd, tmp_file = tempfile.mkstemp(suffix=".tmp", dir=self.path.parent)
+            with os.fdopen(fd, "w") as fobj:
+                fobj.write(text)
+            os.chmod(tmp_file, 0o644)
+            os.replace(tmp_file, self.path)
+        return self.path
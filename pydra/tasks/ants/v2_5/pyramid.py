@@ -0,0 +1,78 @@
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from os import PathLike
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import nibabel as nib
+import numpy as np
+
+from .._cache import default_cache_dir
+from . import _image
+
+__all__ = ["default_cache_dir", "image_digest", "image_pyramid", "pyramid_level"]
+
+
+@lru_cache(maxsize=128)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as fobj:
+        for block in iter(lambda: fobj.read(2**20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def image_digest(image: PathLike) -> str:
+    """SHA-256 digest of an image file, memoized until the file changes."""
+    path = Path(image).resolve()
+    stat = path.stat()
+    return _file_digest(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+def pyramid_level(
+    image: PathLike,
+    shrink_factor: int,
+    cache_dir: Optional[PathLike] = None,
+    mask: bool = False,
+) -> Path:
+    """Return an image downsampled by block averaging, computing it only once.
+
+    The downsampled image is stored in `cache_dir` under the digest of the input file
+    and the shrink factor, so that repeated calls with the same image, e.g. a template
+    shared by many subjects, reuse it. Masks are thresholded at half coverage.
+
+    >>> data = np.arange(64, dtype=np.float32).reshape(4, 4, 4)
+    >>> tmp_dir = Path(tempfile.mkdtemp())
+    >>> nib.save(nib.Nifti1Image(data, np.eye(4)), tmp_dir / "image.nii.gz")
+    >>> level = pyramid_level(tmp_dir / "image.nii.gz", 2, cache_dir=tmp_dir)
+    >>> nib.load(level).shape
+    (2, 2, 2)
+    >>> pyramid_level(tmp_dir / "image.nii.gz", 2, cache_dir=tmp_dir) == level
+    True
+    """
+    cache_dir = Path(cache_dir or default_cache_dir())
+    kind = "mask" if mask else "image"
+    out_file = cache_dir / f"{image_digest(image)}_{kind}_shrink{shrink_factor}.nii.gz"
+    if out_file.exists():
+        return out_file
+    data, affine = _image.downsample_image(nib.load(image), shrink_factor)
+    if mask:
+        data = (data >= 0.5).astype(np.uint8)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so that concurrent tasks never read partial files
+    fd, tmp_file = tempfile.mkstemp(suffix=".nii.gz", dir=cache_dir)
+    os.close(fd)
+    nib.save(nib.Nifti1Image(data, affine), tmp_file)
+    os.replace(tmp_file, out_file)
+    return out_file
+
+
+def image_pyramid(
+    image: PathLike,
+    shrink_factors: Sequence[int],
+    cache_dir: Optional[PathLike] = None,
+) -> List[Path]:
+    """Return cached levels of an image pyramid, one per shrink factor."""
+    return [pyramid_level(image, factor, cache_dir) for factor in shrink_factors]
@@ -1,13 +1,32 @@
+import os
+import re
 from functools import partial
 from os import PathLike
 from pathlib import Path
-from typing import Optional, Sequence
+from typing import Callable, List, Optional, Sequence, Union
+from warnings import warn
 
-from attrs import NOTHING, define, field
+import nibabel as nib
+import numpy as np
+import pydra
+from attrs import NOTHING, define, field, fields_dict
 from pydra.engine.specs import File, ShellOutSpec, ShellSpec, SpecInfo
-from pydra.engine.task import ShellCommandTask
 
-__all__ = ["Registration", "registration_syn", "registration_syn_quick"]
+from ._resources import MeasuredShellCommandTask, ResourceOutSpec
+from .alignment import check_alignment, identity_registration
+from .cost_model import CostModel
+from .presets import Preset, get_preset
+from .pyramid import pyramid_level
+
+__all__ = [
+    "Registration",
+    "RegistrationLog",
+    "count_samples",
+    "parse_registration_log",
+    "registration_syn",
+    "registration_syn_quick",
+    "sampling_rate",
+]
 
 
 def _format_rigid_metric(
@@ -105,7 +124,91 @@ def _format_syn_transform_type(
     )
 
 
-class Registration(ShellCommandTask):
+@define(frozen=True)
+class RegistrationLog:
+    """Timings and metric values reported by antsRegistration in verbose mode."""
+
+    elapsed_time: Optional[float] = None
+    """Total wall time in seconds."""
+
+    stage_elapsed_times: List[float] = field(factory=list)
+    """Wall time in seconds of each stage."""
+
+    level_elapsed_times: List[List[float]] = field(factory=list)
+    """Wall time in seconds of the iterations of each level of each stage."""
+
+    num_iterations: List[List[int]] = field(factory=list)
+    """Iterations run at each level of each stage, fewer than scheduled on convergence."""
+
+    metric_values: List[float] = field(factory=list)
+    """Last metric value of each stage."""
+
+
+_STAGE_PATTERN = re.compile(r"^\*\*\* Running .* registration")
+_LEVEL_PATTERN = re.compile(r"Current level = \d+ of \d+")
+_ITERATION_PATTERN = re.compile(
+    r"^\s*\w*DIAGNOSTIC,\s*(\d+),\s*([^,\s]+),\s*[^,\s]+,\s*[^,\s]+,\s*([^,\s]+),"
+)
+_STAGE_TIME_PATTERN = re.compile(r"Elapsed time \(stage \d+\): (\S+)")
+_TOTAL_TIME_PATTERN = re.compile(r"Total elapsed time: (\S+)")
+
+
+def parse_registration_log(stdout: str) -> RegistrationLog:
+    """Parse the verbose output of antsRegistration.
+
+    Level timings sum the `SINCE_LAST` column of iteration diagnostics, so they exclude
+    the time spent smoothing and shrinking images before the first iteration.
+
+    >>> log = parse_registration_log('''
+    ... *** Running Euler3DTransform registration ***
+    ...   Current level = 1 of 2
+    ... DIAGNOSTIC,Iteration,metricValue,convergenceValue,ITERATION_TIME_INDEX,SINCE_LAST
+    ...  2DIAGNOSTIC,     1, -5.0e-01, inf, 1.0e+00, 1.0e+00,
+    ...  2DIAGNOSTIC,     2, -6.0e-01, inf, 1.5e+00, 5.0e-01,
+    ...   Current level = 2 of 2
+    ...  2DIAGNOSTIC,     1, -7.0e-01, inf, 4.0e+00, 2.5e+00,
+    ...   Elapsed time (stage 0): 4.5e+00
+    ... Total elapsed time: 5.0e+00
+    ... ''')
+    >>> log.elapsed_time, log.stage_elapsed_times, log.metric_values
+    (5.0, [4.5], [-0.7])
+    >>> log.level_elapsed_times, log.num_iterations
+    ([[1.5, 2.5]], [[2, 1]])
+    """
+    elapsed_time = None
+    stage_elapsed_times = []
+    level_elapsed_times, num_iterations, metric_values = [], [], []
+    for line in stdout.splitlines():
+        if _STAGE_PATTERN.search(line):
+            level_elapsed_times.append([])
+            num_iterations.append([])
+            metric_values.append(None)
+        elif not metric_values:
+            continue
+        elif _LEVEL_PATTERN.search(line):
+            level_elapsed_times[-1].append(0.0)
+            num_iterations[-1].append(0)
+        elif match := _ITERATION_PATTERN.search(line):
+            if not num_iterations[-1]:
+                level_elapsed_times[-1].append(0.0)
+                num_iterations[-1].append(0)
+            level_elapsed_times[-1][-1] += float(match.group(3))
+            num_iterations[-1][-1] = int(match.group(1))
+            metric_values[-1] = float(match.group(2))
+        elif match := _STAGE_TIME_PATTERN.search(line):
+            stage_elapsed_times.append(float(match.group(1)))
+        elif match := _TOTAL_TIME_PATTERN.search(line):
+            elapsed_time = float(match.group(1))
+    return RegistrationLog(
+        elapsed_time=elapsed_time,
+        stage_elapsed_times=stage_elapsed_times,
+        level_elapsed_times=level_elapsed_times,
+        num_iterations=num_iterations,
+        metric_values=metric_values,
+    )
+
+
+class Registration(MeasuredShellCommandTask):
     """Task definition for antsRegistration."""
 
     @define(kw_only=True)
@@ -315,7 +418,7 @@ class Registration(ShellCommandTask):
             }
         )
 
-        enable_rigid_stage = field(
+        enable_rigid_stage: bool = field(
             default=True, metadata={"help_string": "enable rigid registration stage"}
         )
 
@@ -696,15 +799,16 @@ class Registration(ShellCommandTask):
         verbose: bool = field(
             default=False,
             metadata={
-                "help_string": "enable verbose output",
-                "formatter": lambda verbose: f"--verbose {verbose:d}",
+                "help_string": "enable verbose output, which is always rendered on "
+                "since the timing and metric outputs are parsed from it",
+                "formatter": lambda verbose: "--verbose 1",
             },
         )
 
     input_spec = SpecInfo(name="Input", bases=(InputSpec,))
 
     @define(kw_only=True)
-    class OutputSpec(ShellOutSpec):
+    class OutputSpec(ResourceOutSpec):
         affine_transform: File = field(
             metadata={
                 "help_string": "affine transform",
@@ -731,10 +835,347 @@ class Registration(ShellCommandTask):
             }
         )
 
+        sampling_rates: list = field(
+            metadata={
+                "help_string": "metric sampling rate of each enabled stage",
+                "callable": lambda enable_rigid_stage, rigid_sampling_rate, enable_affine_stage, affine_sampling_rate, enable_syn_stage, syn_sampling_rate: [
+                    rate
+                    for enabled, rate in [
+                        (enable_rigid_stage, rigid_sampling_rate),
+                        (enable_affine_stage, affine_sampling_rate),
+                        (enable_syn_stage, syn_sampling_rate),
+                    ]
+                    if enabled
+                ],
+            }
+        )
+
+        elapsed_time: float = field(
+            metadata={
+                "help_string": "total wall time in seconds reported in the log",
+                "callable": lambda stdout: parse_registration_log(stdout).elapsed_time,
+            }
+        )
+
+        stage_elapsed_times: list = field(
+            metadata={
+                "help_string": "wall time in seconds of each stage reported in the log",
+                "callable": lambda stdout: (
+                    parse_registration_log(stdout).stage_elapsed_times
+                ),
+            }
+        )
+
+        level_elapsed_times: list = field(
+            metadata={
+                "help_string": "wall time in seconds of each level of each stage "
+                "reported in the log",
+                "callable": lambda stdout: (
+                    parse_registration_log(stdout).level_elapsed_times
+                ),
+            }
+        )
+
+        num_iterations: list = field(
+            metadata={
+                "help_string": "iterations run at each level of each stage "
+                "reported in the log",
+                "callable": lambda stdout: parse_registration_log(
+                    stdout
+                ).num_iterations,
+            }
+        )
+
+        metric_values: list = field(
+            metadata={
+                "help_string": "final metric value of each stage reported in the log",
+                "callable": lambda stdout: parse_registration_log(stdout).metric_values,
+            }
+        )
+
     output_spec = SpecInfo(name="Output", bases=(OutputSpec,))
 
     executable = "antsRegistration"
 
+    non_semantic_inputs = ("verbose",)
+
+
+_DEFAULT_PRESETS = {
+    (False, False): "syn",
+    (False, True): "syn_quick",
+    (True, False): "large",
+    (True, True): "large_quick",
+}
+
+
+def _select_levels(params: dict, stage: str, keep: Callable[[int], bool]):
+    """Keep the levels of a stage whose shrink factor satisfies `keep`."""
+    levels = [
+        level
+        for level in zip(
+            params[f"{stage}_num_iterations"],
+            params[f"{stage}_shrink_factors"],
+            params[f"{stage}_smoothing_sigmas"],
+        )
+        if keep(level[1])
+    ]
+    if not levels:
+        params[f"enable_{stage}_stage"] = False
+        return
+    (
+        params[f"{stage}_num_iterations"],
+        params[f"{stage}_shrink_factors"],
+        params[f"{stage}_smoothing_sigmas"],
+    ) = map(tuple, zip(*levels))
+
+
+def count_samples(
+    fixed_image: PathLike,
+    fixed_mask: Optional[PathLike] = None,
+    dimensionality: int = 3,
+) -> int:
+    """Number of voxels over which metrics are sampled, inside the mask if provided."""
+    if fixed_mask:
+        return int(np.count_nonzero(np.asanyarray(nib.load(fixed_mask).dataobj)))
+    return int(np.prod(nib.load(fixed_image).shape[:dimensionality]))
+
+
+def sampling_rate(
+    num_voxels: int,
+    target_samples: int,
+    shrink_factor: int = 1,
+    dimensionality: int = 3,
+) -> float:
+    """Sampling rate yielding `target_samples` samples out of `num_voxels` voxels.
+
+    The voxel count refers to the full resolution grid, shrunk by `shrink_factor` along
+    each of its `dimensionality` axes. The rate is rounded to 4 decimals and clipped to
+    (0, 1].
+
+    >>> sampling_rate(256**3, 100_000), sampling_rate(128**3, 100_000)
+    (0.006, 0.0477)
+    >>> sampling_rate(128**3, 100_000, shrink_factor=4)
+    1.0
+    >>> sampling_rate(1024**2, 100_000, shrink_factor=2, dimensionality=2)
+    0.3815
+    """
+    rate = target_samples * shrink_factor**dimensionality / max(num_voxels, 1)
+    return float(min(max(round(rate, 4), 1e-4), 1.0))
+
+
+def _set_sampling_rates(
+    params: dict, num_samples: int, target_samples: int, image_shrink: int = 1
+):
+    """Set the rate of sampled stages to hit the target at their finest level."""
+    for stage in ("rigid", "affine", "syn"):
+        if params[f"enable_{stage}_stage"] and params.get(
+            f"{stage}_sampling_strategy", "None"
+        ) in {"Regular", "Random"}:
+            params[f"{stage}_sampling_rate"] = sampling_rate(
+                num_samples,
+                target_samples,
+                image_shrink * min(params[f"{stage}_shrink_factors"]),
+                params["dimensionality"],
+            )
+
+
+def _budget_schedules(params: dict, num_samples: int):
+    """Schedules of decreasing cost derived from the given registration parameters."""
+    params = dict(params)
+    yield params
+    # Sample the linear metrics sparsely
+    _set_sampling_rates(params, num_samples, 2**17)
+    yield dict(params)
+    # Stop the linear stages at their second finest shrink factor, since their
+    # transforms do not depend on the grid, and skip the finest SyN level as in quick
+    # mode, so that the warp field keeps the resolution of the fixed image
+    for stage in ("rigid", "affine"):
+        shrink_factors = sorted(set(params[f"{stage}_shrink_factors"]))
+        if params[f"enable_{stage}_stage"] and len(shrink_factors) > 1:
+            _select_levels(params, stage, lambda factor: factor >= shrink_factors[1])
+    iterations = params["syn_num_iterations"]
+    params["syn_num_iterations"] = tuple(iterations[:-1]) + (0,)
+    _set_sampling_rates(params, num_samples, 2**17)
+    yield dict(params)
+    # Halve the iterations of the SyN stage
+    params["syn_num_iterations"] = tuple(n // 2 for n in params["syn_num_iterations"])
+    yield dict(params)
+    # Halve the iterations of the linear stages, and sample them more sparsely
+    for stage in ("rigid", "affine"):
+        iterations = params[f"{stage}_num_iterations"]
+        params[f"{stage}_num_iterations"] = tuple(n // 2 for n in iterations)
+    _set_sampling_rates(params, num_samples, 2**15)
+    yield dict(params)
+
+
+def _fit_time_budget(
+    params: dict,
+    time_budget: float,
+    num_voxels: int,
+    num_samples: int,
+    num_threads: int,
+    cost_model: CostModel,
+) -> dict:
+    """Return the first schedule whose estimated runtime fits within the budget."""
+    for schedule in _budget_schedules(params, num_samples):
+        runtime = cost_model.estimate(schedule, num_voxels, num_threads, num_samples)
+        if runtime <= time_budget:
+            return schedule
+    warn(
+        f"no registration schedule fits within {time_budget:g} s on {num_threads} "
+        f"threads, using the cheapest one with an estimated runtime of {runtime:.0f} s"
+    )
+    return schedule
+
+
+@pydra.mark.task
+@pydra.mark.annotate(
+    {
+        "return": {
+            "fixed_image": File,
+            "moving_image": File,
+            "fixed_mask": Optional[File],
+            "moving_mask": Optional[File],
+        }
+    }
+)
+def _downsample_inputs(
+    fixed_image: File,
+    moving_image: File,
+    fixed_mask: Optional[File],
+    moving_mask: Optional[File],
+    shrink_factor: int,
+    pyramid_cache_dir: Optional[str],
+):
+    return (
+        pyramid_level(fixed_image, shrink_factor, pyramid_cache_dir),
+        pyramid_level(moving_image, shrink_factor, Path.cwd()),
+        fixed_mask
+        and pyramid_level(fixed_mask, shrink_factor, pyramid_cache_dir, mask=True),
+        moving_mask
+        and pyramid_level(moving_mask, shrink_factor, Path.cwd(), mask=True),
+    )
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"transforms": list}})
+def _as_transforms(transform: File) -> list:
+    return [transform]
+
+
+def _cascade(
+    params: dict,
+    shrink_factor: int,
+    pyramid_cache_dir: Optional[PathLike],
+    name: str,
+    num_samples: Optional[int] = None,
+    target_samples: Optional[int] = None,
+    **kwargs,
+) -> pydra.Workflow:
+    """Split linear stages between downsampled and full resolution registrations.
+
+    Shrink factors of the coarse levels must be multiples of `shrink_factor`, and their
+    smoothing sigmas are rescaled to the downsampled grid unless given in mm. Timings,
+    metric values and resource usage are those of the full resolution one.
+    """
+    coarse = dict(params, enable_syn_stage=False)
+    fine = dict(params)
+    for stage in ("rigid", "affine"):
+        if params[f"enable_{stage}_stage"]:
+            _select_levels(coarse, stage, lambda factor: factor >= shrink_factor)
+            _select_levels(fine, stage, lambda factor: factor < shrink_factor)
+        if coarse[f"enable_{stage}_stage"]:
+            factors = coarse[f"{stage}_shrink_factors"]
+            if any(factor % shrink_factor for factor in factors):
+                raise ValueError(
+                    f"coarse {stage} shrink factors {list(factors)} are not all multiples of "
+                    f"the cascade shrink factor {shrink_factor}"
+                )
+            coarse[f"{stage}_shrink_factors"] = tuple(
+                factor // shrink_factor for factor in factors
+            )
+            # Sigmas in mm do not depend on the grid
+            units = f"{stage}_smoothing_units"
+            if kwargs.get(units, params.get(units, "vox")) == "vox":
+                coarse[f"{stage}_smoothing_sigmas"] = tuple(
+                    sigma / shrink_factor
+                    for sigma in coarse[f"{stage}_smoothing_sigmas"]
+                )
+    if not (coarse["enable_rigid_stage"] or coarse["enable_affine_stage"]):
+        raise ValueError(
+            f"no linear level has a shrink factor of at least {shrink_factor}"
+        )
+    if target_samples:
+        _set_sampling_rates(coarse, num_samples, target_samples, shrink_factor)
+        _set_sampling_rates(fine, num_samples, target_samples)
+
+    wf = pydra.Workflow(
+        name=name,
+        cache_dir=kwargs.pop("cache_dir", None),
+        input_spec=["fixed_image", "moving_image", "fixed_mask", "moving_mask"],
+        fixed_image=params["fixed_image"],
+        moving_image=params["moving_image"],
+        fixed_mask=params["fixed_mask"] or None,
+        moving_mask=params["moving_mask"] or None,
+    )
+
+    wf.add(
+        _downsample_inputs(
+            name="downsample",
+            fixed_image=wf.lzin.fixed_image,
+            moving_image=wf.lzin.moving_image,
+            fixed_mask=wf.lzin.fixed_mask,
+            moving_mask=wf.lzin.moving_mask,
+            shrink_factor=shrink_factor,
+            pyramid_cache_dir=str(pyramid_cache_dir) if pyramid_cache_dir else None,
+        )
+    )
+
+    coarse.update(
+        fixed_image=wf.downsample.lzout.fixed_image,
+        moving_image=wf.downsample.lzout.moving_image,
+        fixed_mask=wf.downsample.lzout.fixed_mask if params["fixed_mask"] else NOTHING,
+        moving_mask=(
+            wf.downsample.lzout.moving_mask if params["moving_mask"] else NOTHING
+        ),
+        output_transform_prefix="coarse",
+        warped_image="coarseWarped.nii.gz",
+        inverse_warped_image="coarseInverseWarped.nii.gz",
+    )
+    wf.add(Registration(name="coarse", **coarse, **kwargs))
+
+    wf.add(_as_transforms(name="initial", transform=wf.coarse.lzout.affine_transform))
+
+    fine.update(
+        fixed_image=wf.lzin.fixed_image,
+        moving_image=wf.lzin.moving_image,
+        initial_moving_transforms=wf.initial.lzout.transforms,
+    )
+    wf.add(Registration(name="fine", **fine, **kwargs))
+
+    wf.set_output(
+        [
+            ("affine_transform", wf.fine.lzout.affine_transform),
+            ("warp_field", wf.fine.lzout.warp_field),
+            ("inverse_warp_field", wf.fine.lzout.inverse_warp_field),
+            ("warped_image", wf.fine.lzout.warped_image),
+            ("inverse_warped_image", wf.fine.lzout.inverse_warped_image),
+            ("sampling_rates", wf.fine.lzout.sampling_rates),
+            ("elapsed_time", wf.fine.lzout.elapsed_time),
+            ("stage_elapsed_times", wf.fine.lzout.stage_elapsed_times),
+            ("level_elapsed_times", wf.fine.lzout.level_elapsed_times),
+            ("num_iterations", wf.fine.lzout.num_iterations),
+            ("metric_values", wf.fine.lzout.metric_values),
+            *(
+                (name, getattr(wf.fine.lzout, name))
+                for name in fields_dict(ResourceOutSpec)
+                if name not in fields_dict(ShellOutSpec)
+            ),
+        ]
+    )
+
+    return wf
+
 
 def registration_syn(
     *,
@@ -757,6 +1198,17 @@ def registration_syn(
     verbose: bool = False,
     large: bool = False,
     quick: bool = False,
+    preset: Union[str, Preset, None] = None,
+    precheck: bool = False,
+    precheck_tolerance: float = 1.0,
+    precheck_threshold: float = -0.9,
+    cascade: bool = False,
+    cascade_shrink_factor: int = 4,
+    pyramid_cache_dir: Optional[PathLike] = None,
+    target_samples: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    num_threads: Optional[int] = None,
+    cost_model: Optional[CostModel] = None,
     **kwargs,
 ) -> Registration:
     """Returns a task for SyN registration.
@@ -810,19 +1262,67 @@ def registration_syn(
     random_seed : int, optional
         Specify a custom random seed for reproducibility.
     verbose : bool, default=False
-        Enable verbose logging.
+        Kept for compatibility, logging is always verbose since the `elapsed_time`,
+        `stage_elapsed_times`, `level_elapsed_times`, `num_iterations` and
+        `metric_values` outputs are parsed from the log.
     large : bool, default=False
         Use a set of parameters optimized for large images.
         ANTs considers input images to be "large" if any dimension is over 256.
     quick : bool, default=False
         Use a set of parameters optimized for faster convergence.
+    preset : str or Preset, optional
+        Schedule of the registration stages, either a `Preset` or the name of a
+        registered one, optionally suffixed with `@version`. Defaults to the `syn`,
+        `syn_quick`, `large` or `large_quick` preset depending on `large` and `quick`,
+        which are ignored otherwise.
+    precheck : bool, default=False
+        Check the alignment of the input images before configuring the registration.
+        Identical images yield an `identity_registration` task instead, while images
+        already aligned within `precheck_tolerance` and `precheck_threshold` skip the
+        rigid stage when an affine stage follows, and the linear levels coarser than a
+        shrink factor of 2. The images must exist when the task is created.
+    precheck_tolerance : float, default=1.0
+        Maximum distance in mm between the centres of mass of aligned images.
+    precheck_threshold : float, default=-0.9
+        Maximum global correlation metric between aligned images.
+    cascade : bool, default=False
+        Run the linear levels with a shrink factor of at least `cascade_shrink_factor`
+        on images downsampled beforehand, then the remaining levels at full resolution
+        initialised with the coarse transform. The downsampled fixed image and mask are
+        cached by digest, so that they are computed once for a template shared by many
+        subjects.
+    cascade_shrink_factor : int, default=4
+        Downsampling factor of the images of the coarse registration, which must divide
+        the shrink factors of the coarse levels.
+    pyramid_cache_dir : path_like, optional
+        Directory caching the downsampled fixed images, see `default_cache_dir`.
+    target_samples : int, optional
+        Set the sampling rate of the linear stages so that their metrics are evaluated
+        on about this many voxels at the finest level, counted inside the fixed mask
+        if provided, instead of a fixed rate of 0.25. The fixed image and mask must
+        exist when the task is created. The rates are reported in `sampling_rates`.
+    time_budget : float, optional
+        Target wall time in seconds. Schedules of decreasing cost are derived from the
+        configured one, by sampling linear metrics more sparsely, stopping the linear
+        stages at a coarser shrink factor and skipping the finest SyN level, then
+        halving SyN and linear iterations. The first schedule whose runtime estimated
+        by `cost_model` fits within the budget is used, or the cheapest one with a
+        warning. Rates set by `target_samples` apply to the configured schedule. The
+        fixed image must exist when the task is created.
+    num_threads : int, optional
+        Number of cores available to the registration, used to estimate its runtime.
+        Defaults to the number of cores of the machine.
+    cost_model : CostModel, optional
+        Runtime model of the registration, calibrated for the target hardware.
     **kwargs : dict, optional
         Extra arguments passed to the task constructor.
 
     Returns
     -------
     Registration
-        The configured registration task.
+        The configured registration task, an `identity_registration` task with the
+        same outputs if `precheck` finds identical images, or a workflow with the same
+        outputs if `cascade` is enabled.
 
     See Also
     --------
@@ -843,7 +1343,7 @@ def registration_syn(
 -s 3x2x1x0vox -t Affine[0.1] -m MI[reference.nii.gz,structural.nii.gz,1,32,Regular,0.25] \
 -c [1000x500x250x100,1e-06,10] -f 8x4x2x1 -s 3x2x1x0vox -t Syn[0.1,3,0] \
 -m MI[reference.nii.gz,structural.nii.gz,1,32,None,1.0] -c [100x70x50x20,1e-06,10] -f 8x4x2x1 \
--s 3x2x1x0vox --float 0 --minc 0 --verbose 0'
+-s 3x2x1x0vox --float 0 --minc 0 --verbose 1'
 
     >>> task = registration_syn(
     ...     dimensionality=3,
@@ -873,8 +1373,50 @@ def registration_syn(
     ... )
     >>> task.cmdline    # doctest: +ELLIPSIS
     'antsRegistration ... -c [1000x500x250x0,...] ... -c [1000x500x250x0,...] ... -c [100x70x50x0,...] ...'
+
+    >>> import tempfile
+    >>> import nibabel as nib, numpy as np
+    >>> image = Path(tempfile.mkdtemp()) / "image.nii.gz"
+    >>> nib.save(nib.Nifti1Image(np.ones((8, 8, 8)), np.eye(4)), image)
+    >>> task = registration_syn(
+    ...     dimensionality=3,
+    ...     fixed_image=image,
+    ...     moving_image=image,
+    ...     precheck=True,
+    ... )
+    >>> task.name
+    'identity_registration'
+
+    >>> nib.save(nib.Nifti1Image(np.zeros((96, 96, 96), np.uint8), np.eye(4)), image)
+    >>> task = registration_syn(
+    ...     dimensionality=3,
+    ...     fixed_image=image,
+    ...     moving_image=image,
+    ...     time_budget=60,
+    ...     num_threads=4,
+    ... )
+    >>> task.cmdline    # doctest: +ELLIPSIS
+    'antsRegistration ... -c [500x250x125,...] -f 8x4x2 ... -c [500x250x125,...] -f 8x4x2 ... -c [50x35x25x0,...] ...'
+
+    >>> wf = registration_syn(
+    ...     dimensionality=3,
+    ...     fixed_image="template.nii.gz",
+    ...     moving_image="structural.nii.gz",
+    ...     cascade=True,
+    ... )
+    >>> wf.output_names    # doctest: +NORMALIZE_WHITESPACE
+    ['affine_transform', 'warp_field', 'inverse_warp_field', 'warped_image',
+     'inverse_warped_image', 'sampling_rates', 'elapsed_time', 'stage_elapsed_times',
+     'level_elapsed_times', 'num_iterations', 'metric_values', 'wall_time', 'user_time',
+     'system_time', 'peak_rss', 'read_bytes', 'write_bytes', 'parallelism']
     """
-    return Registration(
+    if not isinstance(preset, Preset):
+        preset = get_preset(preset or _DEFAULT_PRESETS[large, quick])
+    unknown = set(preset.parameters) - set(fields_dict(Registration.InputSpec))
+    if unknown:
+        raise ValueError(f"preset {preset.key} sets unknown inputs: {sorted(unknown)}")
+
+    params = dict(
         dimensionality=dimensionality,
         fixed_image=fixed_image,
         moving_image=moving_image,
@@ -888,45 +1430,71 @@ def registration_syn(
         upper_quantile=0.995,
         enable_rigid_stage=transform_type not in {"bo", "so"},
         rigid_transform_type="Translation" if transform_type == "t" else "Rigid",
-        rigid_metric="GC" if reproducible else "MI",
-        rigid_radius=1,
-        rigid_num_bins=32,
-        rigid_sampling_strategy="Regular",
-        rigid_sampling_rate=0.25,
-        rigid_num_iterations=(1000, 500, 250, 0 if quick else 100),
-        rigid_shrink_factors=(12, 8, 4, 2) if large else (8, 4, 2, 1),
-        rigid_smoothing_sigmas=(4, 3, 2, 1) if large else (3, 2, 1, 0),
         enable_affine_stage=transform_type in {"a", "b", "s"},
         affine_transform_type="Affine",
-        affine_metric="GC" if reproducible else "MI",
-        affine_radius=1,
-        affine_num_bins=32,
-        affine_sampling_strategy="Regular",
-        affine_sampling_rate=0.25,
-        affine_num_iterations=(1000, 500, 250, 0 if quick else 100),
-        affine_shrink_factors=(12, 8, 4, 2) if large else (8, 4, 2, 1),
-        affine_smoothing_sigmas=(4, 3, 2, 1) if large else (3, 2, 1, 0),
         enable_syn_stage=transform_type[0] in {"b", "s"},
         syn_transform_type="BSplineSyn" if transform_type[0] == "b" else "Syn",
         syn_gradient_step=gradient_step,
         syn_spline_distance=spline_distance,
-        syn_metric="CC" if reproducible else "MI",
         syn_radius=radius,
         syn_num_bins=num_bins,
-        syn_num_iterations=(
-            (100, 100, 70, 50, 0 if quick else 20)
-            if large
-            else (100, 70, 50, 0 if quick else 20)
-        ),
-        syn_shrink_factors=(10, 6, 4, 2, 1) if large else (8, 4, 2, 1),
-        syn_smoothing_sigmas=(5, 3, 2, 1, 0) if large else (3, 2, 1, 0),
         use_histogram_matching=use_histogram_matching,
         use_float_precision=use_float_precision,
         use_minc_format=use_minc_format,
         random_seed=random_seed or (1 if reproducible else NOTHING),
         verbose=verbose,
-        **kwargs,
     )
+    params.update(preset.parameters)
+    if reproducible:
+        params.update(rigid_metric="GC", affine_metric="GC", syn_metric="CC")
+
+    if precheck:
+        check = check_alignment(fixed_image, moving_image)
+        if check.identical and not use_minc_format:
+            return identity_registration(
+                fixed_image=fixed_image,
+                moving_image=moving_image,
+                output_transform_prefix=output_prefix,
+                write_warp_fields=params["enable_syn_stage"],
+                **kwargs,
+            )
+        if check.is_aligned(precheck_tolerance, precheck_threshold):
+            if params["enable_affine_stage"]:
+                params["enable_rigid_stage"] = False
+            for stage in ("rigid", "affine"):
+                _select_levels(params, stage, lambda shrink_factor: shrink_factor <= 2)
+
+    num_samples = (target_samples or time_budget) and count_samples(
+        fixed_image, fixed_mask, dimensionality
+    )
+
+    # Set before fitting the budget, so that the schedule estimated is the one run
+    if target_samples and not cascade:
+        _set_sampling_rates(params, num_samples, target_samples)
+
+    if time_budget:
+        params = _fit_time_budget(
+            params,
+            time_budget,
+            num_voxels=count_samples(fixed_image, None, dimensionality),
+            num_samples=num_samples,
+            num_threads=num_threads or os.cpu_count(),
+            cost_model=cost_model or CostModel(),
+        )
+
+    if cascade:
+        return _cascade(
+            params,
+            cascade_shrink_factor,
+            pyramid_cache_dir,
+            name=kwargs.pop("name", "registration_syn"),
+            num_samples=num_samples,
+            # Rates chosen by the budget fit are kept
+            target_samples=None if time_budget else target_samples,
+            **kwargs,
+        )
+
+    return Registration(**params, **kwargs)
 
 
 registration_syn_quick = partial(registration_syn, quick=True)
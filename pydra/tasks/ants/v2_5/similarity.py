@@ -0,0 +1,290 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import nibabel as nib
+import numpy as np
+import pydra
+from pydra.engine.specs import File
+
+from . import _image
+
+__all__ = [
+    "measure_similarity",
+    "measure_similarity_batch",
+    "measure_similarity_table",
+    "similarity_metrics",
+]
+
+_EPSILON = 1e-12
+
+
+def _mean_squares(fixed, moving, mask, **kwargs):
+    return float(np.mean((fixed[mask] - moving[mask]) ** 2))
+
+
+def _global_correlation(fixed, moving, mask, **kwargs):
+    f = fixed[mask] - fixed[mask].mean()
+    m = moving[mask] - moving[mask].mean()
+    return float(-np.dot(f, m) ** 2 / max(np.dot(f, f) * np.dot(m, m), _EPSILON))
+
+
+def _box_sum(data, radius):
+    """Sum over a box of the given radius around each voxel, truncated at borders."""
+    for axis in range(data.ndim):
+        size = data.shape[axis]
+        cumsum = np.concatenate(
+            [np.zeros_like(data.take([0], axis=axis)), np.cumsum(data, axis=axis)],
+            axis=axis,
+        )
+        index = np.arange(size)
+        data = cumsum.take(np.minimum(index + radius + 1, size), axis=axis) - (
+            cumsum.take(np.maximum(index - radius, 0), axis=axis)
+        )
+    return data
+
+
+def _neighborhood_correlation(fixed, moving, mask, radius=4, **kwargs):
+    count = _box_sum(np.ones_like(fixed), radius)
+    sum_f, sum_m = _box_sum(fixed, radius), _box_sum(moving, radius)
+    s_ff = _box_sum(fixed * fixed, radius) - sum_f**2 / count
+    s_mm = _box_sum(moving * moving, radius) - sum_m**2 / count
+    s_fm = _box_sum(fixed * moving, radius) - sum_f * sum_m / count
+    denominator = s_ff * s_mm
+    valid = mask & (denominator > _EPSILON)
+    local = np.zeros_like(fixed)
+    local[valid] = s_fm[valid] ** 2 / denominator[valid]
+    return float(-local[mask].mean())
+
+
+def _mattes_mutual_information(fixed, moving, mask, num_bins=32, **kwargs):
+    def bin_indices(values):
+        low, high = values.min(), values.max()
+        scaled = (values - low) / max(high - low, _EPSILON) * (num_bins - 1)
+        return np.rint(scaled).astype(np.int64)
+
+    joint = np.bincount(
+        bin_indices(fixed[mask]) * num_bins + bin_indices(moving[mask]),
+        minlength=num_bins**2,
+    ).reshape(num_bins, num_bins)
+    # Parzen windowing with a cubic B-spline kernel along the moving intensities
+    padded = np.pad(joint.astype(np.float64), ((0, 0), (1, 1)))
+    joint = (padded[:, :-2] + 4 * padded[:, 1:-1] + padded[:, 2:]) / 6
+    joint /= joint.sum()
+    outer = joint.sum(axis=1, keepdims=True) * joint.sum(axis=0, keepdims=True)
+    nonzero = joint > 0
+    return float(-np.sum(joint[nonzero] * np.log(joint[nonzero] / outer[nonzero])))
+
+
+similarity_metrics = {
+    "MeanSquares": _mean_squares,
+    "GC": _global_correlation,
+    "CC": _neighborhood_correlation,
+    "Mattes": _mattes_mutual_information,
+}
+"""Available metrics, following the conventions of ANTs where lower is better."""
+
+
+def measure_similarity(
+    fixed_image: PathLike,
+    moving_image: PathLike,
+    metrics: Sequence[str] = ("MeanSquares", "GC", "CC", "Mattes"),
+    mask_image: Optional[PathLike] = None,
+    shrink_factor: int = 1,
+    radius: int = 4,
+    num_bins: int = 32,
+) -> Dict[str, float]:
+    """Compute image similarity metrics between two images defined on the same grid.
+
+    Both images are loaded once and all requested metrics are computed from the same
+    arrays. Values follow the sign conventions of the ANTs metrics, so that lower is
+    better: `MeanSquares` is the mean squared difference, `GC` the negative squared
+    global correlation, `CC` the negative mean squared local correlation over boxes of
+    the given radius, and `Mattes` the negative mutual information of a joint histogram
+    with B-spline Parzen windowing.
+
+    Parameters
+    ----------
+    fixed_image : path_like
+        Fixed image.
+    moving_image : path_like
+        Moving image resampled in the fixed image space, e.g. a warped image.
+    metrics : sequence of str, default=("MeanSquares", "GC", "CC", "Mattes")
+        Metrics to compute.
+    mask_image : path_like, optional
+        Mask restricting the voxels over which the metrics are evaluated.
+    shrink_factor : int, default=1
+        Evaluate the metrics on a grid downsampled by this factor.
+    radius : int, default=4
+        Radius of the neighborhood for the `CC` metric, on the downsampled grid.
+    num_bins : int, default=32
+        Number of histogram bins for the `Mattes` metric.
+
+    Returns
+    -------
+    dict of str to float
+        Value of each metric.
+    """
+    unknown = set(metrics) - set(similarity_metrics)
+    if unknown:
+        raise ValueError(f"unknown similarity metrics: {sorted(unknown)}")
+    fixed, moving = nib.load(fixed_image), nib.load(moving_image)
+    if fixed.shape != moving.shape or not np.allclose(fixed.affine, moving.affine):
+        raise ValueError(
+            f"{fixed_image} and {moving_image} are not defined on the same grid"
+        )
+    fixed_data = _image.downsample(fixed.get_fdata(dtype=np.float64), shrink_factor)
+    moving_data = _image.downsample(moving.get_fdata(dtype=np.float64), shrink_factor)
+    if mask_image is not None:
+        mask = np.asanyarray(nib.load(mask_image).dataobj) > 0
+        if mask.shape != fixed.shape:
+            raise ValueError(
+                f"shape of {mask_image} {mask.shape} differs from {fixed.shape}"
+            )
+        mask = _image.downsample(mask.astype(np.float64), shrink_factor) >= 0.5
+    else:
+        mask = np.ones(fixed_data.shape, dtype=bool)
+    return {
+        metric: similarity_metrics[metric](
+            fixed_data, moving_data, mask, radius=radius, num_bins=num_bins
+        )
+        for metric in metrics
+    }
+
+
+def _to_table(image_pairs: Sequence, rows: Sequence[dict]) -> Dict[str, np.ndarray]:
+    table = {
+        "fixed_image": np.array([str(f) for f, _ in image_pairs], dtype=object),
+        "moving_image": np.array([str(m) for _, m in image_pairs], dtype=object),
+    }
+    for metric in rows[0]:
+        table[metric] = np.array([row[metric] for row in rows])
+    return table
+
+
+def measure_similarity_table(
+    image_pairs: Sequence[Tuple[PathLike, PathLike]],
+    max_workers: Optional[int] = None,
+    **kwargs,
+) -> Dict[str, np.ndarray]:
+    """Compute similarity metrics for many image pairs in parallel processes.
+
+    Extra arguments are passed to `measure_similarity`. Returns one column per metric,
+    along with `fixed_image` and `moving_image` columns.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> data = np.random.default_rng(0).random((8, 8, 8))
+    >>> tmp_dir = Path(tempfile.mkdtemp())
+    >>> nib.save(nib.Nifti1Image(data, np.eye(4)), tmp_dir / "fixed.nii.gz")
+    >>> nib.save(nib.Nifti1Image(2 * data, np.eye(4)), tmp_dir / "moving.nii.gz")
+    >>> table = measure_similarity_table(
+    ...     [(tmp_dir / "fixed.nii.gz", tmp_dir / "moving.nii.gz")],
+    ...     metrics=["GC", "CC"],
+    ...     max_workers=1,
+    ... )
+    >>> table["GC"].round(6), table["CC"].round(6)
+    (array([-1.]), array([-1.]))
+    """
+    image_pairs = [tuple(pair) for pair in image_pairs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        rows = list(
+            executor.map(partial(measure_similarity, **kwargs), *zip(*image_pairs))
+        )
+    return _to_table(image_pairs, rows)
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"metrics": list}})
+def _measure_similarity_chunk(
+    image_pairs: list,
+    metrics: list,
+    mask_image: Optional[File],
+    shrink_factor: int,
+    radius: int,
+    num_bins: int,
+) -> list:
+    return [
+        measure_similarity(
+            fixed_image,
+            moving_image,
+            metrics=metrics,
+            mask_image=mask_image,
+            shrink_factor=shrink_factor,
+            radius=radius,
+            num_bins=num_bins,
+        )
+        for fixed_image, moving_image in image_pairs
+    ]
+
+
+@pydra.mark.task
+@pydra.mark.annotate({"return": {"table": dict}})
+def _merge_rows(image_pairs: list, rows: list) -> dict:
+    return _to_table(image_pairs, [row for chunk in rows for row in chunk])
+
+
+def measure_similarity_batch(
+    *,
+    fixed_images: Sequence[PathLike],
+    moving_images: Sequence[PathLike],
+    batch_size: int = 20,
+    metrics: Sequence[str] = ("MeanSquares", "GC", "CC", "Mattes"),
+    mask_image: Optional[PathLike] = None,
+    shrink_factor: int = 1,
+    radius: int = 4,
+    num_bins: int = 32,
+    name: str = "measure_similarity_batch",
+) -> pydra.Workflow:
+    """Returns a workflow computing similarity metrics for batches of image pairs.
+
+    Each batch of `batch_size` pairs is processed by a separate task with
+    `measure_similarity`, and the results are merged into a single columnar `table`.
+
+    Examples
+    --------
+    >>> wf = measure_similarity_batch(
+    ...     fixed_images=["template.nii.gz"] * 100,
+    ...     moving_images=[f"sub-{i:03d}_warped.nii.gz" for i in range(100)],
+    ...     metrics=["CC", "Mattes"],
+    ...     shrink_factor=2,
+    ... )
+    >>> wf.output_names
+    ['table']
+    """
+    if len(fixed_images) != len(moving_images):
+        raise ValueError(
+            f"{len(fixed_images)} fixed images but {len(moving_images)} moving images"
+        )
+    image_pairs = [[str(f), str(m)] for f, m in zip(fixed_images, moving_images)]
+    batches = [
+        image_pairs[i : i + batch_size] for i in range(0, len(image_pairs), batch_size)
+    ]
+
+    wf = pydra.Workflow(name=name, input_spec=["batches"], batches=batches)
+
+    wf.add(
+        _measure_similarity_chunk(
+            name="measure",
+            metrics=list(metrics),
+            mask_image=mask_image,
+            shrink_factor=shrink_factor,
+            radius=radius,
+            num_bins=num_bins,
+        )
+        .split("image_pairs", image_pairs=wf.lzin.batches)
+        .combine("image_pairs")
+    )
+
+    wf.add(
+        _merge_rows(
+            name="merge", image_pairs=image_pairs, rows=wf.measure.lzout.metrics
+        )
+    )
+
+    wf.set_output([("table", wf.merge.lzout.table)])
+
+    return wf
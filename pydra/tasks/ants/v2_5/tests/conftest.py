@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _isolated_environment(monkeypatch, tmp_path):
+    # Keep runs out of the history and cache of the user, and skip the online check
+    monkeypatch.setenv("NO_ET", "1")
+    monkeypatch.setenv("PYDRA_ANTS_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("PYDRA_ANTS_HISTORY", "")
@@ -0,0 +1,40 @@
+import nibabel as nib
+import numpy as np
+import pytest
+
+from pydra.tasks.ants.v2_5 import average_images
+
+
+def test_average_keeps_header(tmp_path):
+    rng = np.random.default_rng(0)
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    arrays, paths = [], []
+    for index in range(5):
+        arrays.append(rng.normal(size=(4, 3, 2)).astype(np.float32))
+        image = nib.Nifti1Image(arrays[-1], affine)
+        image.header.set_qform(affine, code="aligned")
+        image.header.set_sform(affine, code="mni")
+        image.header.set_xyzt_units(xyz="mm")
+        image.header.set_intent("estimate")
+        paths.append(tmp_path / f"image{index}.nii.gz")
+        nib.save(image, paths[-1])
+
+    wf = average_images(images=paths, chunk_size=2, fan_in=2, compute_variance=True)
+    wf.cache_dir = tmp_path / "cache"
+    result = wf()
+
+    for output, expected in (
+        (result.output.output_image, np.mean(arrays, axis=0)),
+        (result.output.variance_image, np.var(arrays, axis=0, ddof=1)),
+    ):
+        image = nib.load(output)
+        np.testing.assert_allclose(image.get_fdata(), expected, rtol=1e-5, atol=1e-6)
+        assert image.header["qform_code"] == 2
+        assert image.header["sform_code"] == 4
+        assert image.header.get_xyzt_units()[0] == "mm"
+        assert image.header.get_intent()[0] == "estimate"
+
+
+def test_average_rejects_empty_input():
+    with pytest.raises(ValueError, match="no images"):
+        average_images(images=[])
@@ -0,0 +1,121 @@
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from pydra.tasks.ants.v2_5 import (
+    ApplyTransforms,
+    Registration,
+    apply_transforms_chunked,
+    denoise_image_tiled,
+    get_preset,
+    registration_syn,
+)
+
+STUBS = Path(__file__).parents[5] / "benchmarks" / "stubs"
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for name in ("fixed", "moving"):
+        paths.append(tmp_path / f"{name}.nii.gz")
+        nib.save(nib.Nifti1Image(np.zeros((4, 4, 4), np.float32), np.eye(4)), paths[-1])
+    return paths
+
+
+def test_registration_syn_matches_hand_built(images):
+    fixed, moving = images
+    task = registration_syn(dimensionality=3, fixed_image=fixed, moving_image=moving)
+    hand_built = Registration(
+        dimensionality=3,
+        fixed_image=str(fixed),
+        moving_image=str(moving),
+        output_transform_prefix="output",
+        warped_image="outputWarped.nii.gz",
+        inverse_warped_image="outputInverseWarped.nii.gz",
+        winsorize_image_intensities=True,
+        lower_quantile=0.005,
+        upper_quantile=0.995,
+        enable_rigid_stage=True,
+        rigid_transform_type="Rigid",
+        enable_affine_stage=True,
+        affine_transform_type="Affine",
+        enable_syn_stage=True,
+        syn_transform_type="Syn",
+        **{
+            name: list(value) if isinstance(value, tuple) else value
+            for name, value in get_preset("syn").parameters.items()
+        },
+    )
+    assert hand_built.checksum == task.checksum
+    hand_built.inputs.syn_num_bins = 16
+    assert hand_built.checksum != task.checksum
+
+
+def test_key_ignores_verbose(images):
+    fixed, moving = images
+    quiet = ApplyTransforms(fixed_image=fixed, moving_image=moving)
+    verbose = ApplyTransforms(fixed_image=fixed, moving_image=moving, verbose=True)
+    assert quiet.checksum == verbose.checksum
+    quiet = registration_syn(dimensionality=3, fixed_image=fixed, moving_image=moving)
+    verbose = registration_syn(
+        dimensionality=3, fixed_image=fixed, moving_image=moving, verbose=True
+    )
+    assert quiet.checksum == verbose.checksum
+
+
+@pytest.mark.skipif(not STUBS.exists(), reason="stub executables not available")
+def test_quiet_registration_parses_log(images, tmp_path, monkeypatch):
+    # The log is always verbose, so a quiet run can serve a verbose one from the cache
+    monkeypatch.setenv("PATH", str(STUBS), prepend=":")
+    fixed, moving = images
+    results = [
+        registration_syn(
+            dimensionality=3,
+            fixed_image=fixed,
+            moving_image=moving,
+            verbose=verbose,
+            quick=True,
+            cache_dir=tmp_path / "results",
+        )()
+        for verbose in (False, True)
+    ]
+    assert results[0].output.elapsed_time > 0
+    assert results[1].output.elapsed_time == results[0].output.elapsed_time
+    assert len(list((tmp_path / "results").glob("Registration_*"))) == 1
+
+
+@pytest.mark.skipif(not STUBS.exists(), reason="stub executables not available")
+def test_split_workflows_run(tmp_path, monkeypatch):
+    # Split tasks name the directory of each state from the key of the job running it
+    monkeypatch.setenv("PATH", str(STUBS), prepend=":")
+    rng = np.random.default_rng(0)
+    volume, series = tmp_path / "volume.nii.gz", tmp_path / "series.nii.gz"
+    volume_data = rng.random((20, 20, 20), dtype=np.float32)
+    series_data = rng.random((5, 5, 5, 7), dtype=np.float32)
+    nib.save(nib.Nifti1Image(volume_data, np.eye(4)), volume)
+    nib.save(nib.Nifti1Image(series_data, np.eye(4)), series)
+
+    for wf, expected in [
+        (
+            denoise_image_tiled(
+                dimensionality=3,
+                input_image=volume,
+                tile_shape=(10, 10, 10),
+                blend_width=2,
+            ),
+            volume_data,
+        ),
+        (
+            apply_transforms_chunked(
+                moving_image=series, fixed_image=series, chunk_size=3
+            ),
+            series_data,
+        ),
+    ]:
+        wf.cache_dir = tmp_path / "results"
+        result = wf()
+        output = nib.load(result.output.output_image).get_fdata()
+        np.testing.assert_allclose(output, expected, atol=1e-5)
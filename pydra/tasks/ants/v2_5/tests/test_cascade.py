@@ -0,0 +1,26 @@
+import pytest
+
+from pydra.tasks.ants.v2_5 import Preset, get_preset, registration_syn
+
+
+def _cascade(**kwargs):
+    return registration_syn(
+        dimensionality=3,
+        fixed_image="template.nii.gz",
+        moving_image="structural.nii.gz",
+        cascade=True,
+        **kwargs,
+    )
+
+
+def test_coarse_sigmas_follow_units():
+    wf = _cascade(rigid_smoothing_units="mm")
+    assert wf.coarse.inputs.rigid_shrink_factors == (2, 1)
+    assert wf.coarse.inputs.rigid_smoothing_sigmas == (3, 2)
+    assert wf.coarse.inputs.affine_smoothing_sigmas == (0.75, 0.5)
+
+
+def test_coarse_factors_must_be_multiples():
+    parameters = dict(get_preset("syn").parameters, rigid_shrink_factors=(12, 6, 4, 2))
+    with pytest.raises(ValueError, match="not all multiples"):
+        _cascade(preset=Preset("uneven", parameters))
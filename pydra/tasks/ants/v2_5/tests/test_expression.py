@@ -0,0 +1,111 @@
+import nibabel as nib
+import numpy as np
+import pytest
+
+from pydra.tasks.ants.v2_5.expression import average_images, image
+
+
+@pytest.fixture
+def images(tmp_path):
+    rng = np.random.default_rng(0)
+    shape = (7, 6, 5)
+    affine = np.diag([2.0, 2.0, 3.0, 1.0])
+    t1 = rng.uniform(0, 1000, shape).astype(np.float32)
+    mask = (rng.random(shape) > 0.5).astype(np.uint8)
+    counts = rng.integers(-100, 100, shape).astype(np.int16)
+    paths = {
+        "t1": tmp_path / "t1.nii.gz",
+        "mask": tmp_path / "mask.nii",
+        "counts": tmp_path / "counts.nii.gz",
+    }
+    nib.save(nib.Nifti1Image(t1, affine), paths["t1"])
+    nib.save(nib.Nifti1Image(mask, affine), paths["mask"])
+    scaled = nib.Nifti1Image(counts, affine)
+    scaled.header.set_slope_inter(0.5, 10.0)
+    nib.save(scaled, paths["counts"])
+    arrays = {
+        "t1": t1.astype(np.float64),
+        "mask": mask.astype(np.float64),
+        "counts": counts * 0.5 + 10.0,
+    }
+    return paths, arrays
+
+
+def _evaluate(expr, tmp_path, name="output.nii.gz", **kwargs):
+    output = nib.load(expr.evaluate(tmp_path / name, **kwargs))
+    return output, np.asanyarray(output.dataobj)
+
+
+@pytest.mark.parametrize("max_voxels", [2**24, 42, 1])
+def test_fused_matches_numpy(images, tmp_path, max_voxels):
+    paths, arrays = images
+    expr = (image(paths["t1"]).threshold(100, 800) * image(paths["mask"]) + 2) / (
+        abs(image(paths["counts"])) + 1
+    )
+    expected = (
+        np.where((arrays["t1"] >= 100) & (arrays["t1"] <= 800), 1, 0) * arrays["mask"]
+        + 2
+    ) / (np.abs(arrays["counts"]) + 1)
+
+    output, data = _evaluate(expr, tmp_path, max_voxels=max_voxels)
+
+    assert data.dtype == np.float32
+    np.testing.assert_allclose(data, expected, rtol=1e-6)
+    np.testing.assert_array_equal(output.affine, nib.load(paths["t1"]).affine)
+
+
+def test_mixed_dtypes_and_output_dtype(images, tmp_path):
+    paths, arrays = images
+    expr = average_images([paths["counts"], paths["mask"]]).image_math(
+        "ReplaceVoxelValue", -100, 0, 0
+    )
+    mean = (arrays["counts"] + arrays["mask"]) / 2
+    expected = np.where((mean >= -100) & (mean <= 0), 0, mean)
+
+    _, data = _evaluate(
+        expr, tmp_path, name="output.nii", dtype="float64", max_voxels=50
+    )
+
+    assert data.dtype == np.float64
+    np.testing.assert_allclose(data, expected)
+
+    _, data = _evaluate(
+        image(paths["mask"]) * 3, tmp_path, name="mask3.nii", dtype="int16"
+    )
+    assert data.dtype == np.int16
+    np.testing.assert_array_equal(data, arrays["mask"] * 3)
+
+
+def test_division_by_zero_is_zero(images, tmp_path):
+    paths, arrays = images
+    expr = image(paths["t1"]).image_math("/", image(paths["mask"]))
+    expected = np.divide(
+        arrays["t1"],
+        arrays["mask"],
+        out=np.zeros_like(arrays["t1"]),
+        where=arrays["mask"] != 0,
+    )
+
+    _, data = _evaluate(expr, tmp_path, max_voxels=30)
+
+    np.testing.assert_allclose(data, expected, rtol=1e-6)
+
+
+def test_time_series_slabs(tmp_path):
+    series = np.random.default_rng(1).normal(size=(4, 3, 2, 6)).astype(np.float32)
+    path = tmp_path / "bold.nii.gz"
+    nib.save(nib.Nifti1Image(series, np.eye(4)), path)
+
+    output, data = _evaluate(image(path) ** 2 - image(path), tmp_path, max_voxels=50)
+
+    assert output.shape == series.shape
+    np.testing.assert_allclose(data, series.astype(np.float64) ** 2 - series, rtol=1e-6)
+
+
+def test_shape_mismatch(images, tmp_path):
+    paths, _ = images
+    other = tmp_path / "other.nii"
+    nib.save(nib.Nifti1Image(np.zeros((2, 2, 2), np.float32), np.eye(4)), other)
+
+    with pytest.raises(ValueError, match="differs"):
+        (image(paths["t1"]) + image(other)).evaluate(tmp_path / "output.nii")
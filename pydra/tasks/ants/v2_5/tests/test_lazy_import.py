@@ -0,0 +1,32 @@
+import subprocess
+import sys
+from importlib import import_module
+from types import ModuleType
+
+import pydra.tasks.ants.v2_5 as ants
+
+_SCRIPT = """
+import sys, time
+import pydra.engine
+start = time.perf_counter()
+import pydra.tasks.ants.v2_5
+print(time.perf_counter() - start)
+print(sorted(name for name in sys.modules if name.startswith("pydra.tasks.ants.v2_5.")))
+"""
+
+
+def test_import_loads_no_task_module():
+    elapsed, loaded = subprocess.run(
+        [sys.executable, "-c", _SCRIPT], capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    assert loaded == "[]"
+    # Generous bound, the import takes a few milliseconds once pydra is loaded
+    assert float(elapsed) < 0.5
+
+
+def test_exports_are_not_shadowed_by_modules():
+    for module in set(ants._MODULES.values()):
+        import_module(f"{ants.__name__}.{module}")
+    for name in ants.__all__:
+        if name != "expression":
+            assert not isinstance(getattr(ants, name), ModuleType), name
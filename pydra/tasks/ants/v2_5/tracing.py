@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from os import PathLike
+from pathlib import Path
+from typing import List
+
+from . import _hooks, _resources
+
+__all__ = ["ChromeTrace"]
+
+
+def _span(name: str, start: float, end: float, **args) -> dict:
+    """Complete event of the Chrome trace format, with times in seconds."""
+    return {
+        "name": name,
+        "cat": "pydra-ants",
+        "ph": "X",
+        "ts": round(start * 1e6),
+        "dur": round(max(end - start, 0.0) * 1e6),
+        "pid": os.getpid(),
+        "tid": threading.get_native_id(),
+        "args": args,
+    }
+
+
+class ChromeTrace:
+    """Timeline of task runs in the Chrome trace format, viewable in Perfetto.
+
+    Every instrumented task records spans for looking up its cached result, preparing
+    its run, e.g. rendering the command line, running the process, collecting its
+    outputs and writing its result to the cache. Hashing the inputs is left out, since
+    pydra does it before any hook is called. Process spans of `Registration` are subdivided into stages and levels from its
+    verbose log, laid out back to back from the start of the process.
+
+    Spans are appended to a side file as tasks finish, in whichever process runs them,
+    and gathered into the trace file by `write`. Tasks whose result is found in the
+    cache call no hook past the lookup and are left out.
+
+    Examples
+    --------
+    >>> from pydra.tasks.ants.v2_5 import registration_syn
+    >>> trace = ChromeTrace("trace.json")
+    >>> wf = trace.instrument(
+    ...     registration_syn(
+    ...         dimensionality=3,
+    ...         fixed_image="template.nii.gz",
+    ...         moving_image="structural.nii.gz",
+    ...         cascade=True,
+    ...     )
+    ... )
+    >>> wf.coarse.hooks.pre_run == trace.pre_run
+    True
+    """
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path).absolute()
+        self._marks = {}
+
+    @property
+    def events_file(self) -> Path:
+        """File collecting spans as JSON lines until `write` is called."""
+        return self.path.with_name(self.path.name + ".events")
+
+    def instrument(self, task):
+        """Add hooks to a task, and to all nodes if it is a workflow."""
+        return _hooks.add_hooks(task, self)
+
+    def pre_run(self, task):
+        self._marks[id(task)] = {"start": time.time()}
+
+    def pre_run_task(self, task):
+        self._marks[id(task)]["looked_up"] = time.time()
+
+    def post_run_task(self, task, result):
+        self._marks[id(task)]["ran"] = time.time()
+        if result.errored:
+            self._flush(task, result, time.time())
+
+    def post_run(self, task, result):
+        self._flush(task, result, time.time())
+
+    def _spans(self, task, result, marks: dict, end: float) -> List[dict]:
+        spans = [
+            _span(task.name, marks["start"], end, checksum=task.checksum),
+            _span("cache lookup", marks["start"], marks["looked_up"]),
+        ]
+        usage = _resources.load_usage(task.output_dir)
+        if usage is None:
+            spans.append(_span("run", marks["looked_up"], marks["ran"]))
+        else:
+            process_end = usage.start_time + usage.wall_time
+            spans += [
+                _span("render command line", marks["looked_up"], usage.start_time),
+                _span(
+                    "process",
+                    usage.start_time,
+                    process_end,
+                    user_time=usage.user_time,
+                    system_time=usage.system_time,
+                    peak_rss=usage.peak_rss,
+                    read_bytes=usage.read_bytes,
+                    write_bytes=usage.write_bytes,
+                ),
+                _span("collect outputs", process_end, marks["ran"]),
+            ]
+            spans += self._stage_spans(result, usage.start_time)
+        spans.append(_span("cache write", marks["ran"], end))
+        return spans
+
+    @staticmethod
+    def _stage_spans(result, start: float) -> List[dict]:
+        output = result.output
+        if not hasattr(output, "stage_elapsed_times"):
+            return []
+        spans = []
+        for index, (stage_time, level_times, num_iterations) in enumerate(
+            zip(
+                output.stage_elapsed_times,
+                output.level_elapsed_times,
+                output.num_iterations,
+            )
+        ):
+            spans.append(_span(f"stage {index}", start, start + stage_time))
+            level_start = start
+            for level, (level_time, iterations) in enumerate(
+                zip(level_times, num_iterations)
+            ):
+                spans.append(
+                    _span(
+                        f"level {level}",
+                        level_start,
+                        level_start + level_time,
+                        num_iterations=iterations,
+                    )
+                )
+                level_start += level_time
+            start += stage_time
+        return spans
+
+    def _flush(self, task, result, end: float):
+        marks = self._marks.pop(id(task), None)
+        if marks is None:
+            return
+        lines = "".join(
+            json.dumps(span) + "\n" for span in self._spans(task, result, marks, end)
+        )
+        # A single append per task keeps lines whole across concurrent processes
+        with open(self.events_file, "a") as fobj:
+            fobj.write(lines)
+
+    def write(self) -> Path:
+        """Write the recorded spans to the trace file and return its path."""
+        events = []
+        if self.events_file.exists():
+            with open(self.events_file) as fobj:
+                events = [json.loads(line) for line in fobj]
+        with open(self.path, "w") as fobj:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fobj)
+        self.events_file.unlink(missing_ok=True)
+        return self.path
@@ -0,0 +1,281 @@
+import itertools
+import random
+import shlex
+from os import PathLike
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pydra
+from attrs import asdict, evolve
+from pydra.engine.specs import File
+
+from . import _resources
+from .presets import Preset, get_preset, save_presets
+from .registration import registration_syn
+from .similarity import measure_similarity
+
+__all__ = ["autotune", "candidate_presets", "recommend_preset"]
+
+_STAGES = ("rigid", "affine", "syn")
+
+
+def candidate_presets(
+    base: str = "syn",
+    finest_shrink_factors: Sequence[int] = (1, 2),
+    iteration_scales: Sequence[float] = (1.0, 0.5),
+    sampling_rates: Sequence[float] = (0.25, 0.1),
+    use_float_precision: Sequence[bool] = (False, True),
+    syn_radii: Sequence[int] = (4, 2),
+    syn_num_bins: Sequence[int] = (32, 16),
+) -> List[Preset]:
+    """Derive candidate schedules from a base preset.
+
+    Candidates are all combinations of stopping every stage at a finest shrink factor,
+    scaling all iterations, the sampling rate of the linear stages, the use of float
+    precision and the parameter of the SyN metric, its radius for neighbourhood metrics
+    such as CC or its number of bins for histogram metrics such as MI. Combinations
+    yielding the same parameters are only kept once.
+
+    >>> candidates = candidate_presets(sampling_rates=[0.25], syn_num_bins=[32])
+    >>> [candidate.name for candidate in candidates][:2]
+    ['syn-f1-i1-s0.25-double-b32', 'syn-f1-i1-s0.25-float-b32']
+    >>> candidates[-1].parameters["syn_num_iterations"]
+    (50, 35, 25)
+    >>> len(candidate_presets()), len(candidate_presets(syn_num_bins=[32, 32]))
+    (32, 16)
+    """
+    base = get_preset(base)
+    if base.parameters.get("syn_metric", "MI") in {"MI", "Mattes"}:
+        syn_parameter, syn_values, syn_tag = "syn_num_bins", syn_num_bins, "b"
+    else:
+        syn_parameter, syn_values, syn_tag = "syn_radius", syn_radii, "r"
+    candidates = []
+    seen = set()
+    for finest, scale, rate, use_float, syn_value in itertools.product(
+        finest_shrink_factors,
+        iteration_scales,
+        sampling_rates,
+        use_float_precision,
+        syn_values,
+    ):
+        parameters = dict(base.parameters)
+        for stage in _STAGES:
+            if f"{stage}_num_iterations" not in parameters:
+                continue
+            levels = [
+                (max(int(round(iterations * scale)), 0), shrink_factor, sigma)
+                for iterations, shrink_factor, sigma in zip(
+                    parameters[f"{stage}_num_iterations"],
+                    parameters[f"{stage}_shrink_factors"],
+                    parameters[f"{stage}_smoothing_sigmas"],
+                )
+                if shrink_factor >= finest
+            ]
+            (
+                parameters[f"{stage}_num_iterations"],
+                parameters[f"{stage}_shrink_factors"],
+                parameters[f"{stage}_smoothing_sigmas"],
+            ) = zip(*levels)
+        for stage in ("rigid", "affine"):
+            parameters[f"{stage}_sampling_rate"] = rate
+        parameters.update({"use_float_precision": use_float, syn_parameter: syn_value})
+        identity = repr(sorted(parameters.items()))
+        if identity in seen:
+            continue
+        seen.add(identity)
+        candidates.append(
+            Preset(
+                name=(
+                    f"{base.name}-f{finest}-i{scale:g}-s{rate:g}-"
+                    f"{'float' if use_float else 'double'}-{syn_tag}{syn_value}"
+                ),
+                parameters=parameters,
+                description=f"autotuning candidate derived from {base.key}",
+            )
+        )
+    return candidates
+
+
+@pydra.mark.task
+@pydra.mark.annotate(
+    {"return": {"runtime": float, "peak_memory": float, "quality": float}}
+)
+def _run_candidate(
+    job: list, dimensionality: int, metric: str
+) -> Tuple[float, float, float]:
+    candidate, fixed_image, moving_image = job
+    task = registration_syn(
+        dimensionality=dimensionality,
+        fixed_image=fixed_image,
+        moving_image=moving_image,
+        preset=Preset(**candidate),
+    )
+    returncode, _, stderr, usage = _resources.run_measured(
+        shlex.split(task.cmdline), cwd=Path.cwd()
+    )
+    if returncode:
+        raise RuntimeError(f"registration failed with {candidate['name']}: {stderr}")
+    similarity = measure_similarity(
+        fixed_image, Path.cwd() / task.inputs.warped_image, metrics=[metric]
+    )
+    return usage.wall_time, usage.peak_rss, -similarity[metric]
+
+
+def recommend_preset(candidates: Sequence[Preset], tolerance: float = 0.02) -> Preset:
+    """Pick the fastest candidate within a quality tolerance of the slowest one.
+
+    The quality of the most expensive candidate serves as reference, and candidates whose
+    quality is within `tolerance` of it, relative to its magnitude, are eligible.
+    Candidates must carry `runtime` and `quality` benchmarks.
+
+    >>> candidates = [
+    ...     Preset("full", {}, runtime=3600, quality=0.90),
+    ...     Preset("half", {}, runtime=1500, quality=0.89),
+    ...     Preset("quick", {}, runtime=600, quality=0.80),
+    ... ]
+    >>> recommend_preset(candidates).name
+    'half'
+    """
+    reference = max(candidates, key=lambda candidate: candidate.runtime)
+    threshold = reference.quality - tolerance * abs(reference.quality)
+    eligible = [c for c in candidates if c.quality >= threshold]
+    return min(eligible, key=lambda candidate: candidate.runtime)
+
+
+@pydra.mark.task
+@pydra.mark.annotate(
+    {"return": {"recommended": str, "presets_file": File, "table": dict}}
+)
+def _recommend(
+    candidates: list,
+    subjects: list,
+    runtime: list,
+    peak_memory: list,
+    quality: list,
+    metric: str,
+    tolerance: float,
+):
+    shape = (len(candidates), len(subjects))
+    runtime = np.reshape(runtime, shape)
+    peak_memory = np.reshape(peak_memory, shape)
+    quality = np.reshape(quality, shape)
+    benchmarked = [
+        evolve(
+            Preset(**candidate),
+            runtime=float(runtime[index].mean()),
+            peak_memory=float(peak_memory[index].max()),
+            quality=float(quality[index].mean()),
+            reference=f"autotuning on {len(subjects)} subjects, quality is -{metric}",
+        )
+        for index, candidate in enumerate(candidates)
+    ]
+    recommended = recommend_preset(benchmarked, tolerance)
+    presets_file = Path.cwd() / "presets.json"
+    save_presets(benchmarked, presets_file)
+    table: Dict[str, np.ndarray] = {
+        "candidate": np.repeat([c["name"] for c in candidates], len(subjects)),
+        "moving_image": np.tile([m for _, m in subjects], len(candidates)),
+        "runtime": runtime.ravel(),
+        "peak_memory": peak_memory.ravel(),
+        "quality": quality.ravel(),
+    }
+    return recommended.key, presets_file, table
+
+
+def autotune(
+    *,
+    fixed_images: Sequence[PathLike],
+    moving_images: Sequence[PathLike],
+    candidates: Optional[Sequence[Preset]] = None,
+    sample_size: int = 5,
+    seed: int = 0,
+    tolerance: float = 0.02,
+    metric: str = "CC",
+    dimensionality: int = 3,
+    name: str = "autotune",
+) -> pydra.Workflow:
+    """Returns a workflow recommending a registration schedule for a cohort.
+
+    Every candidate schedule registers a random sample of `sample_size` subjects of the
+    cohort, each run in a separate task, measuring its wall time and peak memory. The
+    quality of a run is the negated `metric` between the fixed and warped images. The
+    recommended schedule is the fastest one whose mean quality is within `tolerance` of
+    that of the slowest schedule, see `recommend_preset`.
+
+    Parameters
+    ----------
+    fixed_images : sequence of path_like
+        Fixed image of each subject of the cohort, e.g. the same template repeated.
+    moving_images : sequence of path_like
+        Moving image of each subject of the cohort.
+    candidates : sequence of Preset, optional
+        Schedules to compare, by default those of `candidate_presets`.
+    sample_size : int, default=5
+        Number of subjects registered with every candidate.
+    seed : int, default=0
+        Seed of the random sampling of subjects.
+    tolerance : float, default=0.02
+        Relative loss of quality accepted with respect to the slowest candidate.
+    metric : {"CC", "Mattes", "GC", "MeanSquares"}, default="CC"
+        Similarity metric measuring the quality of a registration.
+    dimensionality : int, default=3
+        Image dimensionality.
+    name : str, default="autotune"
+        Name of the returned workflow.
+
+    Returns
+    -------
+    Workflow
+        A workflow with outputs `recommended`, the key of the recommended candidate,
+        `presets_file`, a JSON file of all candidates with their benchmarks to pass to
+        `load_presets`, and `table`, the measurements of every run.
+
+    Examples
+    --------
+    >>> wf = autotune(
+    ...     fixed_images=["template.nii.gz"] * 300,
+    ...     moving_images=[f"sub-{i:03d}_T1w.nii.gz" for i in range(300)],
+    ...     candidates=candidate_presets(use_float_precision=[True]),
+    ... )
+    >>> wf.output_names
+    ['recommended', 'presets_file', 'table']
+    """
+    subjects = [[str(f), str(m)] for f, m in zip(fixed_images, moving_images)]
+    subjects = random.Random(seed).sample(subjects, min(sample_size, len(subjects)))
+    candidates = [
+        asdict(candidate) for candidate in (candidates or candidate_presets())
+    ]
+
+    # Runs are ordered by candidate, then by subject
+    jobs = [[candidate] + subject for candidate in candidates for subject in subjects]
+
+    wf = pydra.Workflow(name=name, input_spec=["jobs"], jobs=jobs)
+
+    wf.add(
+        _run_candidate(name="run", dimensionality=dimensionality, metric=metric)
+        .split("job", job=wf.lzin.jobs)
+        .combine("job")
+    )
+
+    wf.add(
+        _recommend(
+            name="recommend",
+            candidates=candidates,
+            subjects=subjects,
+            runtime=wf.run.lzout.runtime,
+            peak_memory=wf.run.lzout.peak_memory,
+            quality=wf.run.lzout.quality,
+            metric=metric,
+            tolerance=tolerance,
+        )
+    )
+    wf.set_output(
+        [
+            ("recommended", wf.recommend.lzout.recommended),
+            ("presets_file", wf.recommend.lzout.presets_file),
+            ("table", wf.recommend.lzout.table),
+        ]
+    )
+
+    return wf